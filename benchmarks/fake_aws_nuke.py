@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Emulates the aws-nuke commands that the executor uses (--version, resource-types, run) with synthetic output
+in the format of aws-nuke v3. The size of the output is set with environment variables:
+
+FAKE_NUKE_RESOURCES       resources per region (default 1000)
+FAKE_NUKE_RESOURCE_TYPES  number of resource types when the config doesn't include resource types (default 20)
+FAKE_NUKE_FILTERED_RATIO  part of the resources that is filtered (default 0.2)
+FAKE_NUKE_FAILED_RATIO    part of the removals that fails in an execution (default 0.0)
+FAKE_NUKE_REGION_SECONDS  seconds that the scan of every region takes, f.e. to test deadlines (default 0)
+"""
+import os
+import sys
+import time
+
+import yaml
+
+VERSION = 'v3.99.0'
+
+RESOURCE_TYPES = [
+    'EC2Instance', 'EC2Volume', 'EC2Snapshot', 'EC2NetworkInterface', 'EC2SecurityGroup', 'EC2Subnet', 'EC2VPC',
+    'S3Bucket', 'S3Object', 'IAMRole', 'IAMRolePolicyAttachment', 'IAMPolicy', 'LambdaFunction', 'SQSQueue',
+    'SNSTopic', 'DynamoDBTable', 'CloudWatchLogsLogGroup', 'ECRRepository', 'RDSInstance', 'KMSKey',
+    'CloudFormationStack', 'ECSCluster', 'EKSCluster', 'ELBv2', 'ELBv2TargetGroup', 'AutoScalingGroup',
+    'EC2LaunchTemplate', 'SecretsManagerSecret', 'SSMParameter', 'StepFunctionsStateMachine',
+]
+
+# Lines are written in blocks, one write per line would make the emulator slower than the executor
+WRITE_BLOCK_LINES = 10000
+
+
+def every(ratio: float, i: int) -> bool:
+    """
+    Spread a ratio deterministically over the resources.
+    """
+    return ratio > 0 and int((i + 1) * ratio) != int(i * ratio)
+
+
+def resource_line(region: str, resource_type: str, i: int, state: str) -> str:
+    return (
+        f'{region} - {resource_type} - {resource_type.lower()}-{i:010d} - '
+        f'[Name: "{resource_type}-{i}", tag:Environment: "bench", tag:Owner: "team-{i % 17}"] - {state}\n'
+    )
+
+
+def run(config_path: str, dry_run: bool) -> int:
+
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+
+    resources = int(os.environ.get('FAKE_NUKE_RESOURCES', 1000))
+    filtered_ratio = float(os.environ.get('FAKE_NUKE_FILTERED_RATIO', 0.2))
+    failed_ratio = float(os.environ.get('FAKE_NUKE_FAILED_RATIO', 0.0))
+    region_seconds = float(os.environ.get('FAKE_NUKE_REGION_SECONDS', 0))
+    regions = config.get('regions') or ['us-east-1']
+    resource_types = (config.get('resource-types') or {}).get('includes') or \
+        RESOURCE_TYPES[:int(os.environ.get('FAKE_NUKE_RESOURCE_TYPES', 20))]
+
+    block = []
+
+    def flush():
+        sys.stdout.write(''.join(block))
+        sys.stdout.flush()
+        block.clear()
+
+    def emit(line: str):
+        block.append(line)
+        if len(block) >= WRITE_BLOCK_LINES:
+            flush()
+
+    emit(f'time="2026-01-01T00:00:00Z" level=info msg="aws-nuke {VERSION}, {len(regions)} regions, {len(resource_types)} resource types"\n')
+
+    def nukeable():
+        for region in regions:
+            for i in range(resources):
+                if not every(filtered_ratio, i):
+                    yield region, resource_types[i % len(resource_types)], i
+
+    total = len(regions) * resources
+    count = 0
+    for region in regions:
+        for i in range(resources):
+            resource_type = resource_types[i % len(resource_types)]
+            if every(filtered_ratio, i):
+                emit(resource_line(region, resource_type, i, 'filtered: tag:Environment'))
+            else:
+                emit(resource_line(region, resource_type, i, 'would remove'))
+                count += 1
+        if region_seconds:
+            flush()
+            time.sleep(region_seconds)
+
+    emit(f'Scan complete: {total} total, {count} nukeable, {total - count} filtered.\n')
+
+    failed = 0
+    if not dry_run:
+        for region, resource_type, i in nukeable():
+            emit(resource_line(region, resource_type, i, 'triggered remove'))
+        for n, (region, resource_type, i) in enumerate(nukeable()):
+            if every(failed_ratio, n):
+                failed += 1
+                emit(resource_line(region, resource_type, i, 'failed: DependencyViolation'))
+            else:
+                emit(resource_line(region, resource_type, i, 'removed'))
+        emit(f'Nuke complete: {failed} failed, 0 skipped, {count - failed} finished.\n')
+
+    flush()
+    return 1 if failed else 0
+
+
+def main() -> int:
+
+    if '--version' in sys.argv:
+        print(f"aws-nuke version {VERSION}")
+        return 0
+
+    if 'resource-types' in sys.argv:
+        print('\n'.join(RESOURCE_TYPES))
+        return 0
+
+    config_path = sys.argv[sys.argv.index('--config') + 1]
+    return run(config_path, '--no-dry-run' not in sys.argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Benchmark of the nuke executor: runs lambda_handler end to end with the aws-nuke emulator (fake_aws_nuke.py)
+against an in-memory S3 (moto), for a growing number of output lines. Every size runs in its own process,
+so the peak RSS of one size doesn't include the previous sizes. The in-memory S3 keeps the uploads in the same
+process, with --endpoint-url (f.e. moto_server or MinIO) the peak RSS is only the executor.
+
+Results are appended to results.jsonl and compared with the previous result of the same parameters.
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'lambda')
+FAKE_NUKE = os.path.join(BENCHMARK_DIR, 'fake_aws_nuke.py')
+RESULTS_PATH = os.path.join(BENCHMARK_DIR, 'results.jsonl')
+
+DEFAULT_LINES = [10_000, 100_000, 1_000_000]
+BUCKET = 'aws-nuke-benchmark'
+ACCOUNT_ID = '123456789012'
+REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-central-1',
+    'eu-north-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2', 'ap-southeast-1', 'ap-southeast-2',
+    'ca-central-1', 'sa-east-1',
+]
+
+# A result is reported as a regression when it is this much worse than the previous result
+REGRESSION_RATIO = 1.2
+
+
+def resources_per_region(lines: int, regions: int, dry_run: bool, filtered_ratio: float) -> int:
+    """
+    Resources per region for about the requested number of output lines. In an execution every resource
+    that is not filtered has 3 lines: would remove, triggered remove and removed (or failed).
+    """
+    lines_per_resource = 1 if dry_run else 1 + 2 * (1 - filtered_ratio)
+    return max(1, math.ceil(lines / regions / lines_per_resource))
+
+
+def body_size(request) -> int:
+
+    # Bodies with a checksum trailer are sent in aws-chunked encoding, the header has the size of the data
+    for header in ('X-Amz-Decoded-Content-Length', 'Content-Length'):
+        if request.headers.get(header):
+            return int(request.headers[header])
+
+    body = request.body
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+
+    position = body.tell()
+    size = body.seek(0, os.SEEK_END) - position
+    body.seek(position)
+    return size
+
+
+def run_case(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run lambda_handler once in this process and measure it. Only called in the child process.
+    """
+    import boto3
+    from moto import mock_aws
+
+    uploaded = {'Bytes': 0, 'Requests': 0}
+
+    def count_upload(request, **kwargs):
+        if request.method in ('PUT', 'POST'):
+            uploaded['Bytes'] += body_size(request)
+            uploaded['Requests'] += 1
+
+    with contextlib.nullcontext() if args.endpoint_url else mock_aws():
+        # moto replaces the default session, the handler is copied to the clients that the executor creates
+        boto3.setup_default_session(region_name='us-east-1')
+        boto3.DEFAULT_SESSION.events.register('before-send.s3', count_upload)
+        sys.path.insert(0, LAMBDA_DIR)
+        import nuke_executor
+
+        s3 = boto3.client('s3')
+        try:
+            s3.create_bucket(Bucket=BUCKET)
+        except s3.exceptions.BucketAlreadyOwnedByYou:
+            pass
+        config = {
+            'regions': REGIONS[:args.regions],
+            'accounts': {ACCOUNT_ID: {}},
+            'resource-types': {'includes': json.loads(os.environ['BENCHMARK_RESOURCE_TYPES'])},
+        }
+        s3.put_object(Bucket=BUCKET, Key='nuke-configs/benchmark.yaml', Body=json.dumps(config))
+
+        event = {
+            'ConfigS3Uri': f"s3://{BUCKET}/nuke-configs/benchmark.yaml",
+            'AccountId': ACCOUNT_ID,
+            'DryRun': not args.execution,
+            'ShardByRegion': args.workers > 1,
+            'ShardConcurrency': args.workers,
+            'RetryAttempts': 0,
+        }
+
+        uploaded.update(Bytes=0, Requests=0)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_time = time.monotonic()
+        response = nuke_executor.lambda_handler(event, None)
+        wall_seconds = time.monotonic() - start_time
+
+    counters = response['Metrics']['Counters']
+    return {
+        'Success': response['Success'],
+        'WallSeconds': round(wall_seconds, 2),
+        'PhaseSeconds': response['Metrics']['PhaseSeconds'],
+        # ru_maxrss is in KiB on Linux
+        'PeakRssMB': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'StartRssMB': round(rss_before / 1024, 1),
+        'UploadedBytes': uploaded['Bytes'],
+        'UploadRequests': uploaded['Requests'],
+        'OutputLines': counters.get('OutputLines', 0),
+        'OutputBytes': counters.get('OutputBytes', 0),
+    }
+
+
+def run_child(args: argparse.Namespace, lines: int) -> Dict[str, Any]:
+    """
+    Run one size in a new process with the emulator as aws-nuke.
+    """
+    from fake_aws_nuke import RESOURCE_TYPES
+
+    with tempfile.TemporaryDirectory(prefix='nuke-benchmark-') as work_dir, \
+            tempfile.NamedTemporaryFile(suffix='.json') as result_file:
+        env = dict(
+            os.environ,
+            NUKE_BINARY_PATH=FAKE_NUKE,
+            NUKE_WORK_DIR=work_dir,
+            FAKE_NUKE_RESOURCES=str(resources_per_region(lines, args.regions, not args.execution, args.filtered_ratio)),
+            FAKE_NUKE_FILTERED_RATIO=str(args.filtered_ratio),
+            FAKE_NUKE_FAILED_RATIO=str(args.failed_ratio),
+            BENCHMARK_RESOURCE_TYPES=json.dumps(RESOURCE_TYPES[:args.resource_types]),
+            AWS_DEFAULT_REGION='us-east-1',
+            AWS_ACCESS_KEY_ID='benchmark',
+            AWS_SECRET_ACCESS_KEY='benchmark',
+        )
+        if args.endpoint_url:
+            env['AWS_ENDPOINT_URL'] = args.endpoint_url
+        # The executor logs every line it prints, only the result is interesting here
+        subprocess.run(
+            [sys.executable, __file__, '--child', '--result-file', result_file.name] + child_arguments(args),
+            env=env, check=True, stdout=subprocess.DEVNULL
+        )
+        return json.load(open(result_file.name))
+
+
+def child_arguments(args: argparse.Namespace) -> List[str]:
+
+    arguments = [
+        '--regions', str(args.regions), '--resource-types', str(args.resource_types), '--workers', str(args.workers),
+        '--filtered-ratio', str(args.filtered_ratio), '--failed-ratio', str(args.failed_ratio),
+    ]
+    if args.execution:
+        arguments.append('--execution')
+    if args.endpoint_url:
+        arguments.extend(['--endpoint-url', args.endpoint_url])
+
+    return arguments
+
+
+def git_commit() -> Optional[str]:
+
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(result: Dict[str, Any]) -> tuple:
+    return tuple(sorted(result['Parameters'].items()))
+
+
+def previous_results(path: str) -> Dict[tuple, Dict[str, Any]]:
+    """
+    The last stored result per combination of parameters.
+    """
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    previous[case_key(result)] = result
+
+    return previous
+
+
+def compare(result: Dict[str, Any], previous: Optional[Dict[str, Any]],
+            names: tuple = ('WallSeconds', 'PeakRssMB', 'UploadedBytes')) -> str:
+
+    if previous is None:
+        return 'new'
+
+    regressions = [
+        f"{name} {previous[name]} -> {result[name]}"
+        for name in names
+        if previous.get(name) and result[name] > previous[name] * REGRESSION_RATIO
+    ]
+    if regressions:
+        return f"REGRESSION since {previous.get('Commit')}: {', '.join(regressions)}"
+
+    return f"ok (was {', '.join(f'{name} {previous.get(name)}' for name in names[:2])} at {previous.get('Commit')})"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description='Benchmark the nuke executor with synthetic aws-nuke output')
+    parser.add_argument('--lines', type=int, nargs='+', default=DEFAULT_LINES, help='output lines per case, f.e. 10000 10000000')
+    parser.add_argument('--regions', type=int, default=4, help=f"regions (N), at most {len(REGIONS)}")
+    parser.add_argument('--resource-types', type=int, default=20, help='resource types (M)')
+    parser.add_argument('--workers', type=int, default=1, help='aws-nuke processes in parallel, more than 1 shards by region')
+    parser.add_argument('--filtered-ratio', type=float, default=0.2, help='part of the resources that is filtered')
+    parser.add_argument('--failed-ratio', type=float, default=0.0, help='part of the removals that fails (execution only)')
+    parser.add_argument('--execution', action='store_true', help='benchmark an execution instead of a dry-run')
+    parser.add_argument('--endpoint-url', help='local S3 stand-in to use instead of the in-memory S3, f.e. http://localhost:5000')
+    parser.add_argument('--results', default=RESULTS_PATH, help='JSON Lines file with the results of previous benchmarks')
+    parser.add_argument('--no-store', action='store_true', help="don't append the results")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.regions = min(args.regions, len(REGIONS))
+
+    if args.child:
+        with open(args.result_file, 'w') as f:
+            json.dump(run_case(args), f)
+        return 0
+
+    previous = previous_results(args.results)
+    commit = git_commit()
+    failed = False
+
+    print(f"{'lines':>10} {'wall s':>8} {'peak MB':>8} {'uploaded MB':>12} {'requests':>9}  compared with previous")
+    for lines in args.lines:
+        result = run_child(args, lines)
+        result.update({
+            'Commit': commit,
+            'Timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'Python': sys.version.split()[0],
+            'Parameters': {
+                'Lines': lines,
+                'Regions': args.regions,
+                'ResourceTypes': args.resource_types,
+                'Workers': args.workers,
+                'FilteredRatio': args.filtered_ratio,
+                'FailedRatio': args.failed_ratio,
+                'Execution': args.execution,
+                'InMemoryS3': not args.endpoint_url,
+            },
+        })
+
+        comparison = compare(result, previous.get(case_key(result)))
+        failed = failed or comparison.startswith('REGRESSION')
+        print(
+            f"{result['OutputLines']:>10} {result['WallSeconds']:>8} {result['PeakRssMB']:>8} "
+            f"{result['UploadedBytes'] / 1024 / 1024:>12.1f} {result['UploadRequests']:>9}  {comparison}"
+        )
+
+        if not args.no_store:
+            with open(args.results, 'a') as f:
+                f.write(json.dumps(result, separators=(',', ':')) + '\n')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
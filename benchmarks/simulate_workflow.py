@@ -0,0 +1,596 @@
+"""
+Local simulation of the state machine in cdk/lib/aws-nuke-stack.ts: the Lambda handlers run in this process
+in the order of the state machine, with the payloads of the Step Functions definition, against in-memory S3 and
+SNS stand-ins (moto) or a local endpoint, and with the aws-nuke emulator (fake_aws_nuke.py).
+
+The payloads, the environment, the timeouts and the memory sizes of the functions are read from the stack, so
+a change to a handler that breaks the payload contract fails here. The order of the states (the Choice states)
+follows the definition in the stack and has to be changed with it.
+
+Every step reports its wall time and the peak RSS of the process and its child processes (aws-nuke).
+The simulation fails when a step or the whole run exceeds its latency or memory budget.
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from run_benchmark import ACCOUNT_ID, FAKE_NUKE, LAMBDA_DIR
+
+STACK_PATH = os.path.join(os.path.dirname(LAMBDA_DIR), 'cdk', 'lib', 'aws-nuke-stack.ts')
+
+REGION = 'us-east-1'
+
+# The stack properties of the simulation, the defaults of cdk/bin/app.ts where they make sense locally
+DEFAULT_PROPS = {
+    'projectName': 'aws-nuke',
+    'tagKey': 'Cleanup',
+    'tagValue': 'persist',
+    'blocklistAccounts': ['000000000000'],
+    'nukeVersion': 'v3.99.0',
+    'enforceVersion': False,
+    'shardByRegion': False,
+    'shardConcurrency': 4,
+    'partitioning': 'none',
+    'partitionConcurrency': 4,
+    'pruneAfterEmptyRuns': 0,
+    'fullSweepEvery': 10,
+    'continuation': False,
+    'deletionWaves': False,
+    'retryAttempts': 3,
+    'retryBudgetSeconds': 300,
+    'preflight': True,
+    'digestWindowMinutes': 0,
+    'organizationalUnitId': '',
+    'memberRoleName': 'OrganizationAccountAccessRole',
+}
+
+# Step Functions limits
+MAX_PAYLOAD_BYTES = 256 * 1024
+
+# RunNuke is retried on AccountAccessError, see runNuke.addRetry in the stack
+RETRY_ERRORS = ('AccountAccessError',)
+RETRY_ATTEMPTS = 3
+RETRY_INTERVAL_SECONDS = 30
+RETRY_BACKOFF_RATE = 2
+
+FUNCTION = re.compile(r"const (\w+) = new lambda\.Function\(this, '\w+', \{(.*?)\n    \}\);", re.S)
+TASK = re.compile(r"new tasks\.LambdaInvoke\(this, '(\w+)', \{\s*lambdaFunction: (\w+),(.*?)\n    \}\);", re.S)
+PAYLOAD_FUNCTION = re.compile(r"const (\w+) = \((\w+): string\) => sfn\.TaskInput\.fromObject\(\{(.*?)\}\);", re.S)
+PASS = re.compile(r"new sfn\.Pass\(this, '(\w+)', \{\s*parameters: \{(.*?)\},\s*\}\);", re.S)
+ENTRY = re.compile(r"^\s*'?([\w.$]+)'?: (.+?),?\s*$", re.M)
+DURATION = re.compile(r"cdk\.Duration\.(seconds|minutes|hours)\((\d+)\)")
+
+
+class SimulationError(Exception):
+    pass
+
+
+class TaskFailed(Exception):
+    """
+    A task failed like in Step Functions: Error is the name of the exception, Cause the error of the handler.
+    """
+
+    def __init__(self, error: str, cause: str):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+def parse_duration(text: str) -> Optional[float]:
+
+    match = DURATION.search(text)
+    if match is None:
+        return None
+    return int(match.group(2)) * {'seconds': 1, 'minutes': 60, 'hours': 3600}[match.group(1)]
+
+
+def resolve_expression(expression: str, values: Dict[str, Any]) -> Any:
+    """
+    Value of a TypeScript expression in the stack: a literal, a template string or a name in values
+    (the stack properties and the resources of the simulation).
+    """
+    expression = expression.strip()
+
+    if expression[0] in "'\"" and expression[-1] == expression[0]:
+        return expression[1:-1]
+    if expression[0] == '`' and expression[-1] == '`':
+        return re.sub(r'\$\{(\w+)\}', lambda match: str(resolve_expression(match.group(1), values)), expression[1:-1])
+    if expression in ('true', 'false'):
+        return expression == 'true'
+    if re.fullmatch(r'-?\d+(\.\d+)?', expression):
+        return json.loads(expression)
+    if expression in values:
+        return values[expression]
+
+    raise SimulationError(f"Can't resolve {expression} in {STACK_PATH}")
+
+
+def parse_object(text: str, values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parse the entries of an object literal. Values of keys that end with .$ are JSON paths, they are resolved
+    when the state runs. The object literals in the stack have one entry per line.
+    """
+    return {key: resolve_expression(expression, values) for key, expression in ENTRY.findall(text)}
+
+
+def load_definition(stack_path: str, props: Dict[str, Any], resources: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Read the functions, the Lambda tasks and the Pass states with parameters from the stack.
+    """
+    with open(stack_path) as f:
+        stack = f.read()
+
+    values = dict(props, **resources)
+
+    functions = {}
+    for variable, body in FUNCTION.findall(stack):
+        environment = re.search(r"environment: \{(.*?)\n      \},", body, re.S)
+        functions[variable] = {
+            'Module': re.search(r"handler: '(\w+)\.lambda_handler'", body).group(1),
+            'TimeoutSeconds': parse_duration(re.search(r"timeout: (.*)", body).group(1)),
+            'MemoryMB': int(re.search(r"memorySize: (\d+)", body).group(1)),
+            'Environment': {key: str(value) for key, value in parse_object(environment.group(1), values).items()} if environment else {},
+        }
+
+    payload_functions = {name: (parameter, body) for name, parameter, body in PAYLOAD_FUNCTION.findall(stack)}
+
+    tasks = {}
+    for name, function, body in TASK.findall(stack):
+        payload = re.search(r"payload: sfn\.TaskInput\.fromObject\(\{(.*?)\}\),", body, re.S)
+        if payload:
+            parameters = parse_object(payload.group(1), values)
+        else:
+            # f.e. payload: preflightPayload('$.IndexS3Uri')
+            call = re.search(r"payload: (\w+)\('([^']*)'\),", body)
+            parameter, payload_body = payload_functions[call.group(1)]
+            parameters = parse_object(payload_body, dict(values, **{parameter: call.group(2)}))
+
+        output_path = re.search(r"outputPath: '([^']*)'", body)
+        result_path = re.search(r"resultPath: '([^']*)'", body)
+        tasks[name] = {
+            'Function': function,
+            'Parameters': parameters,
+            'PayloadResponseOnly': 'payloadResponseOnly: true' in body,
+            'ResultPath': result_path.group(1) if result_path else None,
+            'OutputPath': output_path.group(1) if output_path else None,
+        }
+
+    passes = {name: parse_object(body, values) for name, body in PASS.findall(stack)}
+
+    state_machine = re.search(r"new sfn\.StateMachine\(this, '\w+', \{(.*?)\n    \}\);", stack, re.S)
+
+    return {
+        'Functions': functions,
+        'Tasks': tasks,
+        'Passes': passes,
+        'TimeoutSeconds': parse_duration(state_machine.group(1)) if state_machine else None,
+    }
+
+
+def read_path(path: str, data: Any, context: Dict[str, Any]) -> Any:
+    """
+    Resolve a JSON path like Step Functions: a path that doesn't exist is an error, also when the value would be null.
+    """
+    if path == '$':
+        return data
+    if path == '$$':
+        return context
+
+    value, names = (context, path[3:].split('.')) if path.startswith('$$.') else (data, path[2:].split('.'))
+    for name in names:
+        if not isinstance(value, dict) or name not in value:
+            raise TaskFailed('States.Runtime', f"The JSONPath '{path}' could not be found in the input")
+        value = value[name]
+
+    return value
+
+
+def apply_parameters(parameters: Dict[str, Any], data: Any, context: Dict[str, Any]) -> Dict[str, Any]:
+
+    return {
+        key[:-2] if key.endswith('.$') else key: read_path(value, data, context) if key.endswith('.$') else value
+        for key, value in parameters.items()
+    }
+
+
+def check_size(name: str, data: Any) -> int:
+
+    size = len(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+    if size > MAX_PAYLOAD_BYTES:
+        raise TaskFailed('States.DataLimitExceeded', f"The output of {name} has {size} bytes, the limit is {MAX_PAYLOAD_BYTES}")
+    return size
+
+
+def process_rss_bytes(pid: int) -> int:
+    """
+    RSS of a process and all its descendants, from /proc.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            total = int(f.read().split()[1]) * resource.getpagesize()
+        children = []
+        for thread in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{thread}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except (OSError, ValueError):
+        return 0
+
+    return total + sum(process_rss_bytes(child) for child in children)
+
+
+class PeakRss:
+    """
+    Samples the RSS of this process and its child processes (aws-nuke) while a step runs.
+    Without /proc, the peak RSS of this process is used.
+    """
+
+    def __init__(self, interval: float = 0.01):
+
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+
+        while True:
+            self.peak = max(self.peak, process_rss_bytes(os.getpid()))
+            if self.stopped.wait(self.interval):
+                return
+
+    def __enter__(self):
+
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.stopped.set()
+        self.thread.join()
+        if self.peak == 0:
+            # ru_maxrss is in KiB on Linux
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self.peak / 1024 / 1024, 1)
+
+
+class LambdaContext:
+
+    def __init__(self, function_name: str, function: Dict[str, Any]):
+
+        self.function_name = function_name
+        self.memory_limit_in_mb = function['MemoryMB']
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.monotonic() + function['TimeoutSeconds']
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+class Simulator:
+    """
+    Runs the states of the workflow. Every Lambda invocation is recorded as a step.
+    """
+
+    def __init__(self, definition: Dict[str, Any], props: Dict[str, Any], log):
+
+        self.definition = definition
+        self.props = props
+        # The output of the handlers
+        self.log = log
+        self.steps = []
+        self.modules = {}
+
+    def invoke(self, state: str, function_name: str, payload: Dict[str, Any]) -> Any:
+
+        function = self.definition['Functions'][function_name]
+        if function['Module'] not in self.modules:
+            self.modules[function['Module']] = importlib.import_module(function['Module'])
+
+        # The payload is sent as JSON, like Step Functions does
+        payload = json.loads(json.dumps(payload))
+        step = {'State': state, 'Function': function_name, 'PayloadBytes': check_size(state, payload)}
+
+        start_time = time.monotonic()
+        with PeakRss() as rss:
+            try:
+                with contextlib.redirect_stdout(self.log):
+                    response = self.modules[function['Module']].lambda_handler(payload, LambdaContext(function_name, function))
+                error = None
+            except Exception as e:
+                response = None
+                error = TaskFailed(type(e).__name__, json.dumps({
+                    'errorMessage': str(e), 'errorType': type(e).__name__, 'stackTrace': traceback.format_tb(e.__traceback__)
+                }))
+
+        step.update(WallSeconds=round(time.monotonic() - start_time, 3), PeakRssMB=rss.peak_mb)
+        self.steps.append(step)
+
+        if error is None and step['WallSeconds'] > function['TimeoutSeconds']:
+            error = TaskFailed('States.Timeout', f"{function_name} ran {step['WallSeconds']} seconds, the timeout is {function['TimeoutSeconds']}")
+        if error is not None:
+            step['Error'] = error.error
+            raise error
+
+        response = json.loads(json.dumps(response))
+        step['ResponseBytes'] = check_size(state, response)
+        return response
+
+    def run_task(self, name: str, data: Any, context: Dict[str, Any]) -> Any:
+        """
+        Run a LambdaInvoke task: parameters, invocation, result path and output path.
+        """
+        task = self.definition['Tasks'][name]
+        response = self.invoke(name, task['Function'], apply_parameters(task['Parameters'], data, context))
+
+        result = response if task['PayloadResponseOnly'] else {'Payload': response, 'StatusCode': 200}
+        if task['ResultPath']:
+            output = dict(data, **{task['ResultPath'][2:]: result})
+        else:
+            output = result
+        if task['OutputPath']:
+            output = read_path(task['OutputPath'], output, context)
+
+        return output
+
+    def run_partition(self, item: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The item processor of RunPartitions: RunNuke until there is no ContinuationToken, then PartitionDone,
+        PartitionFailed on errors.
+        """
+        data = item
+        while True:
+            for attempt in range(RETRY_ATTEMPTS + 1):
+                try:
+                    data = self.run_task('RunNuke', data, context)
+                    break
+                except TaskFailed as e:
+                    if e.error not in RETRY_ERRORS or attempt == RETRY_ATTEMPTS:
+                        error_info = {'Error': e.error, 'Cause': e.cause}
+                        return apply_parameters(self.definition['Passes']['PartitionFailed'], dict(data, ErrorInfo=error_info), context)
+                    self.steps.append({
+                        'State': 'RunNuke (retry interval)', 'Function': None,
+                        'WallSeconds': RETRY_INTERVAL_SECONDS * RETRY_BACKOFF_RATE ** attempt, 'Simulated': True
+                    })
+
+            if data.get('ContinuationToken') is None:
+                return apply_parameters(self.definition['Passes']['PartitionDone'], data, context)
+
+    def run_partitions(self, data: Dict[str, Any], context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        The Map state. The partitions run one after the other here, the duration of the Map state with
+        partitionConcurrency parallel partitions is estimated from the durations of the partitions.
+        """
+        lanes = [0.0] * max(1, self.props['partitionConcurrency'])
+        results = []
+        for item in data['Partitions']:
+            first_step = len(self.steps)
+            results.append(self.run_partition(item, context))
+            for step in self.steps[first_step:]:
+                step['Partition'] = True
+            lanes[lanes.index(min(lanes))] += sum(step['WallSeconds'] for step in self.steps[first_step:])
+
+        self.steps.append({'State': 'RunPartitions', 'Function': None, 'WallSeconds': round(max(lanes), 3), 'Simulated': True})
+        return results
+
+    def run(self, execution_input: Dict[str, Any], name: str) -> Dict[str, Any]:
+        """
+        Run one execution of the state machine, see the definition at the end of the stack.
+        """
+        state_machine_arn = f"arn:aws:states:{REGION}:{ACCOUNT_ID}:stateMachine:{self.props['projectName']}-nuke-workflow"
+        context = {
+            'Execution': {
+                'Id': state_machine_arn.replace(':stateMachine:', ':execution:') + f":{name}",
+                'Name': name,
+                'Input': execution_input,
+                'StartTime': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            },
+            'StateMachine': {'Id': state_machine_arn},
+        }
+        first_step = len(self.steps)
+
+        def result(status: str, output: Any = None, error: str = None) -> Dict[str, Any]:
+            # The steps of the partitions are in the estimate of RunPartitions
+            seconds = sum(step['WallSeconds'] for step in self.steps[first_step:] if not step.get('Partition'))
+            return {'Name': name, 'Status': status, 'Error': error, 'Output': output, 'SimulatedSeconds': round(seconds, 3)}
+
+        try:
+            data = self.run_task('GenerateConfig', execution_input, context)
+
+            if self.props['preflight'] and read_path('$$.Execution.Input.DryRun', data, context) is False:
+                data = self.run_task('PreflightExecution', data, context)
+                if read_path('$.Preflight.Blocked', data, context) is True:
+                    self.run_task('NotifyPreflightBlocked', data, context)
+                    return result('FAILED', data, 'PreflightBlocked')
+
+            data = self.run_task('MergeResults', self.run_partitions(data, context), context)
+
+            if read_path('$.DryRun', data, context) is False:
+                data = self.run_task('Reconcile', data, context)
+            elif self.props['preflight']:
+                data = self.run_task('PreflightDryRun', data, context)
+                if read_path('$.Preflight.Blocked', data, context) is True:
+                    self.run_task('NotifyPreflightBlocked', data, context)
+                    return result('FAILED', data, 'PreflightBlocked')
+
+            if read_path('$.SendNotification', data, context) is not False:
+                self.run_task('SendNotification', data, context)
+        except TaskFailed as e:
+            return result('FAILED', None, f"{e.error}: {e.cause[:500]}")
+
+        return result('SUCCEEDED', data)
+
+
+def parse_budgets(values: List[str], option: str) -> Dict[str, float]:
+
+    budgets = {}
+    for value in values or []:
+        name, _, limit = value.partition('=')
+        if not limit:
+            raise SystemExit(f"{option} needs STATE=LIMIT, got {value}")
+        budgets[name] = float(limit)
+    return budgets
+
+
+def check_budgets(simulator: Simulator, executions: List[Dict[str, Any]], latency: Dict[str, float], memory: Dict[str, float],
+                  total_budget: float) -> List[str]:
+    """
+    Compare every step with its budget. A step without a budget gets the timeout and the memory size of its function.
+    """
+    violations = []
+    for step in simulator.steps:
+        if step.get('Simulated'):
+            limit = latency.get(step['State'])
+            if limit is not None and step['WallSeconds'] > limit:
+                violations.append(f"{step['State']}: {step['WallSeconds']} seconds, budget {limit}")
+            continue
+
+        function = simulator.definition['Functions'][step['Function']]
+        limit = latency.get(step['State'], function['TimeoutSeconds'])
+        if step['WallSeconds'] > limit:
+            violations.append(f"{step['State']}: {step['WallSeconds']} seconds, budget {limit}")
+
+        limit = memory.get(step['State'], memory.get(step['Function'], function['MemoryMB']))
+        if step['PeakRssMB'] > limit:
+            violations.append(f"{step['State']}: peak RSS {step['PeakRssMB']} MB, budget {limit} MB")
+
+    for execution in executions:
+        if execution['SimulatedSeconds'] > total_budget:
+            violations.append(f"{execution['Name']}: {execution['SimulatedSeconds']} seconds, budget {total_budget}")
+
+    return violations
+
+
+def print_steps(steps: List[Dict[str, Any]]):
+
+    print(f"{'state':<26} {'function':<26} {'seconds':>9} {'peak MB':>8} {'in KB':>7} {'out KB':>7}")
+    for step in steps:
+        simulated = ' (estimate)' if step.get('Simulated') else ''
+        print(
+            f"{step['State']:<26} {step['Function'] or '-':<26} {step['WallSeconds']:>9}{simulated} "
+            f"{step.get('PeakRssMB', ''):>8} {round(step.get('PayloadBytes', 0) / 1024, 1) if 'PayloadBytes' in step else '':>7} "
+            f"{round(step.get('ResponseBytes', 0) / 1024, 1) if 'ResponseBytes' in step else '':>7}"
+            f"{'  ' + step['Error'] if step.get('Error') else ''}"
+        )
+
+
+def parse_prop(value: str) -> (str, Any):
+
+    name, _, text = value.partition('=')
+    if name not in DEFAULT_PROPS:
+        raise SystemExit(f"Unknown stack property {name}, one of: {', '.join(DEFAULT_PROPS)}")
+    try:
+        return name, json.loads(text)
+    except ValueError:
+        return name, text
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description='Simulate the AWS Nuke state machine locally and check latency and memory budgets')
+    parser.add_argument('--regions', default='us-east-1,eu-west-1', help='comma separated regions of the execution input')
+    parser.add_argument('--resources', type=int, default=1000, help='resources per region printed by the aws-nuke emulator')
+    parser.add_argument('--resource-types', type=int, default=20, help='resource types of the aws-nuke emulator')
+    parser.add_argument('--failed-ratio', type=float, default=0.0, help='part of the removals that fails')
+    parser.add_argument('--execution', action='store_true', help='approve the dry-run and run the execution, like approve-execution.sh')
+    parser.add_argument('--prop', action='append', default=[], metavar='NAME=VALUE', help='stack property, f.e. partitioning=region')
+    parser.add_argument('--budget', action='append', metavar='STATE=SECONDS',
+                        help='latency budget of every invocation of a state, default: the timeout of its function')
+    parser.add_argument('--memory-budget', action='append', metavar='STATE=MB',
+                        help='peak RSS budget of a state or function, default: the memory size of the function')
+    parser.add_argument('--total-budget', type=float, help='latency budget of an execution, default: the timeout of the state machine')
+    parser.add_argument('--endpoint-url', help='local S3 and SNS stand-in (f.e. moto_server) instead of the in-memory stand-ins')
+    parser.add_argument('--output', help='write the steps and executions as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='show the logs of the handlers')
+    args = parser.parse_args(argv)
+
+    props = dict(DEFAULT_PROPS, **dict(parse_prop(value) for value in args.prop))
+    bucket = f"{props['projectName']}-aws-nuke-bucket-{ACCOUNT_ID}"
+
+    os.environ.update(
+        AWS_DEFAULT_REGION=REGION,
+        AWS_ACCESS_KEY_ID=os.environ.get('AWS_ACCESS_KEY_ID', 'simulation'),
+        AWS_SECRET_ACCESS_KEY=os.environ.get('AWS_SECRET_ACCESS_KEY', 'simulation'),
+        NUKE_BINARY_PATH=FAKE_NUKE,
+        NUKE_WORK_DIR=tempfile.mkdtemp(prefix='simulate-workflow-'),
+        FAKE_NUKE_RESOURCES=str(args.resources),
+        FAKE_NUKE_RESOURCE_TYPES=str(args.resource_types),
+        FAKE_NUKE_FAILED_RATIO=str(args.failed_ratio),
+    )
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL'] = args.endpoint_url
+
+    import boto3
+    from moto import mock_aws
+
+    with contextlib.nullcontext() if args.endpoint_url else mock_aws():
+        s3 = boto3.client('s3')
+        try:
+            s3.create_bucket(Bucket=bucket)
+        except s3.exceptions.BucketAlreadyOwnedByYou:
+            pass
+        topic_arn = boto3.client('sns').create_topic(Name=f"{props['projectName']}-notifications")['TopicArn']
+
+        resources = {'notificationTopic.topicArn': topic_arn, 'awsNukeBucketName': bucket, 'awsNukeBucket.bucketName': bucket}
+        definition = load_definition(STACK_PATH, props, resources)
+
+        # All functions share this process, the environment of every function is set before the handlers are imported
+        for function in definition['Functions'].values():
+            os.environ.update(function['Environment'])
+        sys.path.insert(0, LAMBDA_DIR)
+
+        simulator = Simulator(definition, props, sys.stdout if args.verbose else open(os.devnull, 'w'))
+
+        execution_input = {
+            'awsNukeBucket': bucket,
+            'cdkBucketPrefix': 'cdk-hnb659fds',
+            'AccountId': ACCOUNT_ID,
+            'Regions': args.regions.split(','),
+            'DryRunIndexS3Uri': '',
+            'DryRun': True,
+            'SendNotification': True,
+        }
+        executions = [simulator.run(execution_input, 'simulated-dry-run')]
+
+        if args.execution and executions[0]['Status'] == 'SUCCEEDED':
+            approved_input = dict(execution_input, DryRun=False, DryRunIndexS3Uri=executions[0]['Output']['IndexS3Uri'])
+            executions.append(simulator.run(approved_input, 'simulated-execution'))
+
+    print_steps(simulator.steps)
+    print()
+    for execution in executions:
+        print(f"{execution['Name']}: {execution['Status']} in {execution['SimulatedSeconds']} seconds"
+              f"{', ' + execution['Error'] if execution['Error'] else ''}")
+
+    violations = check_budgets(
+        simulator, executions,
+        parse_budgets(args.budget, '--budget'), parse_budgets(args.memory_budget, '--memory-budget'),
+        args.total_budget if args.total_budget is not None else definition['TimeoutSeconds']
+    )
+    for violation in violations:
+        print(f"OVER BUDGET {violation}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'Props': props, 'Steps': simulator.steps, 'Executions': executions, 'Violations': violations}, f, indent=2, default=str)
+
+    failed = violations or any(execution['Status'] != 'SUCCEEDED' for execution in executions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
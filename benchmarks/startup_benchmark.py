@@ -0,0 +1,249 @@
+"""
+Startup benchmark of the Lambda functions: the import time of every handler in a new process, and the latency
+of the first (cold) and the second (warm) invocation against an in-memory S3 (moto). Every handler is imported
+from a package with only the modules that the stack ships for it (see lambdaCode in cdk/lib/aws-nuke-stack.ts),
+so a module that is missing in the package fails here.
+
+Results are appended to results.jsonl and compared with the previous result of the same handler.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from run_benchmark import ACCOUNT_ID, BUCKET, FAKE_NUKE, LAMBDA_DIR, RESULTS_PATH, case_key, compare, git_commit, previous_results
+
+HANDLERS = ['generate_config', 'nuke_executor', 'merge_results', 'reconcile', 'preflight', 'send_notification']
+
+# The same rule as lambdaCode in the stack: imports of modules in the lambda directory, also inside functions
+IMPORT = re.compile(r'^\s*(?:from\s+(\w+)\S*\s+import|import\s+(\w+))', re.M)
+# and YAML files in the lambda directory that a module refers to by name
+DATA_FILE = re.compile(r'''['"](\w+\.yaml)['"]''')
+
+REGION = 'us-east-1'
+
+
+def package_modules(handler: str) -> (List[str], List[str], bool):
+    """
+    Return the modules that the handler imports, directly or through other modules, the data files
+    that they refer to, and whether one of them uses yaml.
+    """
+    modules = []
+    data_files = []
+    pending = [handler]
+    uses_yaml = False
+
+    while pending:
+        module = pending.pop()
+        if module in modules:
+            continue
+        modules.append(module)
+
+        with open(os.path.join(LAMBDA_DIR, f"{module}.py")) as f:
+            source = f.read()
+        for match in IMPORT.finditer(source):
+            imported = match.group(1) or match.group(2)
+            if imported == 'yaml':
+                uses_yaml = True
+            elif os.path.exists(os.path.join(LAMBDA_DIR, f"{imported}.py")):
+                pending.append(imported)
+        for name in DATA_FILE.findall(source):
+            if name not in data_files and os.path.exists(os.path.join(LAMBDA_DIR, name)):
+                data_files.append(name)
+
+    return modules, data_files, uses_yaml
+
+
+def build_package(handler: str, package_dir: str) -> Dict[str, int]:
+
+    modules, data_files, uses_yaml = package_modules(handler)
+    for name in [f"{module}.py" for module in modules] + data_files:
+        shutil.copy(os.path.join(LAMBDA_DIR, name), package_dir)
+
+    if uses_yaml:
+        for name in ('yaml', '_yaml'):
+            spec = importlib.util.find_spec(name)
+            if spec is not None and spec.submodule_search_locations:
+                shutil.copytree(spec.submodule_search_locations[0], os.path.join(package_dir, name),
+                                ignore=shutil.ignore_patterns('__pycache__'))
+
+    size = sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(package_dir) for name in names
+    )
+    return {'Modules': len(modules), 'PackageBytes': size}
+
+
+def measure_import(handler: str, package_dir: str) -> float:
+    """
+    Import the handler in a new, isolated process (like a cold start) and return the milliseconds.
+    """
+    code = (
+        f"import sys, time; sys.path.insert(0, {package_dir!r}); start = time.perf_counter(); "
+        f"import {handler}; print((time.perf_counter() - start) * 1000)"
+    )
+    result = subprocess.run([sys.executable, '-I', '-c', code], cwd=package_dir, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def put_plan(s3, key: str, records: List[Dict[str, Any]]) -> str:
+
+    s3.put_object(Bucket=BUCKET, Key=f"{key}.jsonl", Body=''.join(json.dumps(record) + '\n' for record in records))
+    s3.put_object(Bucket=BUCKET, Key=f"{key}.json", Body=json.dumps({'PlanS3Uris': [f"s3://{BUCKET}/{key}.jsonl"]}))
+    return f"s3://{BUCKET}/{key}.json"
+
+
+def sample_event(handler: str, s3, sns) -> Dict[str, Any]:
+    """
+    Create the objects that the handler reads and return an event like the state machine sends.
+    """
+    records = [
+        {'account': ACCOUNT_ID, 'region': REGION, 'type': 'EC2Instance', 'id': f"i-{i:08x}", 'state': state,
+         'properties': {'tag:Cleanup': 'yes'}}
+        for i in range(100) for state in ('would-remove', 'removed')
+    ]
+    dry_run_index = put_plan(s3, 'nuke-outputs/dry-run', [record for record in records if record['state'] == 'would-remove'])
+    execution_index = put_plan(s3, 'nuke-outputs/execution', records)
+    s3.put_object(Bucket=BUCKET, Key='nuke-outputs/output.txt', Body='output\n' * 100)
+    s3.put_object(Bucket=BUCKET, Key='nuke-configs/benchmark.yaml', Body=json.dumps({'regions': [REGION], 'accounts': {ACCOUNT_ID: {}}}))
+
+    if handler == 'generate_config':
+        return {
+            'AccountId': ACCOUNT_ID, 'awsNukeBucket': BUCKET, 'Regions': [REGION, 'eu-west-1'], 'ProjectName': 'aws-nuke',
+            'cdkBucketPrefix': 'cdk-hnb659fds', 'TagKey': 'Cleanup', 'TagValue': 'no',
+        }
+    if handler == 'nuke_executor':
+        return {'ConfigS3Uri': f"s3://{BUCKET}/nuke-configs/benchmark.yaml", 'AccountId': ACCOUNT_ID, 'DryRun': True, 'RetryAttempts': 0}
+    if handler == 'merge_results':
+        return {
+            'Results': [{
+                'Success': True, 'PartitionId': 'all', 'AccountId': ACCOUNT_ID, 'OutputS3Uri': f"s3://{BUCKET}/nuke-outputs/output.txt",
+                'IndexS3Uri': execution_index, 'ResourcesToDelete': 100, 'DurationSeconds': 10,
+                'ConfigS3Uri': f"s3://{BUCKET}/nuke-configs/benchmark.yaml", 'NukeVersion': 'v3.99.0',
+            }],
+            'awsNukeBucket': BUCKET, 'DryRun': False, 'Regions': [REGION],
+            'ExecutionArn': f"arn:aws:states:{REGION}:{ACCOUNT_ID}:execution:aws-nuke:benchmark", 'StartTime': '2026-01-01T00:00:00Z',
+        }
+    if handler == 'reconcile':
+        return {'Result': {'Success': True, 'IndexS3Uri': execution_index}, 'awsNukeBucket': BUCKET, 'DryRunIndexS3Uri': dry_run_index}
+    if handler == 'preflight':
+        return {
+            'awsNukeBucket': BUCKET, 'IndexS3Uri': dry_run_index, 'Regions': [REGION], 'AccountId': ACCOUNT_ID,
+            'TagKey': 'Protected', 'TagValue': 'true',
+        }
+
+    os.environ['NOTIFICATION_TOPIC_ARN'] = sns.create_topic(Name='aws-nuke-benchmark')['TopicArn']
+    return {
+        'awsNukeBucket': BUCKET, 'DryRun': True, 'OutputS3Uri': f"s3://{BUCKET}/nuke-outputs/output.txt", 'ExecutionId': 'benchmark',
+        'StateMachineArn': f"arn:aws:states:{REGION}:{ACCOUNT_ID}:stateMachine:aws-nuke", 'ExecutionResult': {'ResourcesToDelete': 100},
+    }
+
+
+def measure_invocations(handler: str, package_dir: str) -> Dict[str, float]:
+    """
+    Invoke the handler twice in this process. Only called in the child process.
+    The first invocation creates the clients, the second one reuses them like a warm Lambda container.
+    """
+    import boto3
+    from moto import mock_aws
+
+    with mock_aws():
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket=BUCKET)
+        event = sample_event(handler, s3, boto3.client('sns'))
+
+        sys.path.insert(0, package_dir)
+        module = importlib.import_module(handler)
+
+        timings = []
+        for _ in range(2):
+            start_time = time.perf_counter()
+            module.lambda_handler(json.loads(json.dumps(event)), None)
+            timings.append(round((time.perf_counter() - start_time) * 1000, 1))
+
+    return {'FirstInvocationMs': timings[0], 'WarmInvocationMs': timings[1]}
+
+
+def run_handler(handler: str, repeat: int) -> Dict[str, Any]:
+
+    with tempfile.TemporaryDirectory(prefix=f"startup-{handler}-") as package_dir, \
+            tempfile.TemporaryDirectory(prefix='startup-work-') as work_dir, \
+            tempfile.NamedTemporaryFile(suffix='.json') as result_file:
+        result = build_package(handler, package_dir)
+        result['ImportMs'] = round(statistics.median(measure_import(handler, package_dir) for _ in range(repeat)), 1)
+
+        env = dict(
+            os.environ,
+            AWS_DEFAULT_REGION=REGION,
+            AWS_ACCESS_KEY_ID='benchmark',
+            AWS_SECRET_ACCESS_KEY='benchmark',
+            NUKE_BINARY_PATH=FAKE_NUKE,
+            NUKE_WORK_DIR=work_dir,
+            FAKE_NUKE_RESOURCES='100',
+        )
+        # The handlers log their events and responses, only the timings are interesting here
+        subprocess.run(
+            [sys.executable, __file__, '--child', handler, '--package-dir', package_dir, '--result-file', result_file.name],
+            env=env, check=True, stdout=subprocess.DEVNULL
+        )
+        result.update(json.load(open(result_file.name)))
+
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description='Measure the import time and the first invocation of every Lambda handler')
+    parser.add_argument('--handlers', nargs='+', default=HANDLERS, choices=HANDLERS, help='handlers to measure')
+    parser.add_argument('--repeat', type=int, default=5, help='imports per handler, the median is reported')
+    parser.add_argument('--results', default=RESULTS_PATH, help='JSON Lines file with the results of previous benchmarks')
+    parser.add_argument('--no-store', action='store_true', help="don't append the results")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--package-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        with open(args.result_file, 'w') as f:
+            json.dump(measure_invocations(args.child, args.package_dir), f)
+        return 0
+
+    previous = previous_results(args.results)
+    commit = git_commit()
+    failed = False
+
+    print(f"{'handler':<18} {'modules':>7} {'package KB':>10} {'import ms':>9} {'first ms':>9} {'warm ms':>8}  compared with previous")
+    for handler in args.handlers:
+        result = run_handler(handler, args.repeat)
+        result.update({
+            'Commit': commit,
+            'Timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'Python': sys.version.split()[0],
+            'Parameters': {'Benchmark': 'startup', 'Handler': handler},
+        })
+
+        comparison = compare(result, previous.get(case_key(result)), ('ImportMs', 'FirstInvocationMs'))
+        failed = failed or comparison.startswith('REGRESSION')
+        print(
+            f"{handler:<18} {result['Modules']:>7} {result['PackageBytes'] / 1024:>10.0f} {result['ImportMs']:>9} "
+            f"{result['FirstInvocationMs']:>9} {result['WarmInvocationMs']:>8}  {comparison}"
+        )
+
+        if not args.no_store:
+            with open(args.results, 'a') as f:
+                f.write(json.dumps(result, separators=(',', ':')) + '\n')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
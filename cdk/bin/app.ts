@@ -5,6 +5,34 @@ import { AwsNukeStack } from '../lib/aws-nuke-stack';
 
 const app = new cdk.App();
 
+// The environment variable of a context value: shardConcurrency -> SHARD_CONCURRENCY
+function envName(name: string): string {
+  return name.replace(/([A-Z])/g, '_$1').toUpperCase();
+}
+
+// A context value (-c name=value), else the environment variable, else undefined
+function contextValue(name: string): unknown {
+  const value = app.node.tryGetContext(name);
+  if (value !== undefined && value !== '') return value;
+  return process.env[envName(name)] || undefined;
+}
+
+function boolContext(name: string, defaultValue: boolean): boolean {
+  const value = contextValue(name);
+  if (value === undefined) return defaultValue;
+  if (typeof value === 'boolean') return value;
+  if (typeof value === 'string' && ['true', 'false'].includes(value.toLowerCase())) return value.toLowerCase() == 'true';
+  throw new Error(`${name} (${envName(name)}) must be true or false, got '${value}'`);
+}
+
+function intContext(name: string, defaultValue: number): number {
+  const value = contextValue(name);
+  if (value === undefined) return defaultValue;
+  if (typeof value === 'number' && Number.isInteger(value) && value >= 0) return value;
+  if (typeof value === 'string' && /^\d+$/.test(value.trim())) return parseInt(value, 10);
+  throw new Error(`${name} (${envName(name)}) must be a whole number of 0 or more, got '${value}'`);
+}
+
 // Get configuration from context or environment variables
 const config = {
   projectName: app.node.tryGetContext('projectName') || process.env.PROJECT_NAME || 'aws-nuke',
@@ -27,28 +55,24 @@ const config = {
   })(),
   cdkBucketPrefix: app.node.tryGetContext('cdkBucketPrefix') || process.env.CDK_BUCKET_PREFIX || 'cdk-',
   scheduleExpression: app.node.tryGetContext('scheduleExpression') || process.env.SCHEDULE_EXPRESSION || 'manual',
-  bucketRetentionDays: (() => {
-    const contextBucketRetention = app.node.tryGetContext('bucketRetentionDays');
-    if (typeof contextBucketRetention === 'number') return contextBucketRetention;
-    if (typeof contextBucketRetention === 'string') return parseInt(contextBucketRetention);
-    if (process.env.BUCKET_RETENTION_DAYS) return parseInt(process.env.BUCKET_RETENTION_DAYS, 30);
-    return 30;
-  })(),
-  logGroupRetentionDays: (() => {
-    const contextLogGroupRetention = app.node.tryGetContext('logGroupRetentionDays');
-    if (typeof contextLogGroupRetention === 'number') return contextLogGroupRetention;
-    if (typeof contextLogGroupRetention === 'string') return parseInt(contextLogGroupRetention);
-    if (process.env.LOG_GROUP_RETENTION_DAYS) return parseInt(process.env.LOG_GROUP_RETENTION_DAYS, 14);
-    return 14;
-  })(),
+  bucketRetentionDays: intContext('bucketRetentionDays', 30),
+  logGroupRetentionDays: intContext('logGroupRetentionDays', 14),
   nukeVersion: app.node.tryGetContext('nukeVersion') || process.env.NUKE_VERSION || 'v3.62.2',
-  enforceVersion: (() => {
-    const enforceVersion = app.node.tryGetContext('enforceVersion');
-    if (typeof enforceVersion === 'boolean') return enforceVersion;
-    if (typeof enforceVersion === 'string') return (enforceVersion.toLowerCase() == "true");
-    if (process.env.ENFORCE_VERSION) return (process.env.ENFORCE_VERSION.toLowerCase() == "true");
-    return false;
-  })()
+  enforceVersion: boolContext('enforceVersion', false),
+  shardByRegion: boolContext('shardByRegion', false),
+  shardConcurrency: intContext('shardConcurrency', 4),
+  partitioning: app.node.tryGetContext('partitioning') || process.env.PARTITIONING || 'none',
+  partitionConcurrency: intContext('partitionConcurrency', 4),
+  pruneAfterEmptyRuns: intContext('pruneAfterEmptyRuns', 0),
+  fullSweepEvery: intContext('fullSweepEvery', 10),
+  continuation: boolContext('continuation', false),
+  deletionWaves: boolContext('deletionWaves', false),
+  retryAttempts: intContext('retryAttempts', 3),
+  retryBudgetSeconds: intContext('retryBudgetSeconds', 300),
+  preflight: boolContext('preflight', true),
+  digestWindowMinutes: intContext('digestWindowMinutes', 0),
+  organizationalUnitId: app.node.tryGetContext('organizationalUnitId') || process.env.ORGANIZATIONAL_UNIT_ID || '',
+  memberRoleName: app.node.tryGetContext('memberRoleName') || process.env.MEMBER_ROLE_NAME || 'OrganizationAccountAccessRole'
 };
 
 new AwsNukeStack(app, 'AwsNukeStack', {
@@ -60,4 +84,4 @@ new AwsNukeStack(app, 'AwsNukeStack', {
   description: 'AWS Nuke - Safe resource cleanup with tag-based protection',
 });
 
-app.synth();
\ No newline at end of file
+app.synth();
\ No newline at end of file
@@ -10,9 +10,56 @@ import * as targets from 'aws-cdk-lib/aws-events-targets';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import { Construct } from 'constructs';
 import * as logs from 'aws-cdk-lib/aws-logs';
+import * as fs from 'fs';
+import * as path from 'path';
 
 const runtime = lambda.Runtime.PYTHON_3_14
 
+const lambdaDir = '../lambda';
+
+// Every function only ships the Python modules that its handler imports (directly or through other modules),
+// and PyYAML only when one of those modules imports yaml. Imports inside functions are followed as well.
+// YAML files in the lambda directory that a module refers to by name (f.e. the nuke policy) are shipped with it.
+function lambdaCode(handlerModule: string): lambda.Code {
+  const modules = new Set<string>();
+  const dataFiles = new Set<string>();
+  const pending = [handlerModule];
+  let usesYaml = false;
+
+  while (pending.length > 0) {
+    const module = pending.pop()!;
+    if (modules.has(module)) {
+      continue;
+    }
+    modules.add(module);
+
+    const source = fs.readFileSync(path.join(lambdaDir, `${module}.py`), 'utf8');
+    for (const match of source.matchAll(/^\s*(?:from\s+(\w+)\S*\s+import|import\s+(\w+))/gm)) {
+      const imported = match[1] ?? match[2];
+      if (imported === 'yaml') {
+        usesYaml = true;
+      } else if (fs.existsSync(path.join(lambdaDir, `${imported}.py`))) {
+        pending.push(imported);
+      }
+    }
+    for (const match of source.matchAll(/['"](\w+\.yaml)['"]/g)) {
+      if (fs.existsSync(path.join(lambdaDir, match[1]))) {
+        dataFiles.add(match[1]);
+      }
+    }
+  }
+
+  const included = [...modules].map(module => `${module}.py`);
+  included.push(...dataFiles);
+  if (usesYaml) {
+    included.push('yaml', 'yaml/**', '_yaml', '_yaml/**');
+  }
+
+  return lambda.Code.fromAsset(lambdaDir, {
+    exclude: ['*', ...included.map(pattern => `!${pattern}`)],
+  });
+}
+
 export interface AwsNukeStackProps extends cdk.StackProps {
   projectName: string;
   tagKey: string;
@@ -26,13 +73,27 @@ export interface AwsNukeStackProps extends cdk.StackProps {
   logGroupRetentionDays: number;
   nukeVersion: string;
   enforceVersion: boolean;
+  shardByRegion: boolean;
+  shardConcurrency: number;
+  partitioning: string;
+  partitionConcurrency: number;
+  pruneAfterEmptyRuns: number;
+  fullSweepEvery: number;
+  continuation: boolean;
+  deletionWaves: boolean;
+  retryAttempts: number;
+  retryBudgetSeconds: number;
+  preflight: boolean;
+  digestWindowMinutes: number;
+  organizationalUnitId: string;
+  memberRoleName: string;
 }
 
 export class AwsNukeStack extends cdk.Stack {
   constructor(scope: Construct, id: string, props: AwsNukeStackProps) {
     super(scope, id, props);
 
-    const { projectName, tagKey, tagValue, emailAddress, allowedRegions, blocklistAccounts, cdkBucketPrefix, scheduleExpression, bucketRetentionDays, logGroupRetentionDays, nukeVersion, enforceVersion} = props;
+    const { projectName, tagKey, tagValue, emailAddress, allowedRegions, blocklistAccounts, cdkBucketPrefix, scheduleExpression, bucketRetentionDays, logGroupRetentionDays, nukeVersion, enforceVersion, shardByRegion, shardConcurrency, partitioning, partitionConcurrency, pruneAfterEmptyRuns, fullSweepEvery, continuation, deletionWaves, retryAttempts, retryBudgetSeconds, preflight, digestWindowMinutes, organizationalUnitId, memberRoleName} = props;
 
     const awsNukeBucketName = `${projectName}-aws-nuke-bucket-${this.account}`;
 
@@ -60,7 +121,7 @@ export class AwsNukeStack extends cdk.Stack {
       functionName: `${projectName}-generate-config`,
       runtime: runtime,
       handler: 'generate_config.lambda_handler',
-      code: lambda.Code.fromAsset('../lambda'),
+      code: lambdaCode('generate_config'),
       timeout: cdk.Duration.minutes(5),
       memorySize: 512,
     });
@@ -68,13 +129,29 @@ export class AwsNukeStack extends cdk.Stack {
     generateConfigFunction.addToRolePolicy(new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
       actions: [
+        's3:GetObject',
         's3:PutObject',
+        // HeadObject of a config that isn't stored yet returns 404 instead of 403
+        's3:ListBucket',
       ],
       resources: [
+        awsNukeBucket.bucketArn,
         `${awsNukeBucket.bucketArn}/*`,
       ],
     }));
 
+    if (organizationalUnitId) {
+      // Organization mode: the accounts to nuke are the accounts in the organizational unit
+      generateConfigFunction.addToRolePolicy(new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        actions: [
+          'organizations:ListAccountsForParent',
+          'organizations:ListOrganizationalUnitsForParent',
+        ],
+        resources: ['*'],
+      }));
+    }
+
     const logGroupGenerateConfigFunction = new logs.LogGroup(this, 'LogGroupGenerateConfigFunction', {
       logGroupName: `/aws/lambda/${projectName}-generate-config`,
       retention: logGroupRetentionDays,
@@ -84,9 +161,11 @@ export class AwsNukeStack extends cdk.Stack {
       functionName: `${projectName}-nuke-executor`,
       runtime: runtime,
       handler: 'nuke_executor.lambda_handler',
-      code: lambda.Code.fromAsset('../lambda'),
+      code: lambdaCode('nuke_executor'),
       timeout: cdk.Duration.minutes(15),
       memorySize: 1024,
+      // A continued dry-run keeps the plan of every shard in /tmp until the shard is finished, next to the aws-nuke binary
+      ephemeralStorageSize: continuation ? cdk.Size.gibibytes(4) : undefined,
       environment: {
         TAG_KEY: tagKey,
         TAG_VALUE: tagValue,
@@ -118,20 +197,126 @@ export class AwsNukeStack extends cdk.Stack {
       retention: logGroupRetentionDays,
     })
 
+    const mergeResultsFunction = new lambda.Function(this, 'MergeResultsFunction', {
+      functionName: `${projectName}-merge-results`,
+      runtime: runtime,
+      handler: 'merge_results.lambda_handler',
+      code: lambdaCode('merge_results'),
+      timeout: cdk.Duration.minutes(5),
+      memorySize: 512,
+    });
+
+    mergeResultsFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        's3:GetObject',
+        's3:PutObject',
+        's3:DeleteObject',
+        's3:ListBucket',
+      ],
+      resources: [
+        awsNukeBucket.bucketArn,
+        `${awsNukeBucket.bucketArn}/*`,
+      ],
+    }));
+
+    const logGroupMergeResultsFunction = new logs.LogGroup(this, 'LogGroupMergeResultsFunction', {
+      logGroupName: `/aws/lambda/${projectName}-merge-results`,
+      retention: logGroupRetentionDays,
+    })
+
+    const reconcileFunction = new lambda.Function(this, 'ReconcileFunction', {
+      functionName: `${projectName}-reconcile`,
+      runtime: runtime,
+      handler: 'reconcile.lambda_handler',
+      code: lambdaCode('reconcile'),
+      timeout: cdk.Duration.minutes(5),
+      memorySize: 1024,
+    });
+
+    reconcileFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        's3:GetObject',
+        's3:PutObject',
+      ],
+      resources: [
+        `${awsNukeBucket.bucketArn}/*`,
+      ],
+    }));
+
+    const logGroupReconcileFunction = new logs.LogGroup(this, 'LogGroupReconcileFunction', {
+      logGroupName: `/aws/lambda/${projectName}-reconcile`,
+      retention: logGroupRetentionDays,
+    })
+
+    const preflightFunction = new lambda.Function(this, 'PreflightFunction', {
+      functionName: `${projectName}-preflight`,
+      runtime: runtime,
+      handler: 'preflight.lambda_handler',
+      code: lambdaCode('preflight'),
+      timeout: cdk.Duration.minutes(5),
+      memorySize: 1024,
+    });
+
+    preflightFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        's3:GetObject',
+        's3:PutObject',
+      ],
+      resources: [
+        `${awsNukeBucket.bucketArn}/*`,
+      ],
+    }));
+
+    preflightFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: ['tag:GetResources'],
+      resources: ['*'],
+    }));
+
+    if (organizationalUnitId) {
+      // The protected resources of a member account are listed with the role in that account
+      preflightFunction.addToRolePolicy(new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        actions: ['sts:AssumeRole'],
+        resources: [`arn:aws:iam::*:role/${memberRoleName}`],
+      }));
+    }
+
+    const logGroupPreflightFunction = new logs.LogGroup(this, 'LogGroupPreflightFunction', {
+      logGroupName: `/aws/lambda/${projectName}-preflight`,
+      retention: logGroupRetentionDays,
+    })
+
     const sendNotificationFunction = new lambda.Function(this, 'SendNotificationFunction', {
       functionName: `${projectName}-send-notification`,
       runtime: runtime,
       handler: 'send_notification.lambda_handler',
-      code: lambda.Code.fromAsset('../lambda'),
+      code: lambdaCode('send_notification'),
       timeout: cdk.Duration.minutes(1),
       memorySize: 256,
       environment: {
         NOTIFICATION_TOPIC_ARN: notificationTopic.topicArn,
+        DIGEST_WINDOW_MINUTES: `${digestWindowMinutes}`,
       },
     });
 
     notificationTopic.grantPublish(sendNotificationFunction);
 
+    // Execution results that wait for the next digest
+    sendNotificationFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        's3:PutObject',
+        's3:DeleteObject',
+      ],
+      resources: [
+        `${awsNukeBucket.bucketArn}/nuke-digest/*`,
+      ],
+    }));
+
     sendNotificationFunction.addToRolePolicy(new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
       actions: [
@@ -157,10 +342,17 @@ export class AwsNukeStack extends cdk.Stack {
         'Regions.$': '$$.Execution.Input.Regions',
         'awsNukeBucket.$': '$$.Execution.Input.awsNukeBucket',
         'cdkBucketPrefix.$': '$$.Execution.Input.cdkBucketPrefix',
+        'DryRunIndexS3Uri.$': '$$.Execution.Input.DryRunIndexS3Uri',
         'TagKey': tagKey,
         'TagValue': tagValue,
         'BlocklistAccounts': blocklistAccounts,
         'ProjectName': projectName,
+        'Partitioning': partitioning,
+        'PartitionConcurrency': partitionConcurrency,
+        'PruneAfterEmptyRuns': pruneAfterEmptyRuns,
+        'FullSweepEvery': fullSweepEvery,
+        'OrganizationalUnitId': organizationalUnitId,
+        'MemberRoleName': memberRoleName,
       }),
       outputPath: '$.Payload',
     });
@@ -169,22 +361,123 @@ export class AwsNukeStack extends cdk.Stack {
       lambdaFunction: nukeExecutorFunction,
       payload: sfn.TaskInput.fromObject({
         'ConfigS3Uri.$': '$.ConfigS3Uri',
-        'AccountId.$': '$$.Execution.Input.AccountId',
+        'PartitionId.$': '$.PartitionId',
+        'AccountId.$': '$.AccountId',
+        'RoleArn.$': '$.RoleArn',
         'DryRun.$': '$$.Execution.Input.DryRun',
         'NukeVersion': nukeVersion,
         'EnforceVersion': enforceVersion,
+        'ShardByRegion': shardByRegion,
+        'ShardConcurrency': shardConcurrency,
+        'Continuation': continuation,
+        'ContinuationToken.$': '$.ContinuationToken',
+        'DeletionWaves': deletionWaves,
+        'RetryAttempts': retryAttempts,
+        'RetryBudgetSeconds': retryBudgetSeconds,
+        'SendNotification.$': '$$.Execution.Input.SendNotification',
+      }),
+      outputPath: '$.Payload',
+    });
+
+    // Every partition result goes in the input of MergeResults, so only the fields that it uses are kept
+    // (not the shards and metrics of the executor), to stay below the payload limit with many partitions
+    const partitionDone = new sfn.Pass(this, 'PartitionDone', {
+      parameters: {
+        'Success.$': '$.Success',
+        'PartitionId.$': '$.PartitionId',
+        'AccountId.$': '$.AccountId',
+        'ConfigS3Uri.$': '$.ConfigS3Uri',
+        'OutputS3Uri.$': '$.OutputS3Uri',
+        'IndexS3Uri.$': '$.IndexS3Uri',
+        'ReportS3Uri.$': '$.ReportS3Uri',
+        'ResourcesToDelete.$': '$.ResourcesToDelete',
+        'DurationSeconds.$': '$.DurationSeconds',
+        'NukeVersion.$': '$.NukeVersion',
+        'Error.$': '$.Error',
+        'PhaseSeconds.$': '$.Metrics.PhaseSeconds',
+      },
+    });
+
+    // With continuation, the executor returns a ContinuationToken while the work of the partition isn't done
+    const checkContinuation = new sfn.Choice(this, 'CheckContinuation')
+      .when(
+        sfn.Condition.and(
+          sfn.Condition.isPresent('$.ContinuationToken'),
+          sfn.Condition.isNotNull('$.ContinuationToken')
+        ),
+        runNuke
+      )
+      .otherwise(partitionDone);
+
+    // The role in a member account can be temporarily unavailable (f.e. a new account), try again a few times
+    runNuke.addRetry({
+      errors: ['AccountAccessError'],
+      interval: cdk.Duration.seconds(30),
+      maxAttempts: 3,
+      backoffRate: 2,
+    });
+
+    // A partition that fails doesn't stop the other partitions (and accounts), it is reported in the notification
+    const partitionFailed = new sfn.Pass(this, 'PartitionFailed', {
+      parameters: {
+        'Success': false,
+        'PartitionId.$': '$.PartitionId',
+        'AccountId.$': '$.AccountId',
+        'Error.$': '$.ErrorInfo.Cause',
+        'OutputS3Uri': 'N/A',
+        'ResourcesToDelete': 0,
+      },
+    });
+
+    runNuke.addCatch(partitionFailed, {
+      errors: ['States.ALL'],
+      resultPath: '$.ErrorInfo',
+    });
+
+    // Every partition of the work is nuked by its own executor, the longest partitions first
+    const runPartitions = new sfn.Map(this, 'RunPartitions', {
+      itemsPath: '$.Partitions',
+      maxConcurrency: partitionConcurrency,
+    });
+    runPartitions.itemProcessor(runNuke.next(checkContinuation));
+
+    const mergeResults = new tasks.LambdaInvoke(this, 'MergeResults', {
+      lambdaFunction: mergeResultsFunction,
+      payload: sfn.TaskInput.fromObject({
+        'Results.$': '$',
+        'awsNukeBucket.$': '$$.Execution.Input.awsNukeBucket',
+        'ExecutionArn.$': '$$.Execution.Id',
+        'StartTime.$': '$$.Execution.StartTime',
+        'Regions.$': '$$.Execution.Input.Regions',
+        'DryRun.$': '$$.Execution.Input.DryRun',
         'SendNotification.$': '$$.Execution.Input.SendNotification',
       }),
       outputPath: '$.Payload',
     });
 
+    // Compare the removed resources with the approved dry-run
+    const reconcile = new tasks.LambdaInvoke(this, 'Reconcile', {
+      lambdaFunction: reconcileFunction,
+      payload: sfn.TaskInput.fromObject({
+        'Result.$': '$',
+        'awsNukeBucket.$': '$$.Execution.Input.awsNukeBucket',
+        'DryRunIndexS3Uri.$': '$$.Execution.Input.DryRunIndexS3Uri',
+      }),
+      outputPath: '$.Payload',
+    });
+
     const sendNotification = new tasks.LambdaInvoke(this, 'SendNotification', {
       lambdaFunction: sendNotificationFunction,
       payload: sfn.TaskInput.fromObject({
         'ExecutionId.$': '$$.Execution.Name',
         'StateMachineArn.$': '$$.StateMachine.Id',
         'ExecutionType': 'EXECUTION_COMPLETE',
+        'awsNukeBucket.$': '$$.Execution.Input.awsNukeBucket',
         'OutputS3Uri.$': '$.OutputS3Uri',
+        'IndexS3Uri.$': '$.IndexS3Uri',
+        'ReportS3Uri.$': '$.ReportS3Uri',
+        'Reconciliation.$': '$.Reconciliation',
+        'Accounts.$': '$.Accounts',
         'ResourcesToDelete.$': '$.ResourcesToDelete',
         'Success.$': '$.Success',
         'DryRun.$': '$$.Execution.Input.DryRun',
@@ -192,6 +485,49 @@ export class AwsNukeStack extends cdk.Stack {
       }),
     });
 
+    // Preflight: the plan may not contain resources with the protected tag. Before an approved execution
+    // the approved dry-run is checked again, the tags can have changed since the dry-run.
+    const preflightPayload = (indexS3Uri: string) => sfn.TaskInput.fromObject({
+      'IndexS3Uri.$': indexS3Uri,
+      'awsNukeBucket.$': '$$.Execution.Input.awsNukeBucket',
+      'AccountId.$': '$$.Execution.Input.AccountId',
+      'Regions.$': '$$.Execution.Input.Regions',
+      'TagKey': tagKey,
+      'TagValue': tagValue,
+      'MemberRoleName': memberRoleName,
+    });
+
+    const preflightExecution = new tasks.LambdaInvoke(this, 'PreflightExecution', {
+      lambdaFunction: preflightFunction,
+      payload: preflightPayload('$$.Execution.Input.DryRunIndexS3Uri'),
+      payloadResponseOnly: true,
+      resultPath: '$.Preflight',
+    });
+
+    const preflightDryRun = new tasks.LambdaInvoke(this, 'PreflightDryRun', {
+      lambdaFunction: preflightFunction,
+      payload: preflightPayload('$.IndexS3Uri'),
+      payloadResponseOnly: true,
+      resultPath: '$.Preflight',
+    });
+
+    const notifyPreflightBlocked = new tasks.LambdaInvoke(this, 'NotifyPreflightBlocked', {
+      lambdaFunction: sendNotificationFunction,
+      payload: sfn.TaskInput.fromObject({
+        'ExecutionId.$': '$$.Execution.Name',
+        'StateMachineArn.$': '$$.StateMachine.Id',
+        'ExecutionType': 'PREFLIGHT_BLOCKED',
+        'Preflight.$': '$.Preflight',
+        'DryRun.$': '$$.Execution.Input.DryRun',
+      }),
+    });
+
+    const preflightBlocked = new sfn.Fail(this, 'PreflightBlocked', {
+      error: 'PreflightBlocked',
+      cause: 'The plan contains resources with the protected tag',
+    });
+    notifyPreflightBlocked.next(preflightBlocked);
+
     const completed = new sfn.Succeed(this, 'Completed');
     const failed = new sfn.Fail(this, 'Failed');
 
@@ -200,7 +536,27 @@ export class AwsNukeStack extends cdk.Stack {
       resultPath: '$.error',
     });
 
-    runNuke.addCatch(failed, {
+    runPartitions.addCatch(failed, {
+      errors: ['States.ALL'],
+      resultPath: '$.error',
+    });
+
+    mergeResults.addCatch(failed, {
+      errors: ['States.ALL'],
+      resultPath: '$.error',
+    });
+
+    reconcile.addCatch(failed, {
+      errors: ['States.ALL'],
+      resultPath: '$.error',
+    });
+
+    preflightExecution.addCatch(failed, {
+      errors: ['States.ALL'],
+      resultPath: '$.error',
+    });
+
+    preflightDryRun.addCatch(failed, {
       errors: ['States.ALL'],
       resultPath: '$.error',
     });
@@ -212,9 +568,37 @@ export class AwsNukeStack extends cdk.Stack {
       )
       .otherwise(sendNotification.next(completed));
 
-    const definition = generateConfig
-      .next(runNuke)
-      .next(checkNotification);
+    const checkPreflightDryRun = new sfn.Choice(this, 'CheckPreflightDryRun')
+      .when(sfn.Condition.booleanEquals('$.Preflight.Blocked', true), notifyPreflightBlocked)
+      .otherwise(checkNotification);
+
+    const checkReconciliation = new sfn.Choice(this, 'CheckReconciliation')
+      .when(
+        sfn.Condition.booleanEquals('$.DryRun', false),
+        reconcile.next(checkNotification)
+      )
+      .otherwise(preflight ? preflightDryRun.next(checkPreflightDryRun) : checkNotification);
+
+    const nukeAndReport = runPartitions
+      .next(mergeResults)
+      .next(checkReconciliation);
+
+    const checkPreflightExecution = new sfn.Choice(this, 'CheckPreflightExecution')
+      .when(sfn.Condition.booleanEquals('$.Preflight.Blocked', true), notifyPreflightBlocked)
+      .otherwise(nukeAndReport);
+
+    // Only an execution is checked before it runs, a dry-run is checked when its plan is there.
+    // An execution without an approved dry-run (f.e. a scheduled execution) is blocked by the preflight.
+    const checkExecution = new sfn.Choice(this, 'CheckExecution')
+      .when(
+        sfn.Condition.booleanEquals('$$.Execution.Input.DryRun', false),
+        preflightExecution.next(checkPreflightExecution)
+      )
+      .otherwise(nukeAndReport);
+
+    const definition = preflight
+      ? generateConfig.next(checkExecution)
+      : generateConfig.next(nukeAndReport);
 
     const stateMachine = new sfn.StateMachine(this, 'NukeWorkflow', {
       stateMachineName: `${projectName}-nuke-workflow`,
@@ -224,6 +608,9 @@ export class AwsNukeStack extends cdk.Stack {
 
     generateConfigFunction.grantInvoke(stateMachine);
     nukeExecutorFunction.grantInvoke(stateMachine);
+    mergeResultsFunction.grantInvoke(stateMachine);
+    reconcileFunction.grantInvoke(stateMachine);
+    preflightFunction.grantInvoke(stateMachine);
     sendNotificationFunction.grantInvoke(stateMachine);
 
     if (scheduleExpression != 'manual') {
@@ -241,6 +628,7 @@ export class AwsNukeStack extends cdk.Stack {
           AccountId: this.account,
           Regions: allowedRegions,
           cdkBucketPrefix: cdkBucketPrefix,
+          DryRunIndexS3Uri: '', // Scheduled executions scan all resource types
           DryRun: false, // Scheduled executions run actual deletion (no approval)
           NukeVersion: nukeVersion,
           EnforceVersion: enforceVersion,
@@ -255,6 +643,24 @@ export class AwsNukeStack extends cdk.Stack {
       });
     }
 
+    if (digestWindowMinutes > 0) {
+
+      // Sends the execution results that were collected in the window as one notification
+      const digestRule = new events.Rule(this, 'NotificationDigestRule', {
+        ruleName: `${projectName}-notification-digest`,
+        description: `Notification digest of the AWS Nuke executions every ${digestWindowMinutes} minutes`,
+        schedule: events.Schedule.rate(cdk.Duration.minutes(digestWindowMinutes)),
+        enabled: true,
+      });
+
+      digestRule.addTarget(new targets.LambdaFunction(sendNotificationFunction, {
+        event: events.RuleTargetInput.fromObject({
+          FlushDigest: true,
+          awsNukeBucket: awsNukeBucketName,
+        }),
+      }));
+    }
+
     // Outputs
     new cdk.CfnOutput(this, 'StateMachineArn', {
       value: stateMachine.stateMachineArn,
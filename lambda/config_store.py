@@ -0,0 +1,57 @@
+import hashlib
+import json
+import yaml
+from typing import Dict, Any
+
+from runtime import LazyClient
+
+s3 = LazyClient('s3')
+
+# Configs are stored under the hash of the inputs they are generated from, so a run with the same
+# inputs as a previous run reuses its config instead of serialising and uploading it again
+CONFIG_PREFIX = 'nuke-configs/sha256'
+
+# Part of every input hash. Increase it when the code that builds a config from its inputs changes,
+# so configs that were stored by the previous code are not reused.
+CONFIG_VERSION = 1
+
+
+def input_hash(inputs: Dict[str, Any]) -> str:
+
+    canonical = json.dumps(dict(inputs, ConfigVersion=CONFIG_VERSION), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def config_key(config_hash: str) -> str:
+
+    return f"{CONFIG_PREFIX}/{config_hash}.yaml"
+
+
+def config_exists(bucket: str, key: str) -> bool:
+
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return False
+        raise
+
+
+def store_config(bucket: str, config_hash: str, config: Dict[str, Any]) -> (str, int):
+    """
+    Upload the config under its hash, unless it is already there. Returns the S3 URI and the uploaded bytes (0 when reused).
+    A config that expired with the bucket lifecycle rule is uploaded again.
+    """
+    key = config_key(config_hash)
+    if config_exists(bucket, key):
+        return f"s3://{bucket}/{key}", 0
+
+    config_yaml = yaml.dump(config, default_flow_style=False)
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=config_yaml,
+        ContentType='application/x-yaml'
+    )
+    return f"s3://{bucket}/{key}", len(config_yaml)
@@ -0,0 +1,92 @@
+import json
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List
+
+from nuke_state import STATE_PREFIX, load_state
+from runtime import LazyClient
+
+s3 = LazyClient('s3')
+
+# A run that doesn't finish within one invocation is continued by the next invocation of the executor,
+# the units that are still to do are stored in a checkpoint in the nuke bucket
+CHECKPOINT_PREFIX = 'checkpoints'
+
+# Stop looping when the work still isn't done after this many invocations
+DEFAULT_MAX_CONTINUATIONS = 20
+
+
+def new_continuation_token(partition_id: str) -> str:
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    return f"{timestamp}-{partition_id}-{uuid.uuid4().hex[:8]}"
+
+
+def load_checkpoint(bucket: str, token: str) -> Dict[str, Any]:
+
+    checkpoint = load_state(bucket, f"{CHECKPOINT_PREFIX}/{token}.json", None)
+    if checkpoint is None:
+        raise Exception(f"No checkpoint found for continuation token {token}")
+
+    return checkpoint
+
+
+def save_checkpoint(bucket: str, token: str, checkpoint: Dict[str, Any]):
+    """
+    Store the checkpoint in the same place as the state objects. Unlike save_state, errors are raised:
+    a continuation token without a checkpoint can't be continued.
+    """
+    checkpoint['UpdatedAt'] = datetime.utcnow().isoformat()
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{STATE_PREFIX}/{CHECKPOINT_PREFIX}/{token}.json",
+        Body=json.dumps(checkpoint, separators=(',', ':'), default=str),
+        ContentType='application/json'
+    )
+
+
+def region_units(nuke_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    The first units of work: one per region, with all resource types of the config.
+    """
+    return [{'Id': region, 'Region': region, 'ResourceTypes': None} for region in nuke_config.get('regions', [])]
+
+
+def all_regions_unit() -> Dict[str, Any]:
+    """
+    A single unit with all regions and resource types of the config.
+    """
+    return {'Id': 'all', 'Region': None, 'ResourceTypes': None}
+
+
+def unit_config(nuke_config: Dict[str, Any], unit: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return the config that only nukes the region and resource types of a unit.
+    """
+    config = dict(nuke_config)
+    if unit['Region'] is not None:
+        config['regions'] = [unit['Region']]
+
+    if unit['ResourceTypes'] is not None:
+        config['resource-types'] = {
+            'includes': unit['ResourceTypes'],
+            'excludes': nuke_config.get('resource-types', {}).get('excludes', [])
+        }
+
+    return config
+
+
+def split_unit(unit: Dict[str, Any], resource_types: List[str]) -> List[Dict[str, Any]]:
+    """
+    Split a unit that didn't finish before the deadline in two halves, so each half has a better chance
+    to finish in the next invocation. resource_types are the resource types of the unit.
+    Returns an empty list when the unit is a single resource type, that can't be split further.
+    """
+    if len(resource_types) < 2:
+        return []
+
+    middle = len(resource_types) // 2
+    return [
+        dict(unit, Id=f"{unit['Id']}.1", ResourceTypes=resource_types[:middle]),
+        dict(unit, Id=f"{unit['Id']}.2", ResourceTypes=resource_types[middle:]),
+    ]
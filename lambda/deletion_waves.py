@@ -0,0 +1,101 @@
+from typing import Dict, Any, List
+
+# Resource types that have to be removed before a resource type can be removed (children before parents).
+# Without this order aws-nuke keeps retrying a parent, f.e. a VPC, until all its children are gone.
+DEPENDENCIES = {
+    # Network
+    'EC2VPC': [
+        'EC2Subnet', 'EC2SecurityGroup', 'EC2RouteTable', 'EC2NetworkACL', 'EC2VPCEndpoint', 'EC2NATGateway',
+        'EC2InternetGatewayAttachment', 'EC2EgressOnlyInternetGateway', 'EC2VPNGatewayAttachment',
+        'EC2TransitGatewayAttachment',
+    ],
+    'EC2Subnet': [
+        'EC2NetworkInterface', 'EC2Instance', 'EC2NATGateway', 'EC2VPCEndpoint', 'ELB', 'ELBv2',
+        'RDSDBSubnetGroup', 'ElastiCacheSubnetGroup', 'EFSMountTarget', 'LambdaFunction',
+    ],
+    'EC2RouteTable': ['EC2Subnet'],
+    'EC2SecurityGroup': ['EC2NetworkInterface', 'EC2Instance', 'ELB', 'ELBv2', 'RDSInstance', 'LambdaFunction', 'EFSMountTarget'],
+    'EC2NetworkInterface': [
+        'EC2Instance', 'EC2NATGateway', 'EC2VPCEndpoint', 'ELB', 'ELBv2', 'RDSInstance', 'LambdaFunction',
+        'EFSMountTarget', 'EKSCluster',
+    ],
+    'EC2InternetGateway': ['EC2InternetGatewayAttachment'],
+    'EC2InternetGatewayAttachment': ['EC2Address', 'EC2NATGateway'],
+    'EC2VPNGateway': ['EC2VPNGatewayAttachment'],
+    'EC2Address': ['EC2Instance', 'EC2NATGateway'],
+    # Compute
+    'EC2Instance': ['AutoScalingGroup', 'EKSNodegroup'],
+    'EC2LaunchTemplate': ['AutoScalingGroup', 'EKSNodegroup'],
+    'EKSCluster': ['EKSNodegroup', 'EKSFargateProfile'],
+    'ECSCluster': ['ECSService'],
+    'ELBv2TargetGroup': ['ELBv2'],
+    # Storage
+    'S3Bucket': ['S3Object', 'S3MultipartUpload'],
+    'EFSFileSystem': ['EFSMountTarget'],
+    'RDSDBCluster': ['RDSInstance'],
+    'RDSDBSubnetGroup': ['RDSInstance', 'RDSDBCluster'],
+    'ElastiCacheSubnetGroup': ['ElastiCacheCacheCluster', 'ElastiCacheReplicationGroup'],
+    # IAM
+    'IAMRole': ['IAMRolePolicy', 'IAMRolePolicyAttachment', 'IAMInstanceProfileRole'],
+    'IAMInstanceProfile': ['IAMInstanceProfileRole'],
+    'IAMPolicy': ['IAMRolePolicyAttachment', 'IAMUserPolicyAttachment', 'IAMGroupPolicyAttachment'],
+    'IAMGroup': ['IAMGroupPolicy', 'IAMGroupPolicyAttachment', 'IAMUserGroupAttachment'],
+    'IAMUser': [
+        'IAMUserPolicy', 'IAMUserPolicyAttachment', 'IAMUserAccessKey', 'IAMLoginProfile', 'IAMUserGroupAttachment',
+        'IAMUserSSHPublicKey', 'IAMSigningCertificate', 'IAMServiceSpecificCredential',
+    ],
+}
+
+
+def wave_numbers(dependencies: Dict[str, List[str]] = None) -> Dict[str, int]:
+    """
+    Return the wave of every resource type in the dependency graph: 0 for resource types without children,
+    otherwise one more than the wave of its last child.
+    """
+    dependencies = DEPENDENCIES if dependencies is None else dependencies
+    waves = {}
+
+    def wave_of(resource_type: str, path: tuple) -> int:
+        if resource_type in waves:
+            return waves[resource_type]
+        if resource_type in path:
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + (resource_type,))}")
+
+        children = dependencies.get(resource_type, [])
+        waves[resource_type] = 1 + max((wave_of(child, path + (resource_type,)) for child in children), default=-1)
+        return waves[resource_type]
+
+    for resource_type in dependencies:
+        wave_of(resource_type, ())
+
+    return waves
+
+
+def plan_waves(resource_types: List[str], dependencies: Dict[str, List[str]] = None) -> List[List[str]]:
+    """
+    Split resource types in waves that are nuked one after the other. Resource types that don't depend
+    on each other are in the same wave, resource types that are not in the graph are in the first wave.
+    Waves without resource types are left out, so the order stays the same when children are excluded.
+    """
+    waves = wave_numbers(dependencies)
+
+    planned = {}
+    for resource_type in resource_types:
+        planned.setdefault(waves.get(resource_type, 0), []).append(resource_type)
+
+    return [planned[wave] for wave in sorted(planned)]
+
+
+def wave_units(units: List[Dict[str, Any]], waves: List[List[str]]) -> List[Dict[str, Any]]:
+    """
+    Split units of work (see continuation.region_units) in one unit per wave, with the resource types of
+    the unit that are in the wave. Wave numbers start at 1.
+    """
+    result = []
+    for number, wave in enumerate(waves, start=1):
+        for unit in units:
+            resource_types = wave if unit['ResourceTypes'] is None else [t for t in wave if t in unit['ResourceTypes']]
+            if resource_types:
+                result.append(dict(unit, Id=f"{unit['Id']}.w{number}", ResourceTypes=resource_types, Wave=number))
+
+    return result
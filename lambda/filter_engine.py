@@ -0,0 +1,343 @@
+import argparse
+import fnmatch
+import functools
+import json
+import re
+import time
+import yaml
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, List, Optional
+
+from nuke_output import resource_key
+from runtime import LazyClient
+from s3_stream import read_json, read_plan_records
+
+s3 = LazyClient('s3')
+
+# Bare string filters are compared with the id of the resource
+ID_PROPERTY = '__id__'
+
+# Filter types that can be written as a regular expression, so all of them can be matched with one regex per property
+PATTERN_TYPES = ('glob', 'regex', 'contains', 'prefix', 'suffix')
+
+DURATION = re.compile(r'(\d+(?:\.\d+)?)(h|m|s)')
+
+
+def filter_pattern(filter_type: str, value: str) -> str:
+
+    if filter_type == 'glob':
+        # aws-nuke matches a glob against the whole value, translate() only anchors the end
+        return rf"\A{fnmatch.translate(value)}"
+    if filter_type == 'regex':
+        return value
+    if filter_type == 'contains':
+        return re.escape(value)
+    if filter_type == 'prefix':
+        return f"^{re.escape(value)}"
+    return f"{re.escape(value)}$"
+
+
+@functools.lru_cache(maxsize=None)
+def compiled_pattern(filter_type: str, value: str) -> re.Pattern:
+    return re.compile(filter_pattern(filter_type, value))
+
+
+def parse_duration(value: str) -> timedelta:
+    """
+    Parse a Go duration as used by dateOlderThan, f.e. 24h or 1h30m.
+    """
+    parts = DURATION.findall(value.lstrip('-+'))
+    if not parts:
+        raise ValueError(f"Invalid duration: {value}")
+
+    seconds = sum(float(amount) * {'h': 3600, 'm': 60, 's': 1}[unit] for amount, unit in parts)
+    return timedelta(seconds=seconds)
+
+
+def parse_timestamp(value: str) -> Optional[datetime]:
+
+    try:
+        timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def normalize_filter(nuke_filter) -> Dict[str, Any]:
+
+    if isinstance(nuke_filter, str):
+        return {'property': ID_PROPERTY, 'type': 'exact', 'value': nuke_filter, 'invert': False}
+
+    return {
+        'property': nuke_filter.get('property', ID_PROPERTY),
+        'type': nuke_filter.get('type', 'exact'),
+        'value': str(nuke_filter.get('value', '')),
+        'invert': str(nuke_filter.get('invert', 'false')).lower() == 'true'
+    }
+
+
+def filter_matches(nuke_filter: Dict[str, Any], value: str, now: datetime) -> bool:
+    """
+    Match one normalized filter against a property value, the slow path for single filters.
+    """
+    filter_type = nuke_filter['type']
+
+    if filter_type == 'exact':
+        matched = value == nuke_filter['value']
+    elif filter_type in PATTERN_TYPES:
+        matched = compiled_pattern(filter_type, nuke_filter['value']).search(value) is not None
+    elif filter_type == 'dateOlderThan':
+        timestamp = parse_timestamp(value)
+        matched = timestamp is not None and timestamp < now - parse_duration(nuke_filter['value'])
+    else:
+        raise ValueError(f"Unsupported filter type: {filter_type}")
+
+    return matched != nuke_filter['invert']
+
+
+class CompiledFilters:
+    """
+    The filters of one resource type (including __global__), grouped by property: exact values in a set,
+    glob, regex, contains, prefix and suffix in one combined regex. Inverted and date filters are matched one by one.
+    """
+
+    def __init__(self, filters: List[Any], now: datetime):
+
+        self.now = now
+        self.filters = [normalize_filter(nuke_filter) for nuke_filter in filters]
+        self.exact = {}
+        self.patterns = {}
+        self.others = []
+
+        patterns = {}
+        for nuke_filter in self.filters:
+            if nuke_filter['invert'] or nuke_filter['type'] not in ('exact',) + PATTERN_TYPES:
+                self.others.append(nuke_filter)
+            elif nuke_filter['type'] == 'exact':
+                self.exact.setdefault(nuke_filter['property'], set()).add(nuke_filter['value'])
+            else:
+                patterns.setdefault(nuke_filter['property'], []).append(filter_pattern(nuke_filter['type'], nuke_filter['value']))
+
+        for prop, property_patterns in patterns.items():
+            try:
+                self.patterns[prop] = [re.compile('|'.join(f"(?:{pattern})" for pattern in property_patterns))]
+            except re.error:
+                # F.e. inline flags are only allowed at the start of a regex
+                self.patterns[prop] = [re.compile(pattern) for pattern in property_patterns]
+
+    def matches(self, record: Dict[str, Any]) -> bool:
+
+        properties = record.get('properties') or {}
+
+        for prop, values in self.exact.items():
+            if self.property_value(record, properties, prop) in values:
+                return True
+
+        for prop, regexes in self.patterns.items():
+            value = self.property_value(record, properties, prop)
+            if any(regex.search(value) for regex in regexes):
+                return True
+
+        return any(
+            filter_matches(nuke_filter, self.property_value(record, properties, nuke_filter['property']), self.now)
+            for nuke_filter in self.others
+        )
+
+    def explain(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Return the first filter that matches the resource, or None.
+        """
+        properties = record.get('properties') or {}
+        return next((
+            nuke_filter for nuke_filter in self.filters
+            if filter_matches(nuke_filter, self.property_value(record, properties, nuke_filter['property']), self.now)
+        ), None)
+
+    @staticmethod
+    def property_value(record: Dict[str, Any], properties: Dict[str, str], prop: str) -> str:
+
+        if prop == ID_PROPERTY:
+            return record['id']
+
+        # aws-nuke compares a missing property as an empty string
+        return properties.get(prop, '')
+
+
+class FilterEngine:
+    """
+    Evaluates an aws-nuke config against resource records (f.e. the plan of a previous run) without AWS calls.
+    A resource is 'excluded' when its region or resource type is not nuked by the config,
+    'filtered' when one of the filters of its account matches, otherwise 'would-remove'.
+    """
+
+    def __init__(self, nuke_config: Dict[str, Any], now: datetime = None):
+
+        self.config = nuke_config
+        self.now = now or datetime.now(timezone.utc)
+        self.regions = set(nuke_config.get('regions') or [])
+        resource_types = nuke_config.get('resource-types') or {}
+        self.includes = set(resource_types.get('includes') or [])
+        self.excludes = resource_types.get('excludes') or []
+        self.accounts = nuke_config.get('accounts') or {}
+        self.compiled = {}
+        self.nuked_types = {}
+
+    def account_filters(self, account_id: str) -> Dict[str, List[Any]]:
+
+        account = self.accounts.get(account_id)
+        if account is None and len(self.accounts) == 1:
+            account = next(iter(self.accounts.values()))
+        account = account or {}
+
+        # Presets are merged into the filters of the account
+        filters = {}
+        for preset in account.get('presets') or []:
+            for resource_type, preset_filters in ((self.config.get('presets') or {}).get(preset, {}).get('filters') or {}).items():
+                filters.setdefault(resource_type, []).extend(preset_filters)
+        for resource_type, type_filters in (account.get('filters') or {}).items():
+            filters.setdefault(resource_type, []).extend(type_filters)
+
+        return filters
+
+    def filters_for(self, account_id: str, resource_type: str) -> CompiledFilters:
+
+        key = (account_id, resource_type)
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            filters = self.account_filters(account_id)
+            compiled = self.compiled[key] = CompiledFilters(filters.get('__global__', []) + filters.get(resource_type, []), self.now)
+
+        return compiled
+
+    def nuked_type(self, resource_type: str) -> bool:
+
+        nuked = self.nuked_types.get(resource_type)
+        if nuked is None:
+            nuked = self.nuked_types[resource_type] = (
+                (not self.includes or resource_type in self.includes)
+                and not any(fnmatch.fnmatchcase(resource_type, exclude) for exclude in self.excludes)
+            )
+
+        return nuked
+
+    def evaluate(self, record: Dict[str, Any]) -> str:
+
+        if (self.regions and record['region'] not in self.regions) or not self.nuked_type(record['type']):
+            return 'excluded'
+
+        if self.filters_for(record.get('account'), record['type']).matches(record):
+            return 'filtered'
+
+        return 'would-remove'
+
+    def explain(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+
+        return self.filters_for(record.get('account'), record['type']).explain(record)
+
+
+def inventory(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    One record per resource. A plan has a record per state change, the first record with properties is kept.
+    """
+    resources = {}
+    for record in records:
+        key = resource_key(record)
+        if key not in resources or (record.get('properties') and not resources[key].get('properties')):
+            resources[key] = record
+
+    return list(resources.values())
+
+
+def compare_configs(old_config: Dict[str, Any], new_config: Dict[str, Any], resources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Evaluate both configs against the resources and return the resources that change state,
+    with the filter that now protects or no longer protects them.
+    """
+    start_time = time.monotonic()
+    old_engine = FilterEngine(old_config)
+    new_engine = FilterEngine(new_config)
+
+    counts = {'old': {}, 'new': {}}
+    changes = []
+    for resource in resources:
+        old_state = old_engine.evaluate(resource)
+        new_state = new_engine.evaluate(resource)
+        counts['old'][old_state] = counts['old'].get(old_state, 0) + 1
+        counts['new'][new_state] = counts['new'].get(new_state, 0) + 1
+
+        if old_state != new_state:
+            engine = new_engine if new_state == 'filtered' else old_engine
+            changes.append({
+                'account': resource.get('account'),
+                'region': resource['region'],
+                'type': resource['type'],
+                'id': resource['id'],
+                'old': old_state,
+                'new': new_state,
+                'filter': engine.explain(resource) if 'filtered' in (old_state, new_state) else None
+            })
+
+    return {
+        'Resources': len(resources),
+        'States': counts,
+        'Changes': changes,
+        'EvaluationSeconds': round(time.monotonic() - start_time, 3)
+    }
+
+
+def read_config(location: str) -> Dict[str, Any]:
+
+    if location.startswith('s3://'):
+        bucket = location.split('/')[2]
+        key = '/'.join(location.split('/')[3:])
+        return yaml.safe_load(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+
+    with open(location) as f:
+        return yaml.safe_load(f)
+
+
+def read_records(location: str) -> Iterable[Dict[str, Any]]:
+    """
+    Read resource records from a summary index (all its plans) or a plan, in S3 or a local file.
+    """
+    if location.endswith('.json') and location.startswith('s3://'):
+        yield from read_plan_records(read_json(location))
+    elif location.endswith('.json'):
+        with open(location) as f:
+            yield from read_plan_records(json.load(f))
+    elif location.startswith('s3://'):
+        yield from read_plan_records({'PlanS3Uris': [location]})
+    else:
+        with open(location) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main(argv: Optional[List[str]] = None):
+
+    parser = argparse.ArgumentParser(description='Show which resources change state when the filters of an aws-nuke config change, without running aws-nuke')
+    parser.add_argument('inventory', help='summary index (nuke-index-*.json) or plan (nuke-plan-*.jsonl) of a previous run, S3 URI or local file')
+    parser.add_argument('old_config', help='current aws-nuke config, S3 URI or local file')
+    parser.add_argument('new_config', help='candidate aws-nuke config, S3 URI or local file')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args(argv)
+
+    resources = inventory(read_records(args.inventory))
+    result = compare_configs(read_config(args.old_config), read_config(args.new_config), resources)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{result['Resources']} resources evaluated in {result['EvaluationSeconds']} seconds")
+    print(f"Old config: {result['States']['old']}")
+    print(f"New config: {result['States']['new']}")
+    for change in result['Changes']:
+        reason = f" ({json.dumps(change['filter'])})" if change['filter'] else ''
+        print(f"{change['region']} - {change['type']} - {change['id']}: {change['old']} -> {change['new']}{reason}")
+
+
+if __name__ == '__main__':
+    main()
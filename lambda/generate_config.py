@@ -1,162 +1,476 @@
 import json
-import boto3
+import os
 import yaml
-from datetime import datetime
 from typing import Dict, Any, List
 
-def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+from config_store import config_key, input_hash, store_config
+from metrics import Metrics
+from nuke_state import load_state
+from organization import DEFAULT_MEMBER_ROLE_NAME, list_ou_accounts, member_role_arn
+from runtime import LazyClient
+from scan_history import load_prunable_resource_types
+
+s3 = LazyClient('s3')
+
+# The excluded resource types and the filters of the protected resources, shipped with the function
+POLICY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nuke_policy.yaml')
+
+# Resource types that are nuked together in one partition when partitioning by resource type.
+# Types that depend on each other (f.e. a VPC and its subnets) must be in the same group.
+# All resource types that are not in a group are nuked in the 'other' partition.
+RESOURCE_TYPE_GROUPS = {
+    'ec2': [
+        'EC2Instance',
+        'EC2Volume',
+        'EC2Snapshot',
+        'EC2Image',
+        'EC2KeyPair',
+        'EC2LaunchTemplate',
+        'EC2Address',
+        'EC2SecurityGroup',
+        'EC2NATGateway',
+        'EC2InternetGateway',
+        'EC2RouteTable',
+        'EC2NetworkACL',
+        'EC2Subnet',
+        'EC2VPCEndpoint',
+        'EC2VPC',
+        'AutoScalingGroup',
+        'ELBv2',
+        'ELBv2TargetGroup',
+        'ELB',
+    ],
+    'storage': [
+        'S3Bucket',
+        'S3Object',
+        'S3MultipartUpload',
+        'DynamoDBTable',
+        'EFSFileSystem',
+        'EFSMountTarget',
+        'RDSInstance',
+        'RDSDBCluster',
+        'RDSSnapshot',
+        'RDSClusterSnapshot',
+    ],
+    'iam': [
+        'IAMRole',
+        'IAMRolePolicy',
+        'IAMRolePolicyAttachment',
+        'IAMPolicy',
+        'IAMUser',
+        'IAMUserPolicy',
+        'IAMUserPolicyAttachment',
+        'IAMUserAccessKey',
+        'IAMGroup',
+        'IAMGroupPolicy',
+        'IAMGroupPolicyAttachment',
+        'IAMInstanceProfile',
+        'IAMInstanceProfileRole',
+    ],
+    'serverless': [
+        'LambdaFunction',
+        'LambdaLayer',
+        'CloudWatchLogsLogGroup',
+        'SNSTopic',
+        'SNSSubscription',
+        'SQSQueue',
+        'SFNStateMachine',
+        'CloudFormationStack',
+    ],
+}
+
+# Partitions without history are expected to take this long
+DEFAULT_PARTITION_DURATION_SECONDS = 120
+
+
+def read_index(index_s3_uri: str) -> Dict[str, Any]:
+
+    bucket = index_s3_uri.split('/')[2]
+    key = '/'.join(index_s3_uri.split('/')[3:])
+
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+
+
+def dry_run_targets(index: Dict[str, Any], regions: List[str], account_id: str) -> Dict[str, List[str]]:
     """
-    Generate AWS Nuke configuration file with protected resources.
-    Upload the config to S3 bucket.
+    Return, per region, the resource types in which an approved dry-run found resources that
+    would be removed in the account. Regions that are not configured are ignored.
     """
-    account_id = event['AccountId']
-    regions = event['Regions']
-    aws_nuke_bucket = event['awsNukeBucket']
-    cdk_bucket_prefix = event['cdkBucketPrefix']
-    tag_key = event['TagKey']
-    tag_value = event['TagValue']
-    blocklist_accounts = event.get('BlocklistAccounts')
-    project_prefix = event.get('ProjectName')
-    
-    nuke_config = {
+    # The index of a run in several accounts has the counts per account. A merged index in which only
+    # one account had resources has AccountId instead, the Regions of that index are of that account only.
+    if 'Accounts' in index:
+        account_regions = index['Accounts'].get(account_id, {})
+    elif index.get('AccountId', account_id) == account_id:
+        account_regions = index.get('Regions', {})
+    else:
+        account_regions = {}
+
+    targets = {}
+    for region, region_types in account_regions.items():
+        if region not in regions:
+            continue
+
+        resource_types = sorted(
+            resource_type for resource_type, counts in region_types.items()
+            if counts.get('would-remove', 0) > 0
+        )
+        if resource_types:
+            targets[region] = resource_types
+
+    print(f"Dry-run found resources in {sum(len(types) for types in targets.values())} resource types in {len(targets)} regions of {account_id}")
+    return targets
+
+
+def group_of(resource_type: str) -> str:
+
+    for group, group_types in RESOURCE_TYPE_GROUPS.items():
+        if resource_type in group_types:
+            return group
+
+    return 'other'
+
+
+def build_partitions(regions: List[str], partitioning: str, targets: Dict[str, List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Split the work in partitions of (region x resource type group).
+    partitioning is one of 'none' (one partition), 'region' or 'region-and-type'.
+    With targets (resource types per region from a dry-run), partitions only contain
+    the targeted regions and resource types.
+    """
+    if targets is not None:
+        regions = [region for region in regions if region in targets]
+        if not regions:
+            return []
+
+    if partitioning == 'none':
+        return [{'PartitionId': 'all', 'Regions': regions, 'ResourceTypeGroup': None}]
+
+    groups = [None]
+    if partitioning == 'region-and-type':
+        groups = list(RESOURCE_TYPE_GROUPS) + ['other']
+
+    partitions = []
+    for region in regions:
+        for group in groups:
+            partition_id = region if group is None else f"{region}-{group}"
+            partition = {'PartitionId': partition_id, 'Regions': [region], 'ResourceTypeGroup': group}
+
+            if targets is not None:
+                partition['ResourceTypes'] = [
+                    resource_type for resource_type in targets[region]
+                    if group is None or group_of(resource_type) == group
+                ]
+                if not partition['ResourceTypes']:
+                    continue
+
+            partitions.append(partition)
+
+    return partitions
+
+
+def partition_config(nuke_config: Dict[str, Any], partition: Dict[str, Any], pruned_types: List[str]) -> Dict[str, Any]:
+    """
+    Return the config of a partition, without the pruned resource types.
+    Returns None when pruning leaves no resource types to scan.
+    """
+    config = dict(nuke_config)
+    config['regions'] = partition['Regions']
+
+    excludes = list(nuke_config['resource-types']['excludes'])
+    group = partition['ResourceTypeGroup']
+
+    if 'ResourceTypes' in partition:
+        includes = partition['ResourceTypes']
+    elif group == 'other':
+        # Everything that isn't part of one of the other groups
+        for group_types in RESOURCE_TYPE_GROUPS.values():
+            excludes.extend(group_types)
+        includes = None
+    elif group is not None:
+        includes = RESOURCE_TYPE_GROUPS[group]
+    else:
+        includes = nuke_config['resource-types'].get('includes')
+
+    if includes is None:
+        config['resource-types'] = {'excludes': excludes + [t for t in pruned_types if t not in excludes]}
+    else:
+        # An empty includes list would mean all resource types
+        includes = [t for t in includes if t not in pruned_types]
+        if not includes:
+            return None
+        config['resource-types'] = {'includes': includes, 'excludes': excludes}
+
+    return config
+
+
+def balance_partitions(partitions: List[Dict[str, Any]], durations: Dict[str, Any], max_concurrency: int) -> List[Dict[str, Any]]:
+    """
+    Order the partitions longest expected duration first, using the durations of previous runs.
+    When the Map state starts the partitions in this order, the long partitions don't end up
+    at the end of the run (longest processing time first scheduling).
+    """
+    known_durations = [history['DurationSeconds'] for history in durations.values()]
+    default_duration = max(known_durations) if known_durations else DEFAULT_PARTITION_DURATION_SECONDS
+
+    for partition in partitions:
+        history = durations.get(partition['PartitionId'])
+        # Partitions without history are expected to be long, so they start early
+        partition['ExpectedDurationSeconds'] = history['DurationSeconds'] if history else default_duration
+
+    partitions.sort(key=lambda partition: partition['ExpectedDurationSeconds'], reverse=True)
+
+    workers = [0.0] * max(max_concurrency, 1)
+    for partition in partitions:
+        index = workers.index(min(workers))
+        workers[index] += partition['ExpectedDurationSeconds']
+
+    print(f"{len(partitions)} partitions, expected wall time with concurrency {len(workers)}: {round(max(workers))} seconds")
+    return partitions
+
+
+def load_policy(path: str = POLICY_PATH) -> Dict[str, Any]:
+    """
+    Read the declarative policy with the excluded resource types and the filters of the protected resources.
+    """
+    with open(path) as f:
+        policy = yaml.safe_load(f)
+
+    print(f"Loaded policy {path} with {len(policy['resource-types']['excludes'])} excluded resource types")
+    return policy
+
+
+def fill_placeholders(value: Any, values: Dict[str, str]) -> Any:
+
+    if isinstance(value, str):
+        return value.format_map(values)
+    if isinstance(value, list):
+        return [fill_placeholders(item, values) for item in value]
+    if isinstance(value, dict):
+        return {key: fill_placeholders(item, values) for key, item in value.items()}
+    return value
+
+
+def build_nuke_config(account_id: str, regions: List[str], aws_nuke_bucket: str, cdk_bucket_prefix: str, tag_key: str, tag_value: str,
+                      blocklist_accounts: List[str], project_prefix: str, policy: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return the AWS Nuke config for one account, with the protected resources of the policy as filters.
+    """
+    values = {
+        'account_id': account_id,
+        'aws_nuke_bucket': aws_nuke_bucket,
+        'cdk_bucket_prefix': cdk_bucket_prefix,
+        'project_prefix': project_prefix,
+        'tag_key': tag_key,
+        'tag_value': tag_value,
+    }
+
+    return {
         'regions': regions,
         'blocklist': blocklist_accounts,
         'resource-types': {
-            'excludes': [
-                # Network interfaces and attachments (removed with parent resources)
-                'EC2NetworkInterface',
-                'EC2DHCPOption', 
-                'EC2InternetGatewayAttachment',
-                
-                # Bedrock issues
-                'BedrockModelCustomizationJob',
-                
-                # Deprecated/unused resource types
-                'CloudSearchDomain',
-                'CodeStarProject',
-                'ElasticTranscoder*',
-                'FMSNotificationChannel',
-                'FMSPolicy',
-                'OpsWorks*',
-                'QLDBLedger',
-                'Lex*',
-                'MachineLearning*',
-                'RoboMaker*',
-                'ShieldProtection*',
-                'AWS::Timestream::*'
-
-                # Add ServiceCatalogTagOption and ServiceCatalogTagOptionPortfolioAttachment
-                # when you don't use ServiceCatalog tag options
-                # to get rid of the "TagOption: Migration not complete" info message
-            ]
+            'excludes': list(policy['resource-types']['excludes'])
         },
         'accounts': {
             account_id: {
-                'filters': {
-                    '__global__': [
-                        {
-                            'property': f'tag:{tag_key}',
-                            'value': tag_value
-                        },
-                        {
-                            'property': 'tag:aws:cloudformation:stack-name',
-                            'value': 'CDKToolkit'
-                        },
-                        {
-                            'property': 'tag:aws:cloudformation:stack-name',
-                            'type': 'glob',
-                            'value': 'StackSet-AWSControlTowerBP-*'
-                        },
-                        {
-                            'property': 'Name',
-                            'type': 'glob',
-                            'value': 'aws-controltower-*'
-                        },
-                        {
-                            'property': 'Name',
-                            'type': 'glob',
-                            'value': 'AWSControlTower*'
-                        },
-                        {
-                            'property': 'Name',
-                            'type': 'glob',
-                            'value': f'{project_prefix}*'
-                        }
-                    ],
-                    'S3Object': [
-                        {
-                            'property': 'Bucket',
-                            'value': aws_nuke_bucket
-                        },
-                        {
-                            'property': 'Bucket',
-                            'type': 'glob',
-                            'value': f'{cdk_bucket_prefix}-*'
-                        }
-                    ],
-                    'SNSTopic': [
-                        {
-                            'property': 'TopicARN',
-                            'type': 'glob',
-                            'value': f'arn:aws:sns:*:{account_id}:aws-controltower-*'
-                        }
-                    ],
-                    'SNSSubscription': [
-                        {
-                            'property': 'TopicARN',
-                            'type': 'glob',
-                            'value': f'arn:aws:sns:*:{account_id}:{project_prefix}-*'
-                        },
-                        {
-                            'property': 'TopicARN',
-                            'type': 'glob',
-                            'value': f'arn:aws:sns:*:{account_id}:aws-controltower-*'
-                        }
-                    ],
-                    'CloudWatchLogsLogGroup': [
-                        {
-                            'property': 'Name',
-                            'type': 'glob',
-                            'value': f'/aws/lambda/{project_prefix}-*'
-                        },
-                        {
-                            'property': 'Name',
-                            'type': 'glob',
-                            'value': f'/aws/lambda/aws-controltower-*'
-                        }
-                    ],
-                    'CloudFormationStack': [
-                        {
-                            'property': 'Name',
-                            'type': 'glob',
-                            'value': 'StackSet-AWSControlTowerBP-*'
-                        }
-                    ]
-                }
+                'filters': fill_placeholders(policy['filters'], values)
             }
         }
     }
-    
-    config_yaml = yaml.dump(nuke_config, default_flow_style=False)
-        
-    s3 = boto3.client('s3')
-    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
-    config_key = f"nuke-configs/nuke-config-{timestamp}.yaml"
-    
-    s3.put_object(
-        Bucket=aws_nuke_bucket,
-        Key=config_key,
-        Body=config_yaml,
-        ContentType='application/x-yaml'
+
+
+def count_upload(metrics: Metrics, uploaded_bytes: int, name: str):
+
+    if uploaded_bytes:
+        metrics.add(f"{name}sUploaded", 1)
+        metrics.add(f"{name}Bytes", uploaded_bytes, 'Bytes')
+    else:
+        metrics.add(f"{name}sReused", 1)
+
+
+def generate_account_config(event: Dict[str, Any], account_id: str, dry_run_index: Dict[str, Any], policy: Dict[str, Any],
+                            organization: bool, metrics: Metrics) -> Dict[str, Any]:
+    """
+    Generate and upload the AWS Nuke config of one account, and split its work in partitions.
+    The config is stored under the hash of its inputs, a config with the same inputs as a previous run is reused.
+    In organization mode the partition ids start with the account id, so they are unique over all accounts.
+    The configs of the partitions are returned in the partitions, they are uploaded later.
+    """
+    regions = event['Regions']
+    aws_nuke_bucket = event['awsNukeBucket']
+    project_prefix = event.get('ProjectName')
+    partitioning = event.get('Partitioning', 'none')
+    prune_after_empty_runs = event.get('PruneAfterEmptyRuns', 0)
+    full_sweep_every = event.get('FullSweepEvery', 10)
+
+    # After approval of a dry-run, only the regions and resource types in which the dry-run
+    # found resources are nuked, instead of scanning all resource types again
+    targets = None
+    config_regions = regions
+    includes = None
+    if dry_run_index is not None:
+        targets = dry_run_targets(dry_run_index, regions, account_id)
+        config_regions = [region for region in regions if region in targets]
+        includes = sorted({
+            resource_type for region_types in targets.values() for resource_type in region_types
+        })
+
+    # Skip resource types that were empty for a number of runs. A targeted config is already
+    # limited to resource types with resources, so it is never pruned.
+    pruned = {}
+    if targets is None:
+        with metrics.phase('LoadScanHistory'):
+            pruned = load_prunable_resource_types(aws_nuke_bucket, account_id, regions, prune_after_empty_runs, full_sweep_every)
+    # The config for all regions can only skip the resource types that are empty in every region
+    pruned_everywhere = sorted(set.intersection(*(set(pruned.get(region, [])) for region in regions))) if pruned else []
+
+    config_hash = input_hash({
+        'AccountId': account_id,
+        'Regions': config_regions,
+        'Bucket': aws_nuke_bucket,
+        'CdkBucketPrefix': event['cdkBucketPrefix'],
+        'TagKey': event['TagKey'],
+        'TagValue': event['TagValue'],
+        'BlocklistAccounts': event.get('BlocklistAccounts'),
+        'ProjectPrefix': project_prefix,
+        'Includes': includes,
+        'PrunedResourceTypes': pruned_everywhere,
+        'Policy': policy,
+    })
+
+    nuke_config = build_nuke_config(
+        account_id,
+        config_regions,
+        aws_nuke_bucket,
+        event['cdkBucketPrefix'],
+        event['TagKey'],
+        event['TagValue'],
+        event.get('BlocklistAccounts'),
+        project_prefix,
+        policy
     )
-    
-    aws_nuke_s3_uri = f"s3://{aws_nuke_bucket}/{config_key}"
-    
-    print(f"Generated AWS Nuke config for project: {project_prefix}")
-    print(f"Config uploaded to: {aws_nuke_s3_uri}")
-    
+    if includes is not None:
+        nuke_config['resource-types']['includes'] = includes
+    nuke_config['resource-types']['excludes'].extend(pruned_everywhere)
+
+    with metrics.phase('UploadConfig'):
+        aws_nuke_s3_uri, uploaded_bytes = store_config(aws_nuke_bucket, config_hash, nuke_config)
+    count_upload(metrics, uploaded_bytes, 'Config')
+
+    print(f"Generated AWS Nuke config for project: {project_prefix}, account: {account_id}")
+    print(f"Config {'uploaded to' if uploaded_bytes else 'reused from'}: {aws_nuke_s3_uri}")
+
+    partitions = build_partitions(regions, partitioning, targets)
+
+    if partitioning != 'none':
+        for partition in partitions:
+            region_pruned = pruned.get(partition['Regions'][0], [])
+            partition['Config'] = partition_config(nuke_config, partition, region_pruned)
+            partition['ConfigHash'] = input_hash({
+                'ConfigHash': config_hash,
+                'Regions': partition['Regions'],
+                'ResourceTypeGroup': partition['ResourceTypeGroup'],
+                'ResourceTypes': partition.get('ResourceTypes'),
+                'ResourceTypeGroups': RESOURCE_TYPE_GROUPS,
+                'PrunedResourceTypes': sorted(region_pruned),
+            })
+        partitions = [partition for partition in partitions if partition['Config'] is not None]
+    elif partitions:
+        partitions[0]['ConfigS3Uri'] = aws_nuke_s3_uri
+
+    if not partitions:
+        print(f"Nothing to nuke in {account_id}: no regions or resource types left to scan")
+
+    for partition in partitions:
+        partition['AccountId'] = account_id
+        if organization:
+            partition['PartitionId'] = account_id if partition['PartitionId'] == 'all' else f"{account_id}-{partition['PartitionId']}"
+
     return {
-        'ConfigFileKey': config_key,
+        'ConfigFileKey': config_key(config_hash),
         'ConfigS3Uri': aws_nuke_s3_uri,
-        'ConfigContent': config_yaml
-    }
\ No newline at end of file
+        'ConfigHash': config_hash,
+        'Partitions': partitions
+    }
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Generate AWS Nuke configuration file with protected resources.
+    Upload the config to S3 bucket, unless a previous run stored a config with the same inputs.
+    In organization mode (OrganizationalUnitId in the event) a config is generated for every account
+    in the organizational unit, and the partitions of all accounts are nuked in one Map state.
+    """
+    account_id = event['AccountId']
+    aws_nuke_bucket = event['awsNukeBucket']
+    blocklist_accounts = event.get('BlocklistAccounts') or []
+    partition_concurrency = event.get('PartitionConcurrency', 1)
+    dry_run_index_s3_uri = event.get('DryRunIndexS3Uri')
+    organizational_unit_id = event.get('OrganizationalUnitId')
+    member_role_name = event.get('MemberRoleName') or DEFAULT_MEMBER_ROLE_NAME
+    metrics = Metrics('generate-config')
+
+    if organizational_unit_id:
+        with metrics.phase('ListAccounts'):
+            # The account with the nuke stack is never nuked in organization mode
+            account_ids = [
+                member_account_id for member_account_id in list_ou_accounts(organizational_unit_id)
+                if member_account_id not in blocklist_accounts and member_account_id != account_id
+            ]
+        print(f"Organization mode: nuking {len(account_ids)} accounts in {organizational_unit_id}")
+    else:
+        account_ids = [account_id]
+
+    dry_run_index = None
+    if dry_run_index_s3_uri:
+        with metrics.phase('LoadDryRunIndex'):
+            dry_run_index = read_index(dry_run_index_s3_uri)
+
+    policy = load_policy()
+    account_configs = [
+        generate_account_config(event, member_account_id, dry_run_index, policy, bool(organizational_unit_id), metrics)
+        for member_account_id in account_ids
+    ]
+    partitions = [partition for account_config in account_configs for partition in account_config['Partitions']]
+
+    if len(partitions) > 1:
+        # The partitions of all accounts share the concurrency of the Map state, so they are balanced together
+        with metrics.phase('BalancePartitions'):
+            durations = load_state(aws_nuke_bucket, 'partition-durations.json', {})
+            partitions = balance_partitions(partitions, durations, partition_concurrency)
+
+    partitions_to_upload = [partition for partition in partitions if 'ConfigS3Uri' not in partition]
+    if partitions_to_upload:
+        with metrics.phase('UploadPartitionConfigs'):
+            for partition in partitions_to_upload:
+                partition['ConfigS3Uri'], uploaded_bytes = store_config(aws_nuke_bucket, partition['ConfigHash'], partition['Config'])
+                count_upload(metrics, uploaded_bytes, 'PartitionConfig')
+
+        print(f"Stored {len(partitions_to_upload)} partition configs, {metrics.counters.get('PartitionConfigsReused', 0)} of them reused")
+
+    metrics.add('Accounts', len(account_ids))
+    metrics.add('Partitions', len(partitions))
+    metrics.emit()
+
+    # In organization mode every account has its own config, they are in Accounts
+    single_config = account_configs[0] if len(account_configs) == 1 and not organizational_unit_id else {}
+
+    return {
+        'ConfigFileKey': single_config.get('ConfigFileKey'),
+        'ConfigS3Uri': single_config.get('ConfigS3Uri'),
+        'ConfigHash': single_config.get('ConfigHash'),
+        'Accounts': [
+            {'AccountId': member_account_id, 'ConfigS3Uri': account_config['ConfigS3Uri']}
+            for member_account_id, account_config in zip(account_ids, account_configs)
+        ],
+        'Partitions': [
+            {
+                'PartitionId': partition['PartitionId'],
+                'ConfigS3Uri': partition['ConfigS3Uri'],
+                'AccountId': partition['AccountId'],
+                'RoleArn': member_role_arn(partition['AccountId'], member_role_name) if organizational_unit_id else None,
+                'ContinuationToken': None,
+            }
+            for partition in partitions
+        ],
+        'Metrics': metrics.to_dict()
+    }
@@ -0,0 +1,293 @@
+import json
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlparse
+
+from nuke_output import merge_summaries
+from nuke_state import load_state, save_state
+from output_archive import ArchiveWriter, is_archive
+from review_report import merge_reports
+from run_ledger import append_run, compact_ledger
+from runtime import LazyClient
+from scan_history import update_scan_history
+from s3_stream import S3MultipartWriter
+
+s3 = LazyClient('s3')
+
+# Weight of the newest duration in the duration history of a partition
+DURATION_SMOOTHING = 0.5
+
+
+def merge_outputs(bucket: str, results: List[Dict[str, Any]], dry_run: bool, suffix: str = '') -> str:
+    """
+    Combine the output files of all partitions in one file, one partition after the other.
+    The files are streamed, so they are never completely in memory.
+    """
+    if any(is_archive(result.get('OutputS3Uri') or '') for result in results):
+        return merge_archives(bucket, results, dry_run, suffix)
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    kind = 'filtered' if dry_run else 'output'
+    writer = S3MultipartWriter(bucket, f"nuke-outputs/nuke-{kind}-{timestamp}-{'dryrun' if dry_run else 'execution'}-merged{suffix}.txt")
+
+    for result in results:
+        output_s3_uri = result.get('OutputS3Uri', '')
+        writer.write(f"===== Partition {result.get('PartitionId')}: {output_s3_uri} =====\n")
+
+        if not output_s3_uri.startswith('s3://') or output_s3_uri.endswith('(upload failed)'):
+            writer.write("No output available\n")
+            continue
+
+        output_bucket, output_key = parse_s3_uri(output_s3_uri)
+        try:
+            response = s3.get_object(Bucket=output_bucket, Key=output_key)
+            for chunk in response['Body'].iter_chunks():
+                writer.write(chunk)
+            writer.write("\n")
+        except Exception as e:
+            print(f"Could not read {output_s3_uri}: {e}")
+            writer.write(f"Could not read output: {e}\n")
+
+    return writer.close()
+
+
+def merge_archives(bucket: str, results: List[Dict[str, Any]], dry_run: bool, suffix: str = '') -> str:
+    """
+    Combine the output archives of all partitions in one archive. The gzip chunks are copied as they are,
+    only the index is rewritten. Outputs that are not an archive (f.e. a download error) are added as text.
+    """
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    archive = ArchiveWriter(S3MultipartWriter(
+        bucket,
+        f"nuke-outputs/nuke-output-{timestamp}-{'dryrun' if dry_run else 'execution'}-merged{suffix}.log.gz",
+        content_type='application/gzip'
+    ))
+
+    for result in results:
+        output_s3_uri = result.get('OutputS3Uri') or ''
+        archive.write_line(f"===== Partition {result.get('PartitionId')}: {output_s3_uri} =====\n")
+
+        if not output_s3_uri.startswith('s3://') or output_s3_uri.endswith('(upload failed)'):
+            archive.write_line("No output available\n")
+            continue
+
+        try:
+            if is_archive(output_s3_uri):
+                archive.append_archive(output_s3_uri)
+            else:
+                output_bucket, output_key = parse_s3_uri(output_s3_uri)
+                response = s3.get_object(Bucket=output_bucket, Key=output_key)
+                for line in response['Body'].iter_lines(keepends=True):
+                    archive.write_line(line.decode('utf-8', errors='replace'))
+        except Exception as e:
+            print(f"Could not read {output_s3_uri}: {e}")
+            archive.write_line(f"Could not read output: {e}\n")
+
+    return archive.close()
+
+
+def merge_review_reports(bucket: str, results: List[Dict[str, Any]], dry_run: bool) -> Optional[str]:
+    """
+    Combine the review reports of the partitions of a dry-run in one index page.
+    """
+    report_s3_uris = [result['ReportS3Uri'] for result in results if result.get('ReportS3Uri')]
+    if not dry_run or not report_s3_uris:
+        return None
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    try:
+        return merge_reports(bucket, report_s3_uris, f"nuke-report-{timestamp}-dryrun-merged")
+    except Exception as e:
+        print(f"Could not merge the review reports: {e}")
+        return None
+
+
+def parse_s3_uri(s3_uri: str) -> (str, str):
+
+    parsed = urlparse(s3_uri)
+    return parsed.netloc, parsed.path.lstrip('/')
+
+
+def read_indexes(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+
+    summaries = []
+    for result in results:
+        index_s3_uri = result.get('IndexS3Uri') or ''
+        if not index_s3_uri.startswith('s3://') or index_s3_uri.endswith('(upload failed)'):
+            continue
+
+        index_bucket, index_key = parse_s3_uri(index_s3_uri)
+        try:
+            response = s3.get_object(Bucket=index_bucket, Key=index_key)
+            summaries.append(json.loads(response['Body'].read()))
+        except Exception as e:
+            print(f"Could not read {index_s3_uri}: {e}")
+
+    return summaries
+
+
+def merge_indexes(bucket: str, summaries: List[Dict[str, Any]], dry_run: bool, suffix: str = '') -> str:
+    """
+    Combine the summary indexes of all partitions in one index. The index refers to the plans of all partitions.
+    """
+    index = merge_summaries(summaries)
+    index['PlanS3Uris'] = [plan for summary in summaries for plan in summary.get('PlanS3Uris', [])]
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    index_key = f"nuke-outputs/nuke-index-{timestamp}-{'dryrun' if dry_run else 'execution'}-merged{suffix}.json"
+    s3.put_object(
+        Bucket=bucket,
+        Key=index_key,
+        Body=json.dumps(index, separators=(',', ':')),
+        ContentType='application/json'
+    )
+
+    return f"s3://{bucket}/{index_key}"
+
+
+def record_durations(bucket: str, results: List[Dict[str, Any]]):
+    """
+    Remember how long every partition took, generate_config uses this to balance the next run.
+    """
+    durations = load_state(bucket, 'partition-durations.json', {})
+
+    for result in results:
+        partition_id = result.get('PartitionId')
+        duration = result.get('DurationSeconds')
+        if partition_id is None or duration is None:
+            continue
+
+        history = durations.get(partition_id)
+        if history:
+            duration = round(DURATION_SMOOTHING * duration + (1 - DURATION_SMOOTHING) * history['DurationSeconds'], 1)
+
+        durations[partition_id] = {
+            'DurationSeconds': duration,
+            'UpdatedAt': datetime.utcnow().isoformat()
+        }
+
+    save_state(bucket, 'partition-durations.json', durations)
+
+
+def summarize_accounts(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Combine the results of the partitions per account, for the notification.
+    """
+    accounts = {}
+    for result in results:
+        account = accounts.setdefault(result.get('AccountId'), {
+            'AccountId': result.get('AccountId'),
+            'Success': True,
+            'ResourcesToDelete': 0,
+            'Errors': []
+        })
+        account['Success'] = account['Success'] and result.get('Success', False)
+        account['ResourcesToDelete'] += result.get('ResourcesToDelete', 0)
+        if result.get('Error'):
+            account['Errors'].append(result['Error'])
+
+    return list(accounts.values())
+
+
+def s3_key(s3_uri: str) -> Optional[str]:
+
+    if not s3_uri or not s3_uri.startswith('s3://') or s3_uri.endswith('(upload failed)'):
+        return None
+
+    return parse_s3_uri(s3_uri)[1]
+
+
+def ledger_record(event: Dict[str, Any], results: List[Dict[str, Any]], summaries: List[Dict[str, Any]],
+                  response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compact summary of the run for the run ledger.
+    """
+    phase_seconds = {}
+    for result in results:
+        for phase, seconds in (result.get('PhaseSeconds') or {}).items():
+            phase_seconds[phase] = round(phase_seconds.get(phase, 0) + seconds, 3)
+
+    return {
+        'ExecutionArn': event.get('ExecutionArn'),
+        'StartedAt': event.get('StartTime'),
+        'FinishedAt': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'Mode': 'dry-run' if response['DryRun'] else 'execution',
+        'NukeVersion': response['NukeVersion'],
+        'Regions': event.get('Regions') or sorted({region for summary in summaries for region in summary.get('Regions', {})}),
+        'Accounts': [account['AccountId'] for account in response['Accounts']],
+        'Partitions': len(results),
+        'ResourcesToDelete': response['ResourcesToDelete'],
+        'States': merge_summaries(summaries)['States'],
+        'DurationSeconds': round(sum(result.get('DurationSeconds') or 0 for result in results), 1),
+        'PhaseSeconds': phase_seconds,
+        'Success': response['Success'],
+        'Error': response['Error'][:1000],
+        'Artifacts': {
+            'Output': s3_key(response['OutputS3Uri']),
+            'Index': s3_key(response['IndexS3Uri']),
+            'Configs': sorted({key for key in (s3_key(result.get('ConfigS3Uri')) for result in results) if key})
+        }
+    }
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Merge the results of the partitions that ran in parallel in one result,
+    with the same fields as the result of the nuke executor.
+    """
+    print(f"Lambda event: {json.dumps(event, default=str)}")
+
+    results = event['Results']
+    bucket = event['awsNukeBucket']
+    dry_run = event.get('DryRun', True)
+    send_notification = event.get('SendNotification', True)
+
+    summaries = read_indexes(results)
+
+    if len(results) == 1:
+        output_s3_uri = results[0].get('OutputS3Uri', 'N/A')
+        index_s3_uri = results[0].get('IndexS3Uri')
+        report_s3_uri = results[0].get('ReportS3Uri')
+    else:
+        output_s3_uri = merge_outputs(bucket, results, dry_run)
+        index_s3_uri = merge_indexes(bucket, summaries, dry_run)
+        report_s3_uri = merge_review_reports(bucket, results, dry_run)
+
+    errors = [f"{result.get('PartitionId')}: {result['Error']}" for result in results if result.get('Error')]
+
+    record_durations(bucket, results)
+    update_scan_history(bucket, summaries)
+
+    response = {
+        'Success': all(result.get('Success', False) for result in results),
+        'OutputS3Uri': output_s3_uri,
+        'IndexS3Uri': index_s3_uri,
+        'ReportS3Uri': report_s3_uri,
+        'ResourcesToDelete': sum(result.get('ResourcesToDelete', 0) for result in results),
+        'DryRun': dry_run,
+        'NukeVersion': next((result['NukeVersion'] for result in results if result.get('NukeVersion')), None),
+        'Error': '; '.join(errors),
+        'SendNotification': send_notification,
+        'Reconciliation': None,
+        'Accounts': summarize_accounts(results),
+        'Partitions': [
+            {
+                'PartitionId': result.get('PartitionId'),
+                'AccountId': result.get('AccountId'),
+                'Success': result.get('Success', False),
+                'ResourcesToDelete': result.get('ResourcesToDelete', 0),
+                'DurationSeconds': result.get('DurationSeconds')
+            }
+            for result in results
+        ]
+    }
+
+    # The run ledger must not fail the run
+    try:
+        append_run(bucket, ledger_record(event, results, summaries, response))
+        compact_ledger(bucket)
+    except Exception as e:
+        print(f"Could not update the run ledger: {e}")
+
+    print(f"Returning response: {json.dumps(response, default=str)}")
+    return response
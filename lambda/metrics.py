@@ -0,0 +1,132 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# Metrics are written to the log in CloudWatch Embedded Metric Format (EMF),
+# CloudWatch extracts them from the log, no PutMetricData calls are needed
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AwsNuke')
+
+# CloudWatch accepts at most 100 metrics in one EMF document
+MAX_METRICS_PER_DOCUMENT = 100
+
+# Only the slowest resource types are returned in the Lambda response, all of them are in the log
+MAX_RESOURCE_TYPES_IN_RESPONSE = 10
+
+# Every value of the ResourceType dimension is a custom metric, so only the slowest resource types get one.
+# The scan durations of all resource types are a property of the log line, without metrics.
+MAX_RESOURCE_TYPE_METRICS = 10
+
+
+class Metrics:
+    """
+    Collects the duration of the phases of a Lambda function, counters (bytes, lines) and
+    the scan duration per resource type. emit() prints them as EMF log lines,
+    to_dict() returns them for the Lambda response.
+    The scan duration of a resource type is an estimate: the time between the first and the last line of
+    aws-nuke about the resource type, not a measured listing time. A resource type with one line gets 0.
+    """
+
+    def __init__(self, function: str):
+
+        self.function = function
+        self.phases = {}
+        self.counters = {}
+        self.units = {}
+        self.scan_seconds = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time the code in the with block. A phase that runs more than once is added up.
+        """
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.monotonic() - start_time
+
+    def add(self, name: str, value: float, unit: str = 'Count'):
+
+        self.counters[name] = self.counters.get(name, 0) + value
+        self.units[name] = unit
+
+    def add_scan_seconds(self, scan_seconds: Dict[str, Dict[str, float]]):
+        """
+        Add the scan duration per region and resource type (ScanSeconds of the summary index).
+        A resource type is scanned in every region in parallel, so the slowest region counts.
+        """
+        for region_seconds in scan_seconds.values():
+            for resource_type, seconds in region_seconds.items():
+                self.scan_seconds[resource_type] = max(seconds, self.scan_seconds.get(resource_type, 0))
+
+    def slowest_resource_types(self, count: int) -> list:
+
+        return sorted(self.scan_seconds.items(), key=lambda item: item[1], reverse=True)[:count]
+
+    def emf_documents(self) -> list:
+
+        timestamp = int(time.time() * 1000)
+
+        values = {f"{name}Seconds": round(seconds, 3) for name, seconds in self.phases.items()}
+        units = {name: 'Seconds' for name in values}
+        values.update(self.counters)
+        units.update(self.units)
+
+        documents = []
+        names = list(values)
+        for start in range(0, len(names), MAX_METRICS_PER_DOCUMENT):
+            chunk = names[start:start + MAX_METRICS_PER_DOCUMENT]
+            document = {
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': METRICS_NAMESPACE,
+                        'Dimensions': [['Function']],
+                        'Metrics': [{'Name': name, 'Unit': units[name]} for name in chunk]
+                    }]
+                },
+                'Function': self.function
+            }
+            document.update({name: values[name] for name in chunk})
+            documents.append(document)
+
+        if self.scan_seconds and documents:
+            documents[0]['ScanSecondsByResourceType'] = {
+                resource_type: round(seconds, 3) for resource_type, seconds in sorted(self.scan_seconds.items())
+            }
+
+        # ScanSeconds of the slowest resource types, with the resource type as dimension.
+        # EMF takes the dimension value from the document, so every resource type has its own document.
+        for resource_type, seconds in self.slowest_resource_types(MAX_RESOURCE_TYPE_METRICS):
+            documents.append({
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': METRICS_NAMESPACE,
+                        'Dimensions': [['Function', 'ResourceType']],
+                        'Metrics': [{'Name': 'ScanSeconds', 'Unit': 'Seconds'}]
+                    }]
+                },
+                'Function': self.function,
+                'ResourceType': resource_type,
+                'ScanSeconds': seconds
+            })
+
+        return documents
+
+    def emit(self):
+        """
+        Print the metrics as EMF, one JSON document per line.
+        """
+        for document in self.emf_documents():
+            print(json.dumps(document, separators=(',', ':')))
+
+    def to_dict(self) -> Dict[str, Any]:
+
+        return {
+            'PhaseSeconds': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            'Counters': dict(self.counters),
+            'SlowestResourceTypes': dict(self.slowest_resource_types(MAX_RESOURCE_TYPES_IN_RESPONSE))
+        }
@@ -0,0 +1,199 @@
+import json
+from typing import Dict, Any, List, Tuple
+
+from nuke_output import add_sample
+from runtime import LazyClient
+
+s3 = LazyClient('s3')
+
+# SNS accepts messages up to 256 KB and subjects shorter than 100 characters.
+# Some room is left for the footer that SNS adds to email notifications.
+MAX_MESSAGE_BYTES = 250 * 1024
+MAX_SUBJECT_CHARS = 99
+TRUNCATED = '\n[Message truncated to the SNS size limit]\n'
+
+# Lines per section before truncation, a digest should be readable in an email
+TOP_RESOURCE_TYPES = 15
+TOP_REGIONS = 20
+SAMPLE_RESOURCE_TYPES = 10
+
+# Execution results that wait for the next digest
+PENDING_PREFIX = 'nuke-digest/pending/'
+
+
+def build_digest(index: Dict[str, Any], state: str) -> Dict[str, Any]:
+    """
+    Compact digest of a summary index: the resources in state per resource type, region and account,
+    and sample resource names. Only the summary index is needed, not the plan or the output.
+    """
+    resource_types = {
+        resource_type: counts[state]
+        for resource_type, counts in index.get('ResourceTypes', {}).items() if counts.get(state)
+    }
+
+    regions = {}
+    for region, region_types in index.get('Regions', {}).items():
+        count = sum(counts.get(state, 0) for counts in region_types.values())
+        if count:
+            regions[region] = count
+
+    accounts = {}
+    for account_id, account_regions in (index.get('Accounts') or {}).items():
+        count = sum(counts.get(state, 0) for region_types in account_regions.values() for counts in region_types.values())
+        if count:
+            accounts[account_id] = count
+
+    return {
+        'State': state,
+        'Total': index.get('States', {}).get(state, 0),
+        'ResourceTypes': resource_types,
+        'Regions': regions,
+        'Accounts': accounts,
+        'Samples': {resource_type: names for resource_type, names in index.get('Samples', {}).items() if resource_type in resource_types},
+    }
+
+
+def merge_digests(digests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine the digests of several executions, f.e. of different accounts.
+    """
+    merged = {'Total': 0, 'ResourceTypes': {}, 'Regions': {}, 'Accounts': {}, 'Samples': {}}
+
+    for digest in digests:
+        merged['Total'] += digest.get('Total', 0)
+        for name in ('ResourceTypes', 'Regions', 'Accounts'):
+            for key, count in digest.get(name, {}).items():
+                merged[name][key] = merged[name].get(key, 0) + count
+        for resource_type, names in digest.get('Samples', {}).items():
+            for sample in names:
+                add_sample(merged['Samples'].setdefault(resource_type, []), sample)
+
+    return merged
+
+
+def top_lines(counts: Dict[str, int], top: int, label: str) -> List[str]:
+
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    lines = [f"- {name}: {count}" for name, count in ranked[:top]]
+    if len(ranked) > top:
+        lines.append(f"- ... {len(ranked) - top} more {label} with {sum(count for _, count in ranked[top:])} resources")
+    return lines
+
+
+def digest_sections(digest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Sections of the digest text. When the message is too large, sections with a lower Priority are shortened first.
+    """
+    sections = [
+        {'Title': 'Resource types:', 'Lines': top_lines(digest['ResourceTypes'], TOP_RESOURCE_TYPES, 'resource types'), 'Priority': 3},
+        {'Title': 'Regions:', 'Lines': top_lines(digest['Regions'], TOP_REGIONS, 'regions'), 'Priority': 2},
+    ]
+
+    if len(digest.get('Accounts', {})) > 1:
+        sections.append({'Title': 'Accounts:', 'Lines': top_lines(digest['Accounts'], len(digest['Accounts']), 'accounts'), 'Priority': 2})
+
+    top_types = sorted(digest['ResourceTypes'], key=lambda resource_type: -digest['ResourceTypes'][resource_type])
+    samples = [
+        f"- {resource_type}: {', '.join(digest['Samples'][resource_type])}"
+        for resource_type in top_types[:SAMPLE_RESOURCE_TYPES] if digest['Samples'].get(resource_type)
+    ]
+    if samples:
+        sections.append({'Title': 'Examples:', 'Lines': samples, 'Priority': 1})
+
+    return [section for section in sections if section['Lines']]
+
+
+def render_sections(sections: List[Dict[str, Any]], shown: List[int]) -> str:
+
+    text = ''
+    for section, count in zip(sections, shown):
+        lines = section['Lines'][:count]
+        if count < len(section['Lines']):
+            lines.append(f"- ... {len(section['Lines']) - count} more lines left out to stay under the SNS size limit")
+        text += section['Title'] + '\n' + '\n'.join(lines) + '\n\n'
+
+    return text
+
+
+def format_sections(sections: List[Dict[str, Any]], max_bytes: int) -> str:
+    """
+    Render the sections in at most max_bytes. The section with the lowest Priority (and then the most lines)
+    is halved until the text fits, so the important sections keep their lines the longest.
+    """
+    shown = [len(section['Lines']) for section in sections]
+    text = render_sections(sections, shown)
+
+    while len(text.encode('utf-8')) > max_bytes:
+        candidates = [i for i in range(len(sections)) if shown[i] > 0]
+        if not candidates:
+            break
+        i = min(candidates, key=lambda i: (sections[i]['Priority'], -shown[i]))
+        shown[i] //= 2
+        text = render_sections(sections, shown)
+
+    return text
+
+
+def fit_message(message: str, sections: List[Dict[str, Any]] = None, digest_text: str = '', max_bytes: int = MAX_MESSAGE_BYTES) -> str:
+    """
+    Keep the message under max_bytes. The digest_text in the message is rendered again from its sections
+    in the bytes that the rest of the message leaves, as a last resort the message is cut.
+    """
+    size = len(message.encode('utf-8'))
+    if size > max_bytes and sections and digest_text:
+        budget = max_bytes - (size - len(digest_text.encode('utf-8')))
+        message = message.replace(digest_text, format_sections(sections, max(budget, 0)), 1)
+
+    encoded = message.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return message
+
+    return encoded[:max_bytes - len(TRUNCATED.encode('utf-8'))].decode('utf-8', 'ignore') + TRUNCATED
+
+
+def fit_subject(subject: str) -> str:
+
+    subject = ' '.join(subject.split())
+    return subject if len(subject) <= MAX_SUBJECT_CHARS else subject[:MAX_SUBJECT_CHARS - 3] + '...'
+
+
+def queue_result(bucket: str, entry: Dict[str, Any]) -> str:
+    """
+    Store the result of an execution for the next digest. The key starts with the finish time, so entries sort by time.
+    """
+    key = f"{PENDING_PREFIX}{entry['FinishedAt']}-{entry['ExecutionId']}.json"
+
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(entry, separators=(',', ':'), default=str),
+        ContentType='application/json'
+    )
+    return key
+
+
+def pending_results(bucket: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Return the key and the entry of every execution result that waits for the digest, oldest first.
+    """
+    keys = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=PENDING_PREFIX):
+        keys.extend(item['Key'] for item in page.get('Contents', []))
+
+    entries = []
+    for key in sorted(keys):
+        response = s3.get_object(Bucket=bucket, Key=key)
+        entries.append((key, json.loads(response['Body'].read())))
+
+    return entries
+
+
+def delete_results(bucket: str, keys: List[str]):
+
+    # DeleteObjects accepts 1000 keys per request
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+        )
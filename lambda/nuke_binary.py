@@ -0,0 +1,403 @@
+import json
+import functools
+import hashlib
+import os
+import re
+import subprocess
+import tarfile
+import time
+from typing import Dict, Any, List
+
+from metrics import Metrics
+from nuke_state import load_state, save_state
+from runtime import LazyClient
+
+s3 = LazyClient('s3')
+
+# Can be changed to use a mirror of the GitHub releases
+GITHUB_RELEASES_URL = os.environ.get('GITHUB_RELEASES_URL', 'https://github.com/ekristen/aws-nuke/releases')
+
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com/repos/ekristen/aws-nuke')
+
+# The latest release is looked up on GitHub at most once per TTL, in between the manifest in the nuke bucket is used
+VERSION_MANIFEST = 'version-manifest.json'
+VERSION_CACHE_TTL_SECONDS = int(os.environ.get('VERSION_CACHE_TTL_SECONDS', 3600))
+
+BINARY_CACHE_PREFIX = 'nuke-binaries'
+WORK_DIR = os.environ.get('NUKE_WORK_DIR', '/tmp')
+CHUNK_SIZE = 1024 * 1024
+
+# A binary that is installed next to the code (f.e. in the image of the standalone runner) is used as it is
+INSTALLED_BINARY = os.environ.get('NUKE_BINARY_PATH')
+
+
+class HashingReader:
+    """
+    Wraps a stream and calculates the sha256 of everything that is read from it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.sha256.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def drain(self):
+        while self.read(CHUNK_SIZE):
+            pass
+
+
+def parse_version(tag: str) -> tuple:
+    """
+    Convert a tag like v3.62.2 or v3.63.0-beta.1 to a tuple that sorts in semantic version order.
+    A release sorts after its pre-releases.
+    """
+    version, _, prerelease = tag.lstrip('v').partition('-')
+    version = version.split('+')[0]
+
+    numbers = tuple(int(part) if part.isdigit() else 0 for part in version.split('.'))
+    numbers = (numbers + (0, 0, 0))[:3]
+
+    if not prerelease:
+        return numbers + (1, ())
+
+    prerelease_parts = tuple(
+        (0, int(part), '') if part.isdigit() else (1, 0, part)
+        for part in prerelease.split('.')
+    )
+    return numbers + (0, prerelease_parts)
+
+
+def fetch_latest_version(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ask GitHub for the latest release. When the manifest contains an ETag, the request is conditional
+    and GitHub answers 304 Not Modified when the latest release didn't change.
+    Returns the new manifest.
+    """
+    headers = {
+        'User-Agent': 'AWS-Nuke-Lambda-Executor/1.0',
+        'Accept': 'application/vnd.github.v3+json'
+    }
+    if manifest.get('ETag'):
+        headers['If-None-Match'] = manifest['ETag']
+
+    # Only needed when GitHub is asked, most invocations use the manifest and the cached binary
+    import urllib.error
+    import urllib.request
+
+    print("Attempting to fetch latest AWS Nuke version from GitHub...")
+    request = urllib.request.Request(f"{GITHUB_API_URL}/releases/latest", headers=headers)
+
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            release_data = json.loads(response.read().decode())
+            return {
+                'LatestVersion': release_data['tag_name'],
+                'ETag': response.headers.get('ETag'),
+                'CheckedAt': time.time()
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and manifest.get('LatestVersion'):
+            print("Latest release didn't change since the last check")
+            return dict(manifest, CheckedAt=time.time())
+        raise
+
+
+def determine_version(nuke_version: str, enforce_version: bool, bucket: str) -> str:
+    """
+    Use the latest release of AWS Nuke when it is newer than nuke_version, unless the version is enforced.
+    The latest release is cached in the nuke bucket, GitHub is only asked after the cache expired.
+    """
+    version_to_use = nuke_version
+    print(f"AWS Nuke version: {version_to_use}")
+
+    if enforce_version:
+        if not version_to_use:
+            raise Exception("NukeVersion is required when the version is enforced")
+        return version_to_use
+
+    manifest = load_state(bucket, VERSION_MANIFEST, {})
+    age = time.time() - manifest.get('CheckedAt', 0)
+
+    # A failed check is cached as well, so GitHub is not asked (and its timeout not waited for) on every invocation
+    if age < VERSION_CACHE_TTL_SECONDS:
+        print(f"Using cached latest version, checked {int(age)} seconds ago")
+    else:
+        try:
+            manifest = fetch_latest_version(manifest)
+        except Exception as e:
+            print(f"Could not fetch latest version: {e}")
+            manifest = dict(manifest, CheckedAt=time.time())
+        save_state(bucket, VERSION_MANIFEST, manifest)
+
+    fetched_version = manifest.get('LatestVersion')
+    if fetched_version:
+        print(f"Latest version available: {fetched_version}")
+        # Only use if it's newer than our fallback
+        if not version_to_use or parse_version(fetched_version) >= parse_version(version_to_use):
+            version_to_use = fetched_version
+            print(f"Using latest version: {version_to_use}")
+    else:
+        print(f"Latest version unknown, using fallback {version_to_use}")
+
+    if not version_to_use:
+        raise Exception("No AWS Nuke version to download: NukeVersion is not set and the latest release is unknown")
+
+    return version_to_use
+
+
+def log_aws_nuke_version(nuke_binary_path: str) -> str:
+
+    print("Get aws-nuke version...")
+    version_result = subprocess.run([nuke_binary_path, '--version'], 
+                                    capture_output=True, text=True, timeout=10)
+    version_info = version_result.stdout.strip() or version_result.stderr.strip()
+    print(f"AWS Nuke version: {version_info}")
+
+    return version_info
+
+
+def installed_binary(nuke_version: str, enforce_version: bool) -> (str, str):
+    """
+    Return the path and the version of the installed binary. An enforced version has to match.
+    """
+    match = re.search(r'v?\d+\.\d+\.\d+\S*', log_aws_nuke_version(INSTALLED_BINARY))
+    if match is None:
+        raise Exception(f"Could not determine the version of {INSTALLED_BINARY}")
+
+    version = f"v{match.group(0).lstrip('v')}"
+    if enforce_version and nuke_version and version != f"v{nuke_version.lstrip('v')}":
+        raise Exception(f"Installed AWS Nuke {version} is not the enforced version {nuke_version}")
+
+    print(f"Nuke binary path: {INSTALLED_BINARY}")
+    return INSTALLED_BINARY, version
+
+
+@functools.lru_cache(maxsize=None)
+def list_resource_types(nuke_binary_path: str) -> List[str]:
+    """
+    Return all resource types that this version of AWS Nuke knows.
+    The result is cached, the binary doesn't change while the container lives.
+    """
+    result = subprocess.run([nuke_binary_path, 'resource-types'], capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise Exception(f"aws-nuke resource-types exited with code {result.returncode}: {result.stderr.strip()}")
+
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+
+def local_binary_path(version: str) -> str:
+    return os.path.join(WORK_DIR, f"aws-nuke-{version}")
+
+
+def install_binary(temp_path: str, nuke_binary_path: str, binary_sha256: str):
+    """
+    Make the binary executable and move it to its final place. The marker file is written last,
+    a binary without marker is never used.
+    """
+    os.chmod(temp_path, 0o755)
+    os.replace(temp_path, nuke_binary_path)
+
+    with open(f"{nuke_binary_path}.sha256", 'w') as f:
+        f.write(binary_sha256)
+
+
+def find_local_binary(version: str) -> str:
+    """
+    A warm Lambda container can reuse the binary in the work dir, but only when it is the requested version.
+    """
+    nuke_binary_path = local_binary_path(version)
+
+    if os.path.exists(f"{nuke_binary_path}.sha256") and os.access(nuke_binary_path, os.X_OK):
+        print(f"AWS Nuke binary {version} already exists in {WORK_DIR}")
+        return nuke_binary_path
+
+    return None
+
+
+def download_from_cache(bucket: str, version: str) -> str:
+    """
+    Get the binary from the cache in the nuke bucket. The sha256 of the binary is verified.
+    """
+    try:
+        response = s3.get_object(Bucket=bucket, Key=f"{BINARY_CACHE_PREFIX}/{version}/manifest.json")
+        manifest = json.loads(response['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        print(f"AWS Nuke {version} is not in the binary cache")
+        return None
+
+    print(f"Downloading AWS Nuke {version} from s3://{bucket}/{manifest['BinaryKey']}")
+
+    nuke_binary_path = local_binary_path(version)
+    temp_path = f"{nuke_binary_path}.download"
+    sha256 = hashlib.sha256()
+
+    response = s3.get_object(Bucket=bucket, Key=manifest['BinaryKey'])
+    with open(temp_path, 'wb') as f:
+        for chunk in response['Body'].iter_chunks(CHUNK_SIZE):
+            sha256.update(chunk)
+            f.write(chunk)
+
+    if sha256.hexdigest() != manifest['BinarySha256']:
+        os.remove(temp_path)
+        print("Checksum of cached binary doesn't match manifest, ignoring the cache")
+        return None
+
+    install_binary(temp_path, nuke_binary_path, manifest['BinarySha256'])
+    return nuke_binary_path
+
+
+def get_release_checksum(version: str, tarball_name: str) -> str:
+
+    import urllib.request
+
+    checksums_url = f"{GITHUB_RELEASES_URL}/download/{version}/checksums.txt"
+    print(f"Downloading checksums from: {checksums_url}")
+
+    request = urllib.request.Request(
+        checksums_url,
+        headers={'User-Agent': 'AWS-Nuke-Lambda-Executor/1.0'}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        for line in response.read().decode().splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1] == tarball_name:
+                return parts[0]
+
+    raise Exception(f"No checksum found for {tarball_name}")
+
+
+def is_nuke_binary(member: tarfile.TarInfo) -> bool:
+    return member.isfile() and os.path.basename(member.name).startswith('aws-nuke')
+
+
+def download_from_github(version: str) -> (str, str, str):
+    """
+    Download the release tarball from GitHub and extract the binary while the tarball is streaming in,
+    the tarball is never stored completely in memory or on disk. The sha256 of the tarball is
+    verified against the checksum file of the release.
+    Returns the path of the binary, the sha256 of the tarball and the sha256 of the binary.
+    """
+    import urllib.request
+
+    tarball_name = f"aws-nuke-{version}-linux-amd64.tar.gz"
+    expected_sha256 = get_release_checksum(version, tarball_name)
+
+    download_url = f"{GITHUB_RELEASES_URL}/download/{version}/{tarball_name}"
+    print(f"Downloading from: {download_url}")
+
+    nuke_binary_path = local_binary_path(version)
+    temp_path = f"{nuke_binary_path}.download"
+    binary_sha256 = None
+
+    request = urllib.request.Request(
+        download_url,
+        headers={'User-Agent': 'AWS-Nuke-Lambda-Executor/1.0'}
+    )
+    with urllib.request.urlopen(request, timeout=60) as download_response:
+        if download_response.getcode() != 200:
+            raise Exception(f"Download failed with status code: {download_response.getcode()}")
+
+        reader = HashingReader(download_response)
+        with tarfile.open(fileobj=reader, mode='r|gz') as tar:
+            for member in tar:
+                print(f"  - {member.name} ({member.size} bytes)")
+                if binary_sha256 is None and is_nuke_binary(member):
+                    sha256 = hashlib.sha256()
+                    source = tar.extractfile(member)
+                    with open(temp_path, 'wb') as f:
+                        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                            sha256.update(chunk)
+                            f.write(chunk)
+                    binary_sha256 = sha256.hexdigest()
+                    print(f"Extracted {member.name} to {temp_path}")
+
+        # The checksum is calculated over the complete tarball, including the padding after the last member
+        reader.drain()
+
+    print(f"Downloaded {reader.bytes_read} bytes")
+    tarball_sha256 = reader.sha256.hexdigest()
+
+    if binary_sha256 is None:
+        raise Exception("No aws-nuke binary found in archive")
+
+    if tarball_sha256 != expected_sha256:
+        os.remove(temp_path)
+        raise Exception(f"Checksum mismatch for {tarball_name}: expected {expected_sha256}, got {tarball_sha256}")
+
+    print(f"Checksum verified: {tarball_sha256}")
+    install_binary(temp_path, nuke_binary_path, binary_sha256)
+
+    return nuke_binary_path, tarball_sha256, binary_sha256
+
+
+def upload_to_cache(bucket: str, version: str, nuke_binary_path: str, tarball_sha256: str, binary_sha256: str):
+
+    binary_key = f"{BINARY_CACHE_PREFIX}/{version}/{tarball_sha256}/aws-nuke"
+    try:
+        s3.upload_file(nuke_binary_path, bucket, binary_key)
+        s3.put_object(
+            Bucket=bucket,
+            Key=f"{BINARY_CACHE_PREFIX}/{version}/manifest.json",
+            Body=json.dumps({
+                'Version': version,
+                'TarballSha256': tarball_sha256,
+                'BinarySha256': binary_sha256,
+                'BinaryKey': binary_key
+            }),
+            ContentType='application/json'
+        )
+        print(f"Stored AWS Nuke {version} in s3://{bucket}/{binary_key}")
+    except Exception as e:
+        print(f"Failed to store AWS Nuke binary in the cache: {e}")
+
+
+def get_aws_nuke_binary(nuke_version: str, enforce_version: bool, bucket: str, metrics: Metrics = None) -> (str, str):
+    """
+    Return the path and the version of the AWS Nuke binary.
+    Uses the installed binary when there is one. Otherwise checks the work dir first, then the binary cache in the nuke bucket and only then downloads from GitHub.
+    """
+    if metrics is None:
+        metrics = Metrics('aws-nuke-binary')
+
+    if INSTALLED_BINARY:
+        return installed_binary(nuke_version, enforce_version)
+
+    with metrics.phase('ResolveVersion'):
+        version = determine_version(nuke_version, enforce_version, bucket)
+
+    nuke_binary_path = find_local_binary(version)
+
+    if nuke_binary_path is None:
+        try:
+            with metrics.phase('DownloadBinaryFromCache'):
+                nuke_binary_path = download_from_cache(bucket, version)
+        except Exception as e:
+            print(f"Could not use the binary cache: {e}")
+
+        if nuke_binary_path is not None:
+            metrics.add('BinaryBytesDownloaded', os.path.getsize(nuke_binary_path), 'Bytes')
+
+    if nuke_binary_path is None:
+        try:
+            # The tarball is extracted while it is downloading, so this is download and extraction together
+            with metrics.phase('DownloadBinaryFromGitHub'):
+                nuke_binary_path, tarball_sha256, binary_sha256 = download_from_github(version)
+        except Exception as e:
+            print(f"Failed to download AWS Nuke: {e}")
+            raise Exception(f"Could not download AWS Nuke binary: {e}")
+
+        metrics.add('BinaryBytesDownloaded', os.path.getsize(nuke_binary_path), 'Bytes')
+
+        with metrics.phase('UploadBinaryToCache'):
+            upload_to_cache(bucket, version, nuke_binary_path, tarball_sha256, binary_sha256)
+
+    log_aws_nuke_version(nuke_binary_path)
+    print(f"Nuke binary path: {nuke_binary_path}")
+
+    return nuke_binary_path, version
@@ -1,15 +1,57 @@
 import json
-import boto3
 import subprocess
 import os
-import urllib.request
-import urllib.error
-import tarfile
-import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional
 
-s3 = boto3.client('s3')
+from continuation import (
+    DEFAULT_MAX_CONTINUATIONS, new_continuation_token, load_checkpoint, save_checkpoint, region_units, all_regions_unit,
+    unit_config, split_unit
+)
+from deletion_waves import plan_waves, wave_units
+from merge_results import merge_outputs, merge_indexes, read_indexes
+from metrics import Metrics
+from nuke_binary import get_aws_nuke_binary, list_resource_types
+from nuke_output import NukeOutputParser, merge_summaries
+from organization import assume_role_environment
+from output_archive import ArchiveWriter
+from review_report import write_report
+from runtime import LazyClient
+from s3_stream import S3MultipartWriter, SharedWriter, read_json
+from scan_history import select_resource_types
+
+s3 = LazyClient('s3')
+
+# 14.5 minute, a little bit less than Lambda's 15 minute limit
+NUKE_TIMEOUT_SECONDS = 870
+
+# Time that is kept free at the end of an invocation to upload the output and save the checkpoint
+DEADLINE_MARGIN_SECONDS = 60
+
+# aws-nuke gets this much time to stop after SIGTERM before it is killed
+STOP_GRACE_SECONDS = 10
+
+# Shards are not started anymore when less time than this is left, they are continued in the next invocation
+MIN_SHARD_SECONDS = 30
+
+# Configs and shard outputs are written here, the standalone runner can use a bigger disk than /tmp of Lambda
+WORK_DIR = os.environ.get('NUKE_WORK_DIR', '/tmp')
+
+# Every aws-nuke process needs its own memory, keep this low enough for the Lambda memory size
+DEFAULT_SHARD_CONCURRENCY = 4
+
+# Resources that failed or were still waiting are retried this many times, with exponential backoff,
+# as long as the retries take less than the time budget
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_BUDGET_SECONDS = 300
+RETRY_BASE_DELAY_SECONDS = 5
+
+# Fields of the response that the PartitionDone state keeps for merge_results. They are always in the response,
+# because a JSON path that doesn't exist fails the state.
+PARTITION_RESULT_FIELDS = ('OutputS3Uri', 'IndexS3Uri', 'ReportS3Uri', 'NukeVersion', 'Error')
 
 
 def parse_event(event) -> (str, bool, str, bool, str, bool):
@@ -29,7 +71,49 @@ def parse_event(event) -> (str, bool, str, bool, str, bool):
     return aws_nuke_s3_uri, dry_run, account_id, send_notification, nuke_version, enforce_version
 
 
-def store_in_s3(bucket: str, key: str, body: str) -> str:
+def parse_shard_options(event) -> (bool, int):
+
+    shard_by_region = event.get('ShardByRegion', os.environ.get('SHARD_BY_REGION', 'false').lower() == 'true')
+    shard_concurrency = int(event.get('ShardConcurrency', os.environ.get('SHARD_CONCURRENCY', DEFAULT_SHARD_CONCURRENCY)))
+
+    print(f"ShardByRegion parameter: {shard_by_region}")
+    print(f"ShardConcurrency parameter: {shard_concurrency}")
+
+    return shard_by_region, max(shard_concurrency, 1)
+
+
+def parse_wave_option(event) -> bool:
+
+    deletion_waves = event.get('DeletionWaves', os.environ.get('DELETION_WAVES', 'false').lower() == 'true')
+    print(f"DeletionWaves parameter: {deletion_waves}")
+
+    return deletion_waves
+
+
+def parse_retry_options(event) -> (int, int):
+
+    retry_attempts = int(event.get('RetryAttempts', os.environ.get('RETRY_ATTEMPTS', DEFAULT_RETRY_ATTEMPTS)))
+    retry_budget = int(event.get('RetryBudgetSeconds', os.environ.get('RETRY_BUDGET_SECONDS', DEFAULT_RETRY_BUDGET_SECONDS)))
+
+    print(f"RetryAttempts parameter: {retry_attempts}")
+    print(f"RetryBudgetSeconds parameter: {retry_budget}")
+
+    return max(retry_attempts, 0), retry_budget
+
+
+def parse_continuation_options(event) -> (bool, str, int):
+
+    continuation = event.get('Continuation', os.environ.get('CONTINUATION', 'false').lower() == 'true')
+    continuation_token = event.get('ContinuationToken')
+    max_continuations = int(event.get('MaxContinuations', os.environ.get('MAX_CONTINUATIONS', DEFAULT_MAX_CONTINUATIONS)))
+
+    print(f"Continuation parameter: {continuation}")
+    print(f"ContinuationToken parameter: {continuation_token}")
+
+    return continuation, continuation_token, max_continuations
+
+
+def store_in_s3(bucket: str, key: str, body: str, content_type: str = 'text/plain') -> str:
 
     output_s3_uri = ""
     try:
@@ -37,7 +121,7 @@ def store_in_s3(bucket: str, key: str, body: str) -> str:
             Bucket=bucket,
             Key=key,
             Body=body,
-            ContentType='text/plain'
+            ContentType=content_type
         )
         output_s3_uri = f"s3://{bucket}/{key}"
     except Exception as s3_error:
@@ -52,7 +136,7 @@ def download_config_file(aws_nuke_s3_uri):
     # Example of s3 uri: s3://bucketname/key
     bucket = aws_nuke_s3_uri.split('/')[2]
     key = '/'.join(aws_nuke_s3_uri.split('/')[3:])
-    config_path = '/tmp/nuke-config.yaml'
+    config_path = os.path.join(WORK_DIR, 'nuke-config.yaml')
 
     print(f"Bucket: {bucket}, key: {key}")
     print(f"Config path: {config_path}")
@@ -62,149 +146,14 @@ def download_config_file(aws_nuke_s3_uri):
     return config_path
 
 
-def determine_version(nuke_version: str, enforce_version: bool) -> str:
-
-    version_to_use = nuke_version
-    print(f"AWS Nuke version: {version_to_use}")
-
-    if (not enforce_version):
-        try:
-            print("Attempting to fetch latest AWS Nuke version from GitHub...")
-            request = urllib.request.Request(
-                'https://api.github.com/repos/ekristen/aws-nuke/releases/latest',
-                headers={
-                    'User-Agent': 'AWS-Nuke-Lambda-Executor/1.0',
-                    'Accept': 'application/vnd.github.v3+json'
-                }
-            )
-            with urllib.request.urlopen(request, timeout=5) as response:
-                if response.getcode() == 200:
-                    release_data = json.loads(response.read().decode())
-                    fetched_version = release_data['tag_name']
-                    print(f"Latest version available: {fetched_version}")
-                    # Only use if it's newer than our fallback
-                    if fetched_version >= version_to_use:
-                        version_to_use = fetched_version
-                        print(f"Using latest version: {version_to_use}")
-                else:
-                    print(f"GitHub API returned status {response.getcode()}, using fallback")
-        except Exception as e:
-            print(f"Could not fetch latest version: {e}, using fallback {version_to_use}")
-
-    return version_to_use
-
-
-def log_aws_nuke_version(nuke_binary_path: str):
-
-    print("Get aws-nuke version...")
-    version_result = subprocess.run([nuke_binary_path, '--version'], 
-                                    capture_output=True, text=True, timeout=10)
-    version_info = version_result.stdout.strip() or version_result.stderr.strip()
-    print(f"AWS Nuke version: {version_info}")
-
-
-def find_binary_in_tarfile(nuke_binary_path: str, tar: tarfile, members: str) -> str:
-
-    for member in members:
-        if 'aws-nuke' in member.name:
-            print(f"Found potential binary: {member.name} ({member.size} bytes)")
-
-            print(f"Extracting {member.name} to /tmp")
-            tar.extract(member, '/tmp')
-            
-            extracted_path = os.path.join('/tmp', member.name)
-            print(f"Extracted to: {extracted_path}")
-            
-            if extracted_path != nuke_binary_path:
-                print(f"Renaming {extracted_path} to {nuke_binary_path}")
-                os.rename(extracted_path, nuke_binary_path)
-            
-            print(f"Making {nuke_binary_path} executable")
-            os.chmod(nuke_binary_path, 0o755)
-            
-            if os.path.exists(nuke_binary_path):
-                if os.access(nuke_binary_path, os.X_OK):
-                    try:
-                        log_aws_nuke_version(nuke_binary_path)
-                        print(f"Nuke binary path: {nuke_binary_path}")
-                        
-                        return nuke_binary_path
-                        
-                    except Exception as version_error:
-                        print(f"Version/help check failed: {version_error}")
-                        # Continue trying other files
-                else:
-                    print("Binary is not executable")
-            else:
-                print("Binary does not exist after extraction")
-
-    raise Exception(f"No executable aws-nuke binary found in archive. Archive contained {len(members)} files.")
-
-
-def extract(tar_path: str, nuke_binary_path: str) -> str:
-
-    print(f"Extracting tar file: {tar_path}")
-    with tarfile.open(tar_path, 'r:gz') as tar:
-        members = tar.getmembers()
-        print(f"Archive contains {len(members)} files:")
-        for member in members[:10]:
-            print(f"  - {member.name} ({member.size} bytes)")
-        
-        nuke_binary_path = find_binary_in_tarfile(nuke_binary_path, tar, members)
-        return nuke_binary_path
-
-
-def download_aws_nuke(nuke_version: str, enforce_version: bool) -> str:
+def execute_nuke(nuke_binary: str, config_path: str, dry_run: bool, process_line: Callable[[str], None], timeout: int = NUKE_TIMEOUT_SECONDS,
+                 env: Dict[str, str] = None) -> (int, bool):
     """
-    Download AWS Nuke binary to /tmp and return the path.
+    Run AWS Nuke and pass every line of its output to process_line as soon as it is printed.
+    Stdout and stderr are merged, nothing is kept in memory here.
+    env contains extra environment variables, f.e. the credentials of a member account.
+    Returns the exit code and whether the process was stopped because of the timeout.
     """
-    nuke_binary_path = '/tmp/aws-nuke'
-    
-    if os.path.exists(nuke_binary_path) and os.access(nuke_binary_path, os.X_OK):
-        print("AWS Nuke binary already exists in /tmp")
-        log_aws_nuke_version(nuke_binary_path)
-
-        return nuke_binary_path
-    
-    version_to_use = determine_version(nuke_version, enforce_version)
-
-    download_url = f"https://github.com/ekristen/aws-nuke/releases/download/{version_to_use}/aws-nuke-{version_to_use}-linux-amd64.tar.gz"
-    print(f"Downloading from: {download_url}")
-    
-    try:
-        tar_path = '/tmp/aws-nuke.tar.gz'
-        
-        request = urllib.request.Request(
-            download_url,
-            headers={'User-Agent': 'AWS-Nuke-Lambda-Executor/1.0'}
-        )
-        
-        print(f"Starting download from {download_url}")
-        with urllib.request.urlopen(request, timeout=60) as download_response:
-            if download_response.getcode() != 200:
-                raise Exception(f"Download failed with status code: {download_response.getcode()}")
-            
-            download_content = download_response.read()
-            print(f"Downloaded {len(download_content)} bytes")
-            
-            if len(download_content) == 0:
-                raise Exception("Downloaded file is empty")
-            
-            with open(tar_path, 'wb') as f:
-                f.write(download_content)
-        
-        print(f"Saved tar.gz file: {os.path.getsize(tar_path)} bytes")
-        
-        extract(tar_path, nuke_binary_path)
-
-    except Exception as e:
-        print(f"Failed to download AWS Nuke: {e}")
-        raise Exception(f"Could not download AWS Nuke binary: {e}")
-
-    return nuke_binary_path
-
-
-def execute_nuke(nuke_binary: str, config_path: str, dry_run: bool) -> str:
 
     print(f"Nuke binary: {nuke_binary}")
     print(f"Config path: {config_path}")
@@ -222,41 +171,434 @@ def execute_nuke(nuke_binary: str, config_path: str, dry_run: bool) -> str:
         print("DRY-RUN MODE")
         
     print(f"Executing command: {' '.join(cmd)}")
-    print(f"Timeout set to: 14.5 minutes")
+    print(f"Timeout set to: {timeout} seconds")
     print(f"Dry run mode: {dry_run}")
-    
-    result = subprocess.run(
+
+    process = subprocess.Popen(
         cmd,
-        capture_output=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
         text=True,
-        timeout=870 # 14.5 minute, a little bit less than Lambda's 15 minute limit
+        errors='replace',
+        bufsize=1,
+        env=dict(os.environ, **env) if env else None
     )
 
-    return result
+    timed_out = threading.Event()
 
+    def stop_on_timeout():
+        timed_out.set()
+        print(f"AWS Nuke did not finish within {timeout} seconds, stopping process {process.pid}")
+        process.terminate()
+        try:
+            process.wait(STOP_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            print(f"AWS Nuke did not stop within {STOP_GRACE_SECONDS} seconds, killing process {process.pid}")
+            process.kill()
+
+    timer = threading.Timer(timeout, stop_on_timeout)
+    timer.start()
+    try:
+        for line in process.stdout:
+            process_line(line)
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
 
+    return returncode, timed_out.is_set()
 
-def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+
+def read_nuke_config(config_path: str) -> Dict[str, Any]:
+
+    # PyYAML is only loaded when the config is split or its resource types are needed, not by a run without shards
+    import yaml
+
+    with open(config_path) as f:
+        return yaml.safe_load(f)
+
+
+def write_unit_configs(config_path: str, units: List[Dict[str, Any]]) -> Dict[str, str]:
     """
-    Execute AWS Nuke with the generated configuration.
-    Downloads AWS Nuke binary at runtime to avoid layer size limits.
+    Write one AWS Nuke config per unit of work (a region, or a part of the resource types of a region),
+    so every unit can be nuked by its own process.
+    Returns a dict with the id of the unit as key and the path of its config file as value.
+    """
+    import yaml
+
+    nuke_config = read_nuke_config(config_path)
+
+    shard_config_paths = {}
+    for unit in units:
+        shard_config_path = os.path.join(WORK_DIR, f"nuke-config-{unit['Id']}.yaml")
+        with open(shard_config_path, 'w') as f:
+            yaml.safe_dump(unit_config(nuke_config, unit), f, default_flow_style=False)
+
+        shard_config_paths[unit['Id']] = shard_config_path
+
+    print(f"Split config into {len(shard_config_paths)} shards: {', '.join(shard_config_paths)}")
+    return shard_config_paths
+
+
+class ShardOutput:
+    """
+    Resource records and filtered lines of one shard. With writers, they are streamed to S3 right away.
+    Without writers, they are kept in the work dir until the shard is finished, so the records of a shard
+    that is stopped at the deadline can be left out when the shard is scanned again by the next invocation.
+    """
+
+    def __init__(self, shard: str, dry_run: bool, account_id: str, plan_writer: SharedWriter = None,
+                 filtered_writer: SharedWriter = None):
+
+        self.dry_run = dry_run
+        self.spooled = plan_writer is None
+        if self.spooled:
+            self.plan_path = os.path.join(WORK_DIR, f"nuke-plan-{shard}.jsonl")
+            self.filtered_path = os.path.join(WORK_DIR, f"nuke-filtered-{shard}.txt")
+            plan_writer = open(self.plan_path, 'w')
+            filtered_writer = open(self.filtered_path, 'w')
+        self.plan_file = plan_writer
+        self.filtered_file = filtered_writer
+        self.parser = NukeOutputParser(self.plan_file, account_id, track_unfinished=not dry_run)
+
+    def process_line(self, line: str) -> Dict[str, Any]:
+
+        # For dry-run, only show resources that would be removed
+        # For actual execution, also show resources that are removed
+        record = self.parser.process_line(line)
+        if record is None:
+            return None
+
+        if record['state'] == 'would-remove' or (not self.dry_run and record['state'] == 'removed'):
+            self.filtered_file.write(line)
+
+        return record
+
+    def copy_to(self, plan_writer: S3MultipartWriter, filtered_writer: S3MultipartWriter):
+
+        if not self.spooled:
+            return
+
+        for path, writer in ((self.plan_path, plan_writer), (self.filtered_path, filtered_writer)):
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    writer.write(chunk)
+
+    def close(self):
+
+        # The S3 writers are shared by all shards, they are closed by the handler
+        if self.spooled:
+            self.plan_file.close()
+            self.filtered_file.close()
+
+    def remove(self):
+
+        self.close()
+        if self.spooled:
+            for path in (self.plan_path, self.filtered_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def run_shards(nuke_binary: str, shard_config_paths: Dict[str, str], dry_run: bool, process_line: Callable[[str, str], None], concurrency: int, deadline: float,
+               env: Dict[str, str] = None) -> List[Dict[str, Any]]:
+    """
+    Run one AWS Nuke process per shard, at most concurrency processes at the same time.
+    All shards share the same deadline, shards that can't start anymore before the deadline are skipped.
+    Lines are passed to process_line (shard, line) in the thread of the shard, so it gets the lines of different
+    shards at the same time.
+    """
+
+    def run_shard(shard: str, shard_config_path: str) -> Dict[str, Any]:
+
+        shard_lines = 0
+
+        def process_shard_line(line: str):
+            nonlocal shard_lines
+            shard_lines += 1
+            process_line(shard, line)
+
+        timeout = int(deadline - time.monotonic())
+        if timeout < MIN_SHARD_SECONDS:
+            print(f"Shard {shard} skipped, only {timeout} seconds left")
+            return {
+                'Shard': shard,
+                'ReturnCode': None,
+                'TimedOut': True,
+                'Skipped': True,
+                'DurationSeconds': 0,
+                'Lines': 0
+            }
+
+        start_time = time.monotonic()
+        returncode, timed_out = execute_nuke(nuke_binary, shard_config_path, dry_run, process_shard_line, timeout, env)
+        duration = round(time.monotonic() - start_time, 1)
+
+        print(f"Shard {shard} completed with return code {returncode} in {duration} seconds ({shard_lines} lines)")
+        return {
+            'Shard': shard,
+            'ReturnCode': returncode,
+            'TimedOut': timed_out,
+            'Skipped': False,
+            'DurationSeconds': duration,
+            'Lines': shard_lines
+        }
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_shard, shard, path) for shard, path in shard_config_paths.items()]
+        return [future.result() for future in futures]
+
+
+def run_waves(nuke_binary: str, shard_config_paths: Dict[str, str], shard_waves: Dict[str, int], dry_run: bool,
+              process_line: Callable[[str, str], None], concurrency: int, deadline: float,
+              env: Dict[str, str] = None) -> (List[Dict[str, Any]], List[Dict[str, Any]]):
+    """
+    Run the shards wave after wave, the shards of one wave run in parallel (see run_shards).
+    Returns the shards, with their wave, and per wave its shards and duration.
+    """
+    shards = []
+    waves = []
+    for wave in sorted(set(shard_waves.values())):
+        wave_config_paths = {shard: path for shard, path in shard_config_paths.items() if shard_waves[shard] == wave}
+        print(f"Wave {wave}: {', '.join(wave_config_paths)}")
+
+        start_time = time.monotonic()
+        wave_shards = run_shards(nuke_binary, wave_config_paths, dry_run, process_line, concurrency, deadline, env)
+        for shard in wave_shards:
+            shard['Wave'] = wave
+
+        shards.extend(wave_shards)
+        waves.append({
+            'Wave': wave,
+            'Shards': list(wave_config_paths),
+            'DurationSeconds': round(time.monotonic() - start_time, 1)
+        })
+
+    return shards, waves
+
+
+def retry_failed(nuke_binary: str, config_path: str, shards: List[Dict[str, Any]], shard_outputs: Dict[str, 'ShardOutput'],
+                 process_line: Callable[[str, str], None], concurrency: int, deadline: float, env: Dict[str, str],
+                 retry_attempts: int, retry_budget: int, use_waves: bool, account_id: str, plan_writer: SharedWriter,
+                 filtered_writer: SharedWriter) -> List[Dict[str, Any]]:
+    """
+    Run AWS Nuke again for the shards that failed, with a config that only has the regions and resource types
+    of the resources that failed or were still waiting. The delay before every attempt doubles.
+    Retries stop after retry_attempts, when the next attempt would end after retry_budget or the deadline.
+    Returns the shards of the retries, the shards that were retried get Retried.
+    """
+    retry_shards = []
+    retry_deadline = min(deadline, time.monotonic() + retry_budget)
+    failed = [shard for shard in shards if shard['ReturnCode'] not in (0, None) and not shard['TimedOut']]
+
+    for attempt in range(1, retry_attempts + 1):
+        targets = {}
+        for shard in failed:
+            for region, resource_types in shard_outputs[shard['Shard']].parser.unfinished_targets().items():
+                targets.setdefault(region, set()).update(resource_types)
+
+        if not targets:
+            break
+
+        delay = RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)
+        if time.monotonic() + delay + MIN_SHARD_SECONDS > retry_deadline:
+            print(f"No time left for retry {attempt}")
+            break
+
+        print(f"Retry {attempt} in {delay} seconds: {', '.join(f'{region} ({len(types)})' for region, types in sorted(targets.items()))}")
+        time.sleep(delay)
+
+        units = [
+            {'Id': f"retry{attempt}-{region}", 'Region': region, 'ResourceTypes': sorted(resource_types)}
+            for region, resource_types in sorted(targets.items())
+        ]
+        if use_waves:
+            units = wave_units(units, plan_waves(sorted({t for unit in units for t in unit['ResourceTypes']})))
+
+        retry_config_paths = write_unit_configs(config_path, units)
+        for shard in retry_config_paths:
+            shard_outputs[shard] = ShardOutput(shard, False, account_id, plan_writer, filtered_writer)
+
+        if use_waves:
+            shard_waves = {unit['Id']: unit['Wave'] for unit in units}
+            attempt_shards, _ = run_waves(
+                nuke_binary, retry_config_paths, shard_waves, False, process_line, concurrency, retry_deadline, env
+            )
+        else:
+            attempt_shards = run_shards(nuke_binary, retry_config_paths, False, process_line, concurrency, retry_deadline, env)
+
+        for shard in failed:
+            shard['Retried'] = True
+        for shard in attempt_shards:
+            shard['Retry'] = attempt
+
+        retry_shards.extend(attempt_shards)
+        failed = [shard for shard in attempt_shards if shard['ReturnCode'] != 0 and not shard['TimedOut']]
+        if not failed:
+            print(f"Retry {attempt} finished all failed resources")
+            break
+
+    return retry_shards
+
+
+def config_waves(nuke_binary: str, config_path: str) -> List[List[str]]:
+    """
+    Split the resource types of a config in deletion waves, children before parents.
     """
+    nuke_config = read_nuke_config(config_path)
 
+    waves = plan_waves(select_resource_types(list_resource_types(nuke_binary), nuke_config.get('resource-types', {})))
+    print(f"Planned {len(waves)} deletion waves: {', '.join(str(len(wave)) for wave in waves)} resource types")
+    return waves
+
+
+def scanned_resource_types(nuke_binary: str, config_path: str) -> Dict[str, Any]:
+    """
+    Return the regions and resource types that AWS Nuke scanned with this config,
+    or None when they can't be determined.
+    """
+    try:
+        nuke_config = read_nuke_config(config_path)
+
+        resource_types = select_resource_types(list_resource_types(nuke_binary), nuke_config.get('resource-types', {}))
+        return {'Regions': nuke_config.get('regions', []), 'ResourceTypes': resource_types}
+    except Exception as e:
+        print(f"Could not determine the scanned resource types: {e}")
+        return None
+
+
+def format_shard_error(shard: Dict[str, Any]) -> str:
+
+    if shard['Skipped']:
+        reason = "was not started before the deadline"
+    elif shard['TimedOut']:
+        reason = "timed out"
+    else:
+        reason = f"exited with code {shard['ReturnCode']}"
+
+    if shard['Shard'] == 'all':
+        return f"AWS Nuke {reason}"
+
+    return f"AWS Nuke {reason} for {shard['Shard']}"
+
+
+def partition_suffix(partition_id: str) -> str:
+
+    # Partitions run at the same time, so their output files need different names
+    return '' if partition_id == 'all' else f"-{partition_id}"
+
+
+def close_writer(writer: S3MultipartWriter) -> str:
+
+    try:
+        return writer.close()
+    except Exception as s3_error:
+        print(f"Failed to upload output to S3: {s3_error}")
+        writer.abort()
+        return f"{writer.uri} (upload failed)"
+
+
+def close_archive(archive: ArchiveWriter) -> str:
+
+    try:
+        return archive.close()
+    except Exception as s3_error:
+        print(f"Failed to upload output archive to S3: {s3_error}")
+        archive.writer.abort()
+        return f"{archive.writer.uri} (upload failed)"
+
+
+def continue_units(checkpoint: Dict[str, Any], shards: List[Dict[str, Any]], nuke_binary: str, shard_config_paths: Dict[str, str]) -> List[str]:
+    """
+    Update the pending units of the checkpoint with the shards of this invocation.
+    Skipped units stay pending, units that were stopped at the deadline are split in two halves.
+    Returns the errors of this invocation.
+    """
+    units = {unit['Id']: unit for unit in checkpoint['Pending']}
+    pending = []
+    errors = []
+
+    for shard in shards:
+        # Retries of failed resources are not continued, a retry that didn't finish is an error
+        unit = units.get(shard['Shard'])
+        if unit is None:
+            if shard['ReturnCode'] != 0 or shard['TimedOut']:
+                errors.append(format_shard_error(shard))
+            continue
+
+        if shard['Skipped']:
+            pending.append(unit)
+        elif shard['TimedOut']:
+            resource_types = unit['ResourceTypes']
+            if resource_types is None:
+                scanned = scanned_resource_types(nuke_binary, shard_config_paths[unit['Id']])
+                resource_types = scanned['ResourceTypes'] if scanned else []
+
+            halves = split_unit(unit, resource_types)
+            if halves:
+                print(f"Unit {unit['Id']} didn't finish, split in {halves[0]['Id']} and {halves[1]['Id']}")
+                pending.extend(halves)
+            else:
+                errors.append(f"AWS Nuke timed out for {unit['Id']} ({', '.join(resource_types) or 'all resource types'})")
+        elif shard['ReturnCode'] != 0 and not shard.get('Retried'):
+            errors.append(format_shard_error(shard))
+
+    checkpoint['Pending'] = pending
+    return errors
+
+
+def run_executor(event: Dict[str, Any], partition_id: str, metrics: Metrics, deadline: float) -> Dict[str, Any]:
+
+    start_time = time.monotonic()
     aws_nuke_s3_uri, dry_run, account_id, send_notification, nuke_version, enforce_version = parse_event(event)    
+    shard_by_region, shard_concurrency = parse_shard_options(event)
+    continuation, continuation_token, max_continuations = parse_continuation_options(event)
+    deletion_waves = parse_wave_option(event)
+    retry_attempts, retry_budget = parse_retry_options(event)
+    role_arn = event.get('RoleArn')
     bucket = aws_nuke_s3_uri.split('/')[2]
 
-    config_path = download_config_file(aws_nuke_s3_uri)
+    # In organization mode AWS Nuke runs with a role in the member account. The executor itself keeps
+    # its own role for the nuke bucket. AccountAccessError is retried by the state machine.
+    nuke_env = None
+    if role_arn:
+        with metrics.phase('AssumeRole'):
+            nuke_env = assume_role_environment(role_arn, f"aws-nuke-{partition_id}")
+
+    checkpoint = None
+    if continuation_token:
+        try:
+            checkpoint = load_checkpoint(bucket, continuation_token)
+        except Exception as e:
+            print(f"Error: {e}")
+            return {
+                'Success': False,
+                'Error': str(e),
+                'OutputS3Uri': 'N/A',
+                'ResourcesToDelete': 0,
+                'DryRun': dry_run,
+                'SendNotification': send_notification
+            }
+
+        # All invocations of one run use the same version of AWS Nuke
+        nuke_version, enforce_version = checkpoint['NukeVersion'], True
+
+    with metrics.phase('DownloadConfig'):
+        config_path = download_config_file(aws_nuke_s3_uri)
+    metrics.add('ConfigBytes', os.path.getsize(config_path), 'Bytes')
 
     # Download AWS Nuke binary
     try:
-        nuke_binary = download_aws_nuke(nuke_version, enforce_version)
+        nuke_binary, resolved_version = get_aws_nuke_binary(nuke_version, enforce_version, bucket, metrics)
     except Exception as e:
         # If download fails, return error
         timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
         error_output = f"Failed to download AWS Nuke binary: {str(e)}\n"
         error_output += f"This may be due to network issues or GitHub rate limiting.\n"
         
-        output_key = f"nuke-outputs/nuke-error-{timestamp}-download-failed.txt"
+        output_key = f"nuke-outputs/nuke-error-{timestamp}-download-failed{partition_suffix(partition_id)}.txt"
         print(f"Error: {error_output}")
         print(f"bucket: {bucket}, Key: {output_key}")
         
@@ -272,99 +614,356 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'SendNotification': send_notification
         }
 
+    mode = f"{'dryrun' if dry_run else 'execution'}{partition_suffix(partition_id)}"
+
+    # A dry-run removes nothing, so only an execution is split in deletion waves
+    use_waves = deletion_waves and not dry_run
+
+    # With continuation, the work is split in units (regions, or parts of the resource types of a region)
+    # and the units that don't finish before the deadline are continued in the next invocation
+    if continuation:
+        if checkpoint is None:
+            continuation_token = new_continuation_token(partition_id)
+            units = region_units(read_nuke_config(config_path))
+            if use_waves:
+                units = wave_units(units, config_waves(nuke_binary, config_path))
+            checkpoint = {
+                'ConfigS3Uri': aws_nuke_s3_uri,
+                'NukeVersion': resolved_version,
+                'Pending': units,
+                'Errors': [],
+                'Results': [],
+                'Invocations': 0,
+                'DurationSeconds': 0
+            }
+
+        checkpoint['Invocations'] += 1
+        mode = f"{mode}-{checkpoint['Invocations']}"
+        print(f"Invocation {checkpoint['Invocations']} of run {continuation_token}, {len(checkpoint['Pending'])} units to do")
+        units = checkpoint['Pending']
+        shard_config_paths = write_unit_configs(config_path, units)
+    elif shard_by_region or use_waves:
+        units = region_units(read_nuke_config(config_path)) if shard_by_region else [all_regions_unit()]
+        if use_waves:
+            units = wave_units(units, config_waves(nuke_binary, config_path))
+        shard_config_paths = write_unit_configs(config_path, units)
+    else:
+        units = []
+        shard_config_paths = {'all': config_path}
+
+    # Units of a continued run keep the waves of the first invocation
+    shard_waves = {unit['Id']: unit['Wave'] for unit in units if 'Wave' in unit}
+
+    # The output is streamed to S3 while AWS Nuke is running, so a run that fails or times out
+    # still keeps everything it printed. The full output is stored as an archive of gzip chunks per region.
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    output_writer = S3MultipartWriter(bucket, f"nuke-outputs/nuke-output-{timestamp}-{mode}.log.gz", content_type='application/gzip')
+    output_archive = ArchiveWriter(output_writer)
+    filtered_writer = S3MultipartWriter(bucket, f"nuke-outputs/nuke-filtered-{timestamp}-{mode}.txt")
+
+    plan_writer = S3MultipartWriter(bucket, f"nuke-outputs/nuke-plan-{timestamp}-{mode}.jsonl", content_type='application/x-ndjson')
+    index_key = f"nuke-outputs/nuke-index-{timestamp}-{mode}.json"
+    # Only a continued dry-run leaves out the records of stopped shards, so only then the shard output is spooled
+    # to the work dir. Otherwise it is streamed to S3, like the output.
+    # The shards write to the same S3 objects, every writer has its own lock
+    shared_plan_writer = SharedWriter(plan_writer)
+    shared_filtered_writer = SharedWriter(filtered_writer)
+    if continuation and dry_run:
+        shard_outputs = {shard: ShardOutput(shard, dry_run, account_id) for shard in shard_config_paths}
+    else:
+        shard_outputs = {
+            shard: ShardOutput(shard, dry_run, account_id, shared_plan_writer, shared_filtered_writer)
+            for shard in shard_config_paths
+        }
+
+    archive_lock = threading.Lock()
+
+    def process_line(shard: str, line: str):
+        # Every shard parses its lines with its own parser, only the writes to the archive are one at a time
+        record = shard_outputs[shard].process_line(line)
+        with archive_lock:
+            if record is None:
+                output_archive.write_line(line)
+            else:
+                output_archive.write_line(line, record['region'], record['type'])
+
     try:
-        result = execute_nuke(nuke_binary, config_path, dry_run)
-                
-        print(f"Command completed with return code: {result.returncode}")
-        print(f"Stdout length: {len(result.stdout) if result.stdout else 0}")
-        print(f"Stderr length: {len(result.stderr) if result.stderr else 0}")
-        
-        full_output = result.stdout + result.stderr
-        
-        # Filter output based on mode
-        if dry_run:
-            # For dry-run, only show lines with "would remove"
-            filtered_lines = [line for line in full_output.split('\n') if 'would remove' in line.lower()]
-            filtered_output = '\n'.join(filtered_lines)
-            resources_to_delete = len(filtered_lines)
+        waves = None
+        with metrics.phase('RunNuke'):
+            if shard_waves:
+                shards, waves = run_waves(
+                    nuke_binary, shard_config_paths, shard_waves, dry_run, process_line, shard_concurrency, deadline, nuke_env
+                )
+            else:
+                shards = run_shards(nuke_binary, shard_config_paths, dry_run, process_line, shard_concurrency, deadline, nuke_env)
+
+        # Only an execution removes resources, that can fail because of dependencies or throttling
+        if not dry_run and retry_attempts:
+            with metrics.phase('RetryFailed'):
+                retry_shards = retry_failed(
+                    nuke_binary, config_path, shards, shard_outputs, process_line, shard_concurrency, deadline, nuke_env,
+                    retry_attempts, retry_budget, use_waves, account_id, shared_plan_writer, shared_filtered_writer
+                )
+            shards.extend(retry_shards)
+            metrics.add('RetryShards', len(retry_shards))
+
+        failed_shards = [shard for shard in shards if (shard['ReturnCode'] != 0 or shard['TimedOut']) and not shard.get('Retried')]
+        timed_out = any(shard['TimedOut'] for shard in shards)
+
+        if timed_out and not continuation:
+            output_archive.write_line("\nAWS Nuke execution timed out, output is partial\n")
+
+        summaries = []
+        scanned = []
+        with metrics.phase('CollectShardOutput'):
+            for shard in shards:
+                shard_output = shard_outputs[shard['Shard']]
+                shard_output.close()
+
+                # A stopped shard is scanned again by the next invocation, its would-remove records would be counted twice.
+                # Resources that were removed before the shard was stopped are really gone, so they are kept.
+                shard_summary = shard_output.parser.summary()
+                shard['Removed'] = shard_summary['States'].get('removed', 0)
+                shard['Failed'] = shard_summary['States'].get('failed', 0)
+
+                if not shard['TimedOut'] or not (continuation and dry_run):
+                    shard_output.copy_to(plan_writer, filtered_writer)
+                    summaries.append(shard_summary)
+
+                # Only a complete scan tells which resource types are empty
+                if not shard['TimedOut'] and shard['ReturnCode'] == 0 and shard['Shard'] in shard_config_paths:
+                    with metrics.phase('ListResourceTypes'):
+                        shard_scanned = scanned_resource_types(nuke_binary, shard_config_paths[shard['Shard']])
+                    if shard_scanned:
+                        scanned.append(shard_scanned)
+
+                shard_output.remove()
+
+        if waves:
+            shard_results = {shard['Shard']: shard for shard in shards}
+            for wave in waves:
+                wave['Removed'] = sum(shard_results[shard]['Removed'] for shard in wave['Shards'])
+                wave['Failed'] = sum(shard_results[shard]['Failed'] for shard in wave['Shards'])
+                print(f"Wave {wave['Wave']}: {wave['Removed']} removed, {wave['Failed']} failed in {wave['DurationSeconds']} seconds")
+
+        index = merge_summaries(summaries)
+        print(f"Output lines: {index['Lines']}, resource records: {index['Records']}, bytes: {output_archive.uncompressed_bytes}")
+
+        # Only count actually removed resources for actual execution
+        resources_to_delete = index['States'].get('would-remove' if dry_run else 'removed', 0)
+
+        if filtered_writer.bytes_written == 0:
+            filtered_writer.write('No filtered output available')
+
+        with metrics.phase('UploadOutput'):
+            output_s3_uri = close_archive(output_archive)
+            filtered_output_s3_uri = close_writer(filtered_writer)
+            plan_s3_uri = close_writer(plan_writer)
+
+        metrics.add('OutputLines', index['Lines'])
+        metrics.add('ResourceRecords', index['Records'])
+        metrics.add('OutputBytes', output_archive.uncompressed_bytes, 'Bytes')
+        metrics.add('OutputCompressedBytes', output_writer.bytes_written, 'Bytes')
+        metrics.add('PlanBytes', plan_writer.bytes_written, 'Bytes')
+        metrics.add_scan_seconds(index['ScanSeconds'])
+
+        index['PlanS3Uris'] = [plan_s3_uri]
+        index['Scanned'] = scanned
+        index['AccountId'] = account_id
+
+        with metrics.phase('UploadIndex'):
+            index_s3_uri = store_in_s3(bucket, index_key, json.dumps(index, separators=(',', ':')), 'application/json')
+
+        if continuation:
+            response = finish_invocation(
+                bucket, partition_id, continuation_token, checkpoint, max_continuations, shards, nuke_binary, shard_config_paths,
+                {
+                    'PartitionId': f"{partition_id} ({checkpoint['Invocations']})",
+                    'OutputS3Uri': output_s3_uri if not dry_run else filtered_output_s3_uri,
+                    'IndexS3Uri': index_s3_uri,
+                    'ResourcesToDelete': resources_to_delete
+                },
+                dry_run, time.monotonic() - start_time
+            )
+            response.update({
+                'DryRun': dry_run,
+                'NukeVersion': resolved_version,
+                'SendNotification': send_notification,
+                'Shards': shards
+            })
+            # The report covers the plans of all invocations, so it is written when the run is done
+            if dry_run and not response['ContinuationToken']:
+                response['ReportS3Uri'] = write_review_report(bucket, response['IndexS3Uri'], f"nuke-report-{timestamp}-{mode}", metrics)
+        elif timed_out:
+            response = {
+                'Success': False,
+                'Error': 'AWS Nuke execution timed out',
+                'OutputS3Uri': output_s3_uri,
+                'PlanS3Uri': plan_s3_uri,
+                'IndexS3Uri': index_s3_uri,
+                'ResourcesToDelete': resources_to_delete,
+                'DryRun': dry_run,
+                'NukeVersion': resolved_version,
+                'SendNotification': send_notification
+            }
         else:
-            # For actual execution, show lines with "removed" or "would remove" (in case of errors)
-            removed_lines = [line for line in full_output.split('\n') if 'removed' in line.lower()]
-            would_remove_lines = [line for line in full_output.split('\n') if 'would remove' in line.lower()]
-            filtered_lines = removed_lines + would_remove_lines
-            filtered_output = '\n'.join(filtered_lines)
-            resources_to_delete = len(removed_lines)  # Only count actually removed resources
-        
-        timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
-        output_key = f"nuke-outputs/nuke-output-{timestamp}-{'dryrun' if dry_run else 'execution'}.txt"
-
-        output_s3_uri = store_in_s3(bucket, output_key, full_output)
-        
-        # Also upload filtered output
-        filtered_output_key = f"nuke-outputs/nuke-filtered-{timestamp}-{'dryrun' if dry_run else 'execution'}.txt"
+            response = {
+                'Success': not failed_shards,
+                'OutputS3Uri': output_s3_uri if not dry_run else filtered_output_s3_uri,  # Use full output for actual execution
+                'PlanS3Uri': plan_s3_uri,
+                'IndexS3Uri': index_s3_uri,
+                'ResourcesToDelete': resources_to_delete,
+                'DryRun': dry_run,
+                'NukeVersion': resolved_version,
+                'Error': '; '.join(format_shard_error(shard) for shard in failed_shards),
+                'SendNotification': send_notification
+            }
+            if dry_run:
+                response['ReportS3Uri'] = write_review_report(bucket, index_s3_uri, f"nuke-report-{timestamp}-{mode}", metrics, index)
+
+        if (shard_by_region or waves) and not continuation:
+            response['Shards'] = shards
+        if waves:
+            response['Waves'] = waves
 
-        body = filtered_output if filtered_output else 'No filtered output available'
-        filtered_output_s3_uri = store_in_s3(bucket, filtered_output_key, body)
-        
-        response = {
-            'Success': result.returncode == 0,
-            'OutputS3Uri': output_s3_uri if not dry_run else filtered_output_s3_uri,  # Use full output for actual execution
-            'ResourcesToDelete': resources_to_delete,
-            'DryRun': dry_run,
-            'Error': '' if result.returncode == 0 else f'AWS Nuke exited with code {result.returncode}',
-            'SendNotification': send_notification
-        }
-        
         print(f"Returning response: {json.dumps(response, default=str)}")
         return response
-        
-    except subprocess.TimeoutExpired as e:
-        # Upload timeout error to S3
-        timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
-        
-        # Get partial output from the exception
-        partial_stdout = getattr(e, 'stdout', '') or ''
-        partial_stderr = getattr(e, 'stderr', '') or ''
-        partial_output = partial_stdout + partial_stderr.decode()
-        
-        error_output = f"AWS Nuke execution timed out after {e.timeout} seconds\n\n"
-        if partial_output:
-            error_output += f"Partial output:\n{partial_output}"
-        else:
-            error_output += "No partial output available"
-        
-        output_key = f"nuke-outputs/nuke-error-{timestamp}-timeout-{'dryrun' if dry_run else 'execution'}.txt"
 
-        output_s3_uri = store_in_s3(bucket, output_key, error_output)
-        
-        response = {
-            'Success': False,
-            'Error': f'AWS Nuke execution timed out after {e.timeout} seconds',
-            'OutputS3Uri': output_s3_uri,
-            'ResourcesToDelete': 0,
-            'DryRun': dry_run,
-            'SendNotification': send_notification
-        }
-        
-        print(f"Timeout - Returning response: {json.dumps(response, default=str)}")
-        return response
     except Exception as e:
-        # Upload general error to S3
-        timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
-        error_output = f"AWS Nuke execution failed with error:\n{str(e)}\n\n"
-        
-        output_key = f"nuke-outputs/nuke-error-{timestamp}-exception-{'dryrun' if dry_run else 'execution'}.txt"
-        
-        output_s3_uri = store_in_s3(bucket, output_key, error_output)
-        
+        # Keep the partial output, and upload the error to S3
+        output_archive.write_line(f"\nAWS Nuke execution failed with error:\n{str(e)}\n")
+        output_s3_uri = close_archive(output_archive)
+        close_writer(filtered_writer)
+        close_writer(plan_writer)
+        for shard_output in shard_outputs.values():
+            shard_output.remove()
+
         response = {
             'Success': False,
             'Error': str(e),
             'OutputS3Uri': output_s3_uri,
             'ResourcesToDelete': 0,
             'DryRun': dry_run,
+            'NukeVersion': resolved_version,
             'SendNotification': send_notification
         }
         
         print(f"Exception - Returning response: {json.dumps(response, default=str)}")
         return response
+
+
+def write_review_report(bucket: str, index_s3_uri: str, name: str, metrics: Metrics, index: Dict[str, Any] = None) -> Optional[str]:
+    """
+    Render the dry-run as an HTML report for the reviewer. The report is an extra, it doesn't fail the dry-run.
+    """
+    with metrics.phase('WriteReport'):
+        try:
+            report_s3_uri = write_report(bucket, index or read_json(index_s3_uri), name)
+        except Exception as e:
+            print(f"Could not write the review report: {e}")
+            return None
+
+    print(f"Review report: {report_s3_uri}")
+    return report_s3_uri
+
+
+def finish_invocation(bucket: str, partition_id: str, continuation_token: str, checkpoint: Dict[str, Any], max_continuations: int,
+                      shards: List[Dict[str, Any]], nuke_binary: str, shard_config_paths: Dict[str, str],
+                      result: Dict[str, Any], dry_run: bool, duration: float) -> Dict[str, Any]:
+    """
+    Save the checkpoint and return a continuation token while there are units left.
+    When the run is done, the output and indexes of all invocations are merged into one result.
+    """
+    checkpoint['Errors'].extend(continue_units(checkpoint, shards, nuke_binary, shard_config_paths))
+    checkpoint['Results'].append(result)
+    previous_duration = checkpoint['DurationSeconds']
+    checkpoint['DurationSeconds'] = round(previous_duration + duration, 1)
+
+    if checkpoint['Pending'] and checkpoint['Invocations'] >= max_continuations:
+        checkpoint['Errors'].append(
+            f"{len(checkpoint['Pending'])} units not finished after {checkpoint['Invocations']} invocations: "
+            f"{', '.join(unit['Id'] for unit in checkpoint['Pending'])}"
+        )
+        checkpoint['Pending'] = []
+
+    save_checkpoint(bucket, continuation_token, checkpoint)
+
+    if checkpoint['Pending']:
+        print(f"{len(checkpoint['Pending'])} units left, continuing with token {continuation_token}")
+        return {
+            'Success': True,
+            'ContinuationToken': continuation_token,
+            'OutputS3Uri': result['OutputS3Uri'],
+            'IndexS3Uri': result['IndexS3Uri'],
+            'ResourcesToDelete': sum(invocation['ResourcesToDelete'] for invocation in checkpoint['Results']),
+            'PendingUnits': len(checkpoint['Pending']),
+            'Error': ''
+        }
+
+    results = checkpoint['Results']
+    if len(results) == 1:
+        output_s3_uri = results[0]['OutputS3Uri']
+        index_s3_uri = results[0]['IndexS3Uri']
+    else:
+        output_s3_uri = merge_outputs(bucket, results, dry_run, partition_suffix(partition_id))
+        index_s3_uri = merge_indexes(bucket, read_indexes(results), dry_run, partition_suffix(partition_id))
+
+    print(f"Run {continuation_token} finished after {checkpoint['Invocations']} invocations")
+    return {
+        'Success': not checkpoint['Errors'],
+        'ContinuationToken': None,
+        'OutputS3Uri': output_s3_uri,
+        'IndexS3Uri': index_s3_uri,
+        'ResourcesToDelete': sum(invocation['ResourcesToDelete'] for invocation in results),
+        'Invocations': checkpoint['Invocations'],
+        'PreviousDurationSeconds': previous_duration,
+        'Error': '; '.join(checkpoint['Errors'])
+    }
+
+
+def time_budget(context: Any) -> float:
+    """
+    Seconds that AWS Nuke can run in this invocation, based on the remaining time of the Lambda function.
+    """
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return NUKE_TIMEOUT_SECONDS
+
+    return min(NUKE_TIMEOUT_SECONDS, context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_SECONDS)
+
+
+def run_partition(event: Dict[str, Any], budget: float) -> Dict[str, Any]:
+    """
+    Run one partition of the work, AWS Nuke gets budget seconds. Used by the Lambda handler and the standalone runner.
+    """
+    start_time = time.monotonic()
+    deadline = start_time + budget
+    partition_id = event.get('PartitionId', 'all')
+    metrics = Metrics('nuke-executor')
+
+    response = run_executor(event, partition_id, metrics, deadline)
+
+    # The state machine passes these back to the executor when the run continues
+    response.setdefault('ContinuationToken', None)
+    for field in PARTITION_RESULT_FIELDS:
+        response.setdefault(field, None)
+    response['ConfigS3Uri'] = event['ConfigS3Uri']
+    response['PartitionId'] = partition_id
+    response['AccountId'] = event['AccountId']
+    response['RoleArn'] = event.get('RoleArn')
+    response['DurationSeconds'] = round(time.monotonic() - start_time + response.pop('PreviousDurationSeconds', 0), 1)
+    print(f"Partition {partition_id} finished in {response['DurationSeconds']} seconds")
+
+    metrics.emit()
+    response['Metrics'] = metrics.to_dict()
+
+    return response
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Execute AWS Nuke with the generated configuration for one partition of the work.
+    Downloads AWS Nuke binary at runtime to avoid layer size limits.
+    When continuation is enabled and the work doesn't fit in one invocation, the response
+    contains a ContinuationToken and the state machine invokes the executor again with it.
+    """
+    return run_partition(event, time_budget(context))
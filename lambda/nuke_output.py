@@ -0,0 +1,247 @@
+import json
+import re
+import time
+from typing import Dict, Any, Optional
+
+# aws-nuke prints one line per resource and per state change, f.e.
+# eu-west-1 - EC2Instance - i-0123456789abcdef0 - [Name: "web", tag:Cleanup: "no"] - would remove
+# Ids can contain " - " (f.e. S3 object keys), so the state is matched at the end of the line and the id
+# is everything before the properties and the state.
+RESOURCE_LINE = re.compile(
+    r'(?P<region>[\w-]+) - (?P<type>[\w:]+) - (?P<id>.+?)(?: - \[(?P<properties>.*)\])?'
+    r' - (?P<state>would remove|triggered remove|removed|filtered|failed|waiting|pending)(?:[: ]+(?P<details>(?:(?! - ).)*))?$'
+)
+# The details of a state (f.e. an error message) can contain " - " as well, those lines are matched
+# with the first " - " followed by a state
+RESOURCE_LINE_WITH_DETAILS = re.compile(
+    r'(?P<region>[\w-]+) - (?P<type>[\w:]+) - (?P<id>.*?) - (?:\[(?P<properties>.*)\] - )?'
+    r'(?P<state>would remove|triggered remove|removed|filtered|failed|waiting|pending)(?:[: ]+(?P<details>.*))?$'
+)
+PROPERTY = re.compile(r'([^",\s][^"]*?): "([^"\\]*(?:\\.[^"\\]*)*)"')
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
+
+# State as printed by aws-nuke, and the name of the state in the plan
+STATES = {
+    'would remove': 'would-remove',
+    'triggered remove': 'triggered-remove',
+    'removed': 'removed',
+    'filtered': 'filtered',
+    'failed': 'failed',
+    'waiting': 'waiting',
+    'pending': 'pending',
+}
+
+# States after which aws-nuke is still busy with a resource, or gave up on it
+UNFINISHED_STATES = ('would-remove', 'triggered-remove', 'waiting', 'pending', 'failed')
+
+# Resource names per resource type in the summary, so a notification can show examples without reading the plan
+SAMPLES_PER_TYPE = 5
+SAMPLE_STATES = ('would-remove', 'removed')
+
+
+def parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse one line of aws-nuke output into a resource record, or return None when the line
+    is not about a resource.
+    """
+    if ' - ' not in line:
+        return None
+
+    if '\x1b' in line:
+        line = ANSI_ESCAPE.sub('', line)
+
+    line = line.rstrip()
+    match = RESOURCE_LINE.match(line) or RESOURCE_LINE_WITH_DETAILS.match(line)
+    if match is None:
+        return None
+
+    record = {
+        'region': match.group('region'),
+        'type': match.group('type'),
+        'id': match.group('id'),
+        'state': STATES[match.group('state')],
+    }
+
+    properties = match.group('properties')
+    if properties:
+        record['properties'] = dict(PROPERTY.findall(properties))
+
+    # F.e. the reason why a resource is filtered or failed
+    details = match.group('details')
+    if details:
+        record['details'] = details
+
+    return record
+
+
+def resource_key(record: Dict[str, Any]) -> tuple:
+    # Resources in different accounts can have the same id
+    return (record.get('account'), record['region'], record['type'], record['id'])
+
+
+def resource_name(record: Dict[str, Any]) -> str:
+
+    name = record.get('properties', {}).get('Name')
+    return f"{record['id']} ({name})" if name and name != record['id'] else record['id']
+
+
+def add_sample(samples: list, name: str):
+
+    if len(samples) < SAMPLES_PER_TYPE and name not in samples:
+        samples.append(name)
+
+
+class NukeOutputParser:
+    """
+    Parses aws-nuke output line by line, writes every resource record as JSON Lines to plan_writer
+    and keeps the counts per region, resource type and state for the summary index.
+    With account_id, the records contain the account, so the plans of several accounts can be combined.
+    The resources that are not removed (yet) are only tracked with track_unfinished, they are only needed to retry
+    an execution. In a dry-run every resource is unfinished, so tracking them would keep all resources in memory.
+    """
+
+    def __init__(self, plan_writer=None, account_id: str = None, track_unfinished: bool = True):
+
+        self.plan_writer = plan_writer
+        self.account_id = account_id
+        self.track_unfinished = track_unfinished
+        self.lines = 0
+        self.records = 0
+        self.states = {}
+        self.regions = {}
+        # First and last time a resource type was seen per region. The time between them is the ScanSeconds
+        # of the summary, an estimate of how long the listing took, aws-nuke doesn't print the listing time.
+        self.seen = {}
+        # Last state of the resources that are not removed (yet)
+        self.unfinished = {}
+        self.samples = {}
+
+    def process_line(self, line: str) -> Optional[Dict[str, Any]]:
+
+        self.lines += 1
+
+        record = parse_line(line)
+        if record is None:
+            return None
+
+        if self.account_id is not None:
+            record['account'] = self.account_id
+
+        self.records += 1
+        state = record['state']
+        self.states[state] = self.states.get(state, 0) + 1
+
+        type_counts = self.regions.setdefault(record['region'], {}).setdefault(record['type'], {})
+        type_counts[state] = type_counts.get(state, 0) + 1
+
+        now = time.monotonic()
+        seen = self.seen.get((record['region'], record['type']))
+        if seen is None:
+            self.seen[(record['region'], record['type'])] = [now, now]
+        else:
+            seen[1] = now
+
+        if self.track_unfinished:
+            key = (record['region'], record['type'], record['id'])
+            if state in UNFINISHED_STATES:
+                self.unfinished[key] = state
+            else:
+                self.unfinished.pop(key, None)
+
+        if state in SAMPLE_STATES:
+            add_sample(self.samples.setdefault(record['type'], []), resource_name(record))
+
+        if self.plan_writer is not None:
+            self.plan_writer.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+        return record
+
+    def count(self, state: str) -> int:
+        return self.states.get(state, 0)
+
+    def unfinished_targets(self) -> Dict[str, list]:
+        """
+        Return per region the resource types with resources that failed, were still waiting
+        or were not handled at all when aws-nuke stopped.
+        """
+        targets = {}
+        for region, resource_type, _ in self.unfinished:
+            targets.setdefault(region, set()).add(resource_type)
+
+        return {region: sorted(resource_types) for region, resource_types in sorted(targets.items())}
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Small index of the plan: counts per state, per region and per resource type.
+        Regions contains the counts per state for every resource type in the region,
+        Samples the names of the first resources per resource type that are (or would be) removed.
+        """
+        resource_types = {}
+        for region_types in self.regions.values():
+            for resource_type, type_counts in region_types.items():
+                totals = resource_types.setdefault(resource_type, {})
+                for state, count in type_counts.items():
+                    totals[state] = totals.get(state, 0) + count
+
+        scan_seconds = {}
+        for (region, resource_type), (first_seen, last_seen) in self.seen.items():
+            scan_seconds.setdefault(region, {})[resource_type] = round(last_seen - first_seen, 3)
+
+        return {
+            'Lines': self.lines,
+            'Records': self.records,
+            'States': self.states,
+            'ResourceTypes': resource_types,
+            'Regions': self.regions,
+            'ScanSeconds': scan_seconds,
+            'Samples': self.samples,
+        }
+
+
+def merge_summaries(summaries: list) -> Dict[str, Any]:
+    """
+    Combine the summary indexes of several runs (f.e. partitions) into one.
+    When the runs are in more than one account, Accounts contains the counts per account, region and resource type.
+    """
+    merged = {'Lines': 0, 'Records': 0, 'States': {}, 'ResourceTypes': {}, 'Regions': {}, 'ScanSeconds': {}, 'Scanned': [], 'Samples': {}}
+    accounts = {}
+
+    def add_counts(target: Dict[str, int], counts: Dict[str, int]):
+        for state, count in counts.items():
+            target[state] = target.get(state, 0) + count
+
+    for summary in summaries:
+        merged['Lines'] += summary.get('Lines', 0)
+        merged['Records'] += summary.get('Records', 0)
+        add_counts(merged['States'], summary.get('States', {}))
+
+        for resource_type, counts in summary.get('ResourceTypes', {}).items():
+            add_counts(merged['ResourceTypes'].setdefault(resource_type, {}), counts)
+
+        for region, region_types in summary.get('Regions', {}).items():
+            for resource_type, counts in region_types.items():
+                add_counts(merged['Regions'].setdefault(region, {}).setdefault(resource_type, {}), counts)
+
+        for region, region_seconds in summary.get('ScanSeconds', {}).items():
+            merged_seconds = merged['ScanSeconds'].setdefault(region, {})
+            for resource_type, seconds in region_seconds.items():
+                merged_seconds[resource_type] = max(seconds, merged_seconds.get(resource_type, 0))
+
+        merged['Scanned'].extend(summary.get('Scanned', []))
+
+        for resource_type, names in summary.get('Samples', {}).items():
+            for name in names:
+                add_sample(merged['Samples'].setdefault(resource_type, []), name)
+
+        account_regions = summary.get('Accounts') or ({summary['AccountId']: summary.get('Regions', {})} if summary.get('AccountId') else {})
+        for account_id, regions in account_regions.items():
+            for region, region_types in regions.items():
+                for resource_type, counts in region_types.items():
+                    add_counts(accounts.setdefault(account_id, {}).setdefault(region, {}).setdefault(resource_type, {}), counts)
+
+    if len(accounts) == 1:
+        merged['AccountId'] = next(iter(accounts))
+    elif accounts:
+        merged['Accounts'] = accounts
+
+    return merged
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Any, List, Optional
+
+import nuke_binary
+import nuke_executor
+
+# Without --timeout the runner has no time limit, this only keeps the timers of the shards finite
+NO_TIMEOUT_SECONDS = 7 * 24 * 3600
+
+
+def read_event(location: str) -> Dict[str, Any]:
+
+    if location == '-':
+        return json.load(sys.stdin)
+
+    with open(location) as f:
+        return json.load(f)
+
+
+def run(event: Dict[str, Any], budget: float) -> Dict[str, Any]:
+    """
+    Run the partition of the event like the state machine does: while the response contains
+    a ContinuationToken, the executor is started again with it. Every invocation gets the full budget.
+    """
+    response = nuke_executor.run_partition(event, budget)
+    invocations = 1
+
+    while response.get('ContinuationToken'):
+        event = dict(event, ContinuationToken=response['ContinuationToken'])
+        response = nuke_executor.run_partition(event, budget)
+        invocations += 1
+
+    print(f"Runner finished after {invocations} invocations in {response['DurationSeconds']} seconds")
+    return response
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(
+        description='Run the nuke executor outside Lambda (f.e. as a container task) with the same event and the same S3 artifacts, without the Lambda time limit'
+    )
+    parser.add_argument('event', help="event of the nuke executor as JSON file, '-' reads it from stdin")
+    parser.add_argument('--workers', type=int, help='aws-nuke processes that run in parallel, splits the work per region (ShardByRegion)')
+    parser.add_argument('--timeout', type=int, help='seconds that aws-nuke may run per invocation, default no limit')
+    parser.add_argument('--work-dir', help='directory for the binary, configs and shard output, default NUKE_WORK_DIR or /tmp')
+    parser.add_argument('--nuke-binary', help='use this aws-nuke binary instead of downloading it, default NUKE_BINARY_PATH')
+    parser.add_argument('--output', help='write the response to this file, it is always printed as the last line')
+    args = parser.parse_args(argv)
+
+    event = read_event(args.event)
+    if args.workers:
+        event['ShardConcurrency'] = args.workers
+        event.setdefault('ShardByRegion', args.workers > 1)
+
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+        nuke_executor.WORK_DIR = nuke_binary.WORK_DIR = args.work_dir
+    if args.nuke_binary:
+        nuke_binary.INSTALLED_BINARY = os.path.abspath(args.nuke_binary)
+
+    response = run(event, args.timeout or NO_TIMEOUT_SECONDS)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(response, f, indent=2, default=str)
+
+    print(json.dumps(response, default=str))
+    return 0 if response.get('Success') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
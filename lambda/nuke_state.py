@@ -0,0 +1,40 @@
+import json
+from typing import Any
+
+from runtime import LazyClient
+
+s3 = LazyClient('s3')
+
+# State that is shared between runs (history, caches) is stored as small JSON objects under this prefix
+STATE_PREFIX = 'nuke-state'
+
+
+def load_state(bucket: str, name: str, default: Any) -> Any:
+    """
+    Read a JSON state object from the nuke bucket. Returns default when it doesn't exist or can't be read.
+    """
+    key = f"{STATE_PREFIX}/{name}"
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+        return json.loads(response['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        print(f"No state found in s3://{bucket}/{key}")
+    except Exception as e:
+        print(f"Could not read state s3://{bucket}/{key}: {e}")
+
+    return default
+
+
+def save_state(bucket: str, name: str, state: Any):
+
+    key = f"{STATE_PREFIX}/{name}"
+    try:
+        s3.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=json.dumps(state, separators=(',', ':'), default=str),
+            ContentType='application/json'
+        )
+        print(f"State saved to s3://{bucket}/{key}")
+    except Exception as e:
+        print(f"Could not save state s3://{bucket}/{key}: {e}")
@@ -0,0 +1,60 @@
+from typing import Dict, List
+
+from runtime import client
+
+# Role that AWS Organizations creates in every new member account
+DEFAULT_MEMBER_ROLE_NAME = 'OrganizationAccountAccessRole'
+
+
+class AccountAccessError(Exception):
+    """
+    The role in a member account can't be assumed. The state machine retries the executor on this error.
+    """
+
+
+def list_ou_accounts(organizational_unit_id: str) -> List[str]:
+    """
+    Return the ids of the active accounts in an organizational unit and in all organizational units below it.
+    """
+    organizations = client('organizations')
+    accounts_paginator = organizations.get_paginator('list_accounts_for_parent')
+    units_paginator = organizations.get_paginator('list_organizational_units_for_parent')
+
+    account_ids = []
+    parents = [organizational_unit_id]
+    while parents:
+        parent_id = parents.pop()
+
+        for page in accounts_paginator.paginate(ParentId=parent_id):
+            account_ids.extend(account['Id'] for account in page['Accounts'] if account['Status'] == 'ACTIVE')
+
+        for page in units_paginator.paginate(ParentId=parent_id):
+            parents.extend(unit['Id'] for unit in page['OrganizationalUnits'])
+
+    print(f"Found {len(account_ids)} active accounts in {organizational_unit_id}")
+    return sorted(account_ids)
+
+
+def member_role_arn(account_id: str, role_name: str) -> str:
+    return f"arn:aws:iam::{account_id}:role/{role_name}"
+
+
+def assume_role_environment(role_arn: str, session_name: str) -> Dict[str, str]:
+    """
+    Assume the role in the member account and return the environment variables
+    that make AWS Nuke use its credentials.
+    """
+    try:
+        credentials = client('sts').assume_role(
+            RoleArn=role_arn,
+            RoleSessionName=session_name[:64]
+        )['Credentials']
+    except Exception as e:
+        raise AccountAccessError(f"Could not assume {role_arn}: {e}")
+
+    print(f"Assumed {role_arn}, credentials expire at {credentials['Expiration']}")
+    return {
+        'AWS_ACCESS_KEY_ID': credentials['AccessKeyId'],
+        'AWS_SECRET_ACCESS_KEY': credentials['SecretAccessKey'],
+        'AWS_SESSION_TOKEN': credentials['SessionToken'],
+    }
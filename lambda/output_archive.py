@@ -0,0 +1,218 @@
+import argparse
+import gzip
+import json
+from typing import Dict, Any, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from nuke_output import parse_line
+from runtime import LazyClient
+from s3_stream import S3MultipartWriter
+
+s3 = LazyClient('s3')
+
+# Uncompressed size of one chunk. Every chunk is a complete gzip member, so it can be read on its own
+# with a ranged GET, and the whole archive is still a valid gzip file.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+ARCHIVE_FORMAT = 'gzip-chunks-v1'
+
+
+def archive_index_key(archive_key: str) -> str:
+    """
+    The index is stored next to the archive: nuke-output-x.log.gz -> nuke-output-x.log.index.json
+    """
+    return f"{archive_key[:-len('.gz')]}.index.json" if archive_key.endswith('.gz') else f"{archive_key}.index.json"
+
+
+def is_archive(s3_uri: str) -> bool:
+    return s3_uri.startswith('s3://') and s3_uri.endswith('.gz')
+
+
+class ArchiveWriter:
+    """
+    Writes a log as independently gzip-compressed chunks to writer. Lines are buffered per region,
+    so a chunk only contains the lines of one region (lines that are not about a resource go to
+    chunks without region). The index lists per chunk its byte range, region and resource types.
+    Lines of one region keep their order, lines of different regions can be in different chunks.
+    """
+
+    def __init__(self, writer: S3MultipartWriter, chunk_size: int = DEFAULT_CHUNK_SIZE):
+
+        self.writer = writer
+        self.chunk_size = chunk_size
+        self.buffers = {}
+        self.chunks = []
+        self.offset = 0
+        self.lines = 0
+        self.uncompressed_bytes = 0
+
+    def write_line(self, line: str, region: str = None, resource_type: str = None):
+
+        buffer = self.buffers.get(region)
+        if buffer is None:
+            buffer = self.buffers[region] = {'Data': bytearray(), 'ResourceTypes': set(), 'Lines': 0}
+
+        data = line.encode('utf-8')
+        buffer['Data'].extend(data)
+        buffer['Lines'] += 1
+        if resource_type:
+            buffer['ResourceTypes'].add(resource_type)
+
+        self.lines += 1
+        self.uncompressed_bytes += len(data)
+
+        if len(buffer['Data']) >= self.chunk_size:
+            self.flush(region)
+
+    def flush(self, region: str = None):
+
+        buffer = self.buffers.pop(region, None)
+        if not buffer or not buffer['Data']:
+            return
+
+        compressed = gzip.compress(bytes(buffer['Data']), mtime=0)
+        self.writer.write(compressed)
+        self.chunks.append({
+            'Offset': self.offset,
+            'Length': len(compressed),
+            'Region': region,
+            'ResourceTypes': sorted(buffer['ResourceTypes']),
+            'Lines': buffer['Lines'],
+            'Bytes': len(buffer['Data'])
+        })
+        self.offset += len(compressed)
+
+    def flush_all(self):
+
+        for region in list(self.buffers):
+            self.flush(region)
+
+    def append_archive(self, archive_s3_uri: str):
+        """
+        Copy an existing archive, the byte ranges of its chunks are moved to their new place.
+        """
+        self.flush_all()
+
+        bucket, key = parse_s3_uri(archive_s3_uri)
+        index = read_archive_index(archive_s3_uri)
+
+        response = s3.get_object(Bucket=bucket, Key=key)
+        for data in response['Body'].iter_chunks():
+            self.writer.write(data)
+
+        for chunk in index['Chunks']:
+            self.chunks.append(dict(chunk, Offset=self.offset + chunk['Offset']))
+            self.lines += chunk['Lines']
+            self.uncompressed_bytes += chunk['Bytes']
+
+        self.offset += response['ContentLength']
+
+    def index(self) -> Dict[str, Any]:
+
+        return {
+            'Format': ARCHIVE_FORMAT,
+            'Lines': self.lines,
+            'Bytes': self.uncompressed_bytes,
+            'CompressedBytes': self.offset,
+            'Chunks': self.chunks
+        }
+
+    def close(self) -> str:
+        """
+        Write the remaining chunks, close the archive and store its index. Returns the S3 URI of the archive.
+        """
+        self.flush_all()
+        archive_s3_uri = self.writer.close()
+
+        s3.put_object(
+            Bucket=self.writer.bucket,
+            Key=archive_index_key(self.writer.key),
+            Body=json.dumps(self.index(), separators=(',', ':')),
+            ContentType='application/json'
+        )
+
+        print(f"Archive {archive_s3_uri}: {self.lines} lines, {self.uncompressed_bytes} bytes in {len(self.chunks)} chunks of {self.offset} bytes")
+        return archive_s3_uri
+
+
+def parse_s3_uri(s3_uri: str) -> (str, str):
+
+    parsed = urlparse(s3_uri)
+    return parsed.netloc, parsed.path.lstrip('/')
+
+
+def read_archive_index(archive_s3_uri: str) -> Dict[str, Any]:
+
+    bucket, key = parse_s3_uri(archive_s3_uri)
+    return json.loads(s3.get_object(Bucket=bucket, Key=archive_index_key(key))['Body'].read())
+
+
+def select_ranges(index: Dict[str, Any], region: str = None, resource_type: str = None) -> List[tuple]:
+    """
+    Return the byte ranges (first, last) of the chunks with the region and/or resource type.
+    Adjacent chunks are combined in one range, so they are read with one request.
+    """
+    ranges = []
+    for chunk in index['Chunks']:
+        if region is not None and chunk['Region'] != region:
+            continue
+        if resource_type is not None and resource_type not in chunk['ResourceTypes']:
+            continue
+
+        first, last = chunk['Offset'], chunk['Offset'] + chunk['Length'] - 1
+        if ranges and ranges[-1][1] + 1 == first:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((first, last))
+
+    return ranges
+
+
+def read_slice(archive_s3_uri: str, region: str = None, resource_type: str = None) -> Iterator[str]:
+    """
+    Read only the lines of one region and/or resource type from an archive, with ranged GETs.
+    Without region and resource type, the lines that are not about a resource are returned.
+    """
+    bucket, key = parse_s3_uri(archive_s3_uri)
+    index = read_archive_index(archive_s3_uri)
+
+    if region is None and resource_type is None:
+        ranges = [
+            (chunk['Offset'], chunk['Offset'] + chunk['Length'] - 1)
+            for chunk in index['Chunks'] if chunk['Region'] is None
+        ]
+    else:
+        ranges = select_ranges(index, region, resource_type)
+
+    for first, last in ranges:
+        response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={first}-{last}")
+        # gzip.decompress reads all gzip members in the range
+        text = gzip.decompress(response['Body'].read()).decode('utf-8', errors='replace')
+
+        for line in text.splitlines(keepends=True):
+            if resource_type is not None:
+                record = parse_line(line)
+                if record is None or record['type'] != resource_type:
+                    continue
+            yield line
+
+
+def main(argv: Optional[List[str]] = None):
+
+    parser = argparse.ArgumentParser(description='Print the lines of one region and/or resource type from an aws-nuke output archive')
+    parser.add_argument('archive', help='S3 URI of the archive, f.e. s3://bucket/nuke-outputs/nuke-output-20250101-120000-execution.log.gz')
+    parser.add_argument('--region', help='only lines of this region')
+    parser.add_argument('--resource-type', help='only lines of this resource type')
+    parser.add_argument('--index', action='store_true', help='print the index of the archive')
+    args = parser.parse_args(argv)
+
+    if args.index:
+        print(json.dumps(read_archive_index(args.archive), indent=2))
+        return
+
+    for line in read_slice(args.archive, args.region, args.resource_type):
+        print(line, end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from metrics import Metrics
+from organization import DEFAULT_MEMBER_ROLE_NAME, member_role_arn
+from runtime import client
+from s3_stream import S3MultipartWriter, read_json, read_plan_records
+
+# Only the first overlaps are returned in the response, all of them are written to S3
+MAX_OVERLAPS_IN_RESPONSE = 20
+
+
+def arn_resource_id(arn: str) -> str:
+    """
+    The last part of an ARN, which is what aws-nuke prints as id for most resource types:
+    arn:aws:ec2:eu-west-1:123456789012:instance/i-0123 -> i-0123, arn:aws:s3:::bucket -> bucket
+    """
+    resource = arn.split(':', 5)[-1]
+    return resource.split('/')[-1].split(':')[-1]
+
+
+def protected_resources(account_id: str, regions: List[str], tag_key: str, tag_value: str,
+                        credentials: Optional[Dict[str, str]] = None) -> Dict[str, set]:
+    """
+    Page through the resources with the protected tag in all regions at the same time.
+    Returns the ARNs and the (region, id) of the resources; global resources (f.e. S3, IAM) have region ''.
+    """
+    def list_region(region: str) -> List[str]:
+        tagging = client('resourcegroupstaggingapi', region, credentials)
+        arns = []
+        for page in tagging.get_paginator('get_resources').paginate(TagFilters=[{'Key': tag_key, 'Values': [tag_value]}]):
+            arns.extend(resource['ResourceARN'] for resource in page['ResourceTagMappingList'])
+        return arns
+
+    with ThreadPoolExecutor(max_workers=max(len(regions), 1)) as executor:
+        region_arns = list(executor.map(list_region, regions))
+
+    arns = set()
+    ids = set()
+    for arns_of_region in region_arns:
+        for arn in arns_of_region:
+            arns.add(arn)
+            ids.add((arn.split(':')[3], arn_resource_id(arn)))
+
+    print(f"Account {account_id}: {len(arns)} resources with {tag_key}={tag_value} in {len(regions)} regions")
+    return {'Arns': arns, 'Ids': ids}
+
+
+def is_protected(record: Dict[str, Any], protected: Dict[str, set], tag_key: str, tag_value: str) -> bool:
+
+    properties = record.get('properties') or {}
+    if properties.get(f"tag:{tag_key}") == tag_value:
+        return True
+
+    resource_id = record['id']
+    return (
+        resource_id in protected['Arns']
+        or (record['region'], resource_id) in protected['Ids']
+        or ('', resource_id) in protected['Ids']
+        or any(properties.get(name) in protected['Arns'] for name in ('ARN', 'Arn'))
+    )
+
+
+def plan_accounts(index: Dict[str, Any], default_account_id: str) -> List[str]:
+
+    if index.get('Accounts'):
+        return sorted(index['Accounts'])
+
+    return [index.get('AccountId') or default_account_id]
+
+
+def member_credentials(account_id: str, own_account_id: str, role_name: str) -> Optional[Dict[str, str]]:
+
+    if account_id == own_account_id:
+        return None
+
+    return client('sts').assume_role(
+        RoleArn=member_role_arn(account_id, role_name),
+        RoleSessionName=f"aws-nuke-preflight-{account_id}"
+    )['Credentials']
+
+
+def preflight(event: Dict[str, Any], metrics: Metrics) -> Dict[str, Any]:
+    """
+    Check that the resources that the plan would remove don't have the protected tag.
+    Overlaps block the workflow.
+    """
+    start_time = time.monotonic()
+    bucket = event['awsNukeBucket']
+    index_s3_uri = event.get('IndexS3Uri') or ''
+    regions = event['Regions']
+    tag_key = event['TagKey']
+    tag_value = event['TagValue']
+    role_name = event.get('MemberRoleName') or DEFAULT_MEMBER_ROLE_NAME
+
+    # Without a plan nothing can be checked, f.e. a scheduled execution has no approved dry-run. The preflight fails
+    # closed: the execution would remove resources that were never checked.
+    if not index_s3_uri.startswith('s3://'):
+        print("No plan to check, the workflow is blocked")
+        return {
+            'Blocked': True,
+            'Reason': 'There is no plan (DryRunIndexS3Uri of an approved dry-run) to check',
+            'Overlaps': [],
+            'OverlapCount': 0,
+            'Checked': 0,
+            'TagKey': tag_key,
+            'TagValue': tag_value
+        }
+
+    with metrics.phase('ReadIndex'):
+        index = read_json(index_s3_uri)
+
+    own_account_id = client('sts').get_caller_identity()['Account']
+    protected = {}
+    with metrics.phase('ListProtectedResources'):
+        for account_id in plan_accounts(index, event.get('AccountId')):
+            credentials = member_credentials(account_id, own_account_id, role_name)
+            protected[account_id] = protected_resources(account_id, regions, tag_key, tag_value, credentials)
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    writer = S3MultipartWriter(bucket, f"nuke-outputs/nuke-preflight-{timestamp}.jsonl", content_type='application/x-ndjson')
+
+    checked = 0
+    overlaps = []
+    with metrics.phase('CheckPlan'):
+        for record in read_plan_records(index):
+            if record['state'] != 'would-remove':
+                continue
+
+            checked += 1
+            account_protected = protected.get(record.get('account')) or next(iter(protected.values()))
+            if is_protected(record, account_protected, tag_key, tag_value):
+                overlaps.append({key: record.get(key) for key in ('account', 'region', 'type', 'id')})
+                writer.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    preflight_s3_uri = writer.close() if overlaps else None
+    if not overlaps:
+        writer.abort()
+
+    metrics.add('ProtectedResources', sum(len(account['Arns']) for account in protected.values()))
+    metrics.add('CheckedResources', checked)
+    metrics.add('Overlaps', len(overlaps))
+
+    print(f"Checked {checked} resources, {len(overlaps)} have the protected tag {tag_key}={tag_value}")
+    return {
+        'Blocked': bool(overlaps),
+        'OverlapCount': len(overlaps),
+        'Overlaps': overlaps[:MAX_OVERLAPS_IN_RESPONSE],
+        'PreflightS3Uri': preflight_s3_uri,
+        'IndexS3Uri': index_s3_uri,
+        'Checked': checked,
+        'TagKey': tag_key,
+        'TagValue': tag_value,
+        'DurationSeconds': round(time.monotonic() - start_time, 1)
+    }
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Preflight before approval and before an approved execution: the plan may not contain resources
+    with the protected tag (f.e. because a filter in generate_config is wrong).
+    """
+    print(f"Lambda event: {json.dumps(event, default=str)}")
+
+    metrics = Metrics('preflight')
+    response = preflight(event, metrics)
+
+    metrics.emit()
+    response['Metrics'] = metrics.to_dict()
+
+    print(f"Returning response: {json.dumps(response, default=str)}")
+    return response
@@ -0,0 +1,87 @@
+import json
+from datetime import datetime
+from typing import Dict, Any
+
+from nuke_output import resource_key
+from s3_stream import S3MultipartWriter, read_json, read_plan_records
+
+CATEGORIES = ('removed-as-planned', 'removed-not-planned', 'planned-not-removed', 'failed')
+
+
+def reconcile(approved_index: Dict[str, Any], execution_index: Dict[str, Any], writer: S3MultipartWriter) -> Dict[str, int]:
+    """
+    Compare the resources of the approved dry-run with the final state of every resource in the execution.
+    Both plans are read once, the join is done with hash lookups, so it stays linear in the number of resources.
+    Every resource is written to writer with its category, the counts per category are returned.
+    """
+    approved = set()
+    for record in read_plan_records(approved_index):
+        if record['state'] == 'would-remove':
+            approved.add(resource_key(record))
+
+    # aws-nuke prints a resource again for every state change, the last state counts.
+    # Once a resource is removed it stays removed.
+    final_states = {}
+    for record in read_plan_records(execution_index):
+        key = resource_key(record)
+        if final_states.get(key) != 'removed':
+            final_states[key] = record['state']
+
+    counts = {category: 0 for category in CATEGORIES}
+
+    def add(key: tuple, category: str, state: str):
+        counts[category] += 1
+        account_id, region, resource_type, resource_id = key
+        writer.write(json.dumps({
+            'category': category,
+            'account': account_id,
+            'region': region,
+            'type': resource_type,
+            'id': resource_id,
+            'state': state
+        }, separators=(',', ':')) + '\n')
+
+    for key, state in final_states.items():
+        if state == 'removed':
+            add(key, 'removed-as-planned' if key in approved else 'removed-not-planned', state)
+        elif state == 'failed':
+            add(key, 'failed', state)
+
+    for key in approved:
+        state = final_states.get(key, 'not-found')
+        if state not in ('removed', 'failed'):
+            add(key, 'planned-not-removed', state)
+
+    return counts
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Compare what the execution removed with what was approved in the dry-run.
+    Returns the result of the execution with the counts per category under Reconciliation.
+    """
+    print(f"Lambda event: {json.dumps(event, default=str)}")
+
+    result = event['Result']
+    bucket = event['awsNukeBucket']
+    dry_run_index_s3_uri = event.get('DryRunIndexS3Uri')
+    execution_index_s3_uri = result.get('IndexS3Uri')
+
+    if not dry_run_index_s3_uri or not execution_index_s3_uri:
+        print("No approved dry-run or no execution index, nothing to reconcile")
+        return result
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    writer = S3MultipartWriter(bucket, f"nuke-outputs/nuke-reconciliation-{timestamp}.jsonl", content_type='application/x-ndjson')
+
+    try:
+        counts = reconcile(read_json(dry_run_index_s3_uri), read_json(execution_index_s3_uri), writer)
+        reconciliation_s3_uri = writer.close()
+    except Exception as e:
+        writer.abort()
+        print(f"Reconciliation failed: {e}")
+        return dict(result, Reconciliation={'Error': str(e)})
+
+    print(f"Reconciliation: {json.dumps(counts)}")
+
+    return dict(result, Reconciliation=dict(counts, ReconciliationS3Uri=reconciliation_s3_uri))
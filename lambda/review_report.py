@@ -0,0 +1,244 @@
+import html
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+from runtime import LazyClient
+from s3_stream import read_json, read_plan_records
+
+s3 = LazyClient('s3')
+
+# The report of a dry-run is a static website in the bucket: one page per account, region and resource type,
+# and an index page with the list of pages. Only the index page is loaded up front.
+REPORT_PREFIX = 'nuke-reports'
+
+# Resources per page, a resource type with more resources in a region gets more pages
+PAGE_SIZE = 1000
+
+UPLOAD_CONCURRENCY = 16
+
+# The pages are private, the index page links to them with presigned URLs
+LINK_EXPIRES_SECONDS = 7 * 24 * 60 * 60
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: left; vertical-align: top; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>{count} resources would be removed.</p>
+<table>
+<thead><tr><th>Resource</th><th>Properties</th></tr></thead>
+<tbody>
+{rows}
+</tbody>
+</table>
+</body>
+</html>
+"""
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>AWS Nuke dry-run review</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: left; }}
+td.count {{ text-align: right; }}
+</style>
+</head>
+<body>
+<h1>AWS Nuke dry-run review</h1>
+<p>{total} resources would be removed. Generated {generated}, the links are valid for 7 days.</p>
+<p>
+<select id="account"><option value="">All accounts</option></select>
+<select id="region"><option value="">All regions</option></select>
+<input id="type" placeholder="Resource type">
+<span id="shown"></span>
+</p>
+<table>
+<thead><tr><th>Account</th><th>Region</th><th>Resource type</th><th>Resources</th><th>Page</th></tr></thead>
+<tbody id="pages"></tbody>
+</table>
+<script type="application/json" id="report">{report}</script>
+<script>
+const pages = JSON.parse(document.getElementById('report').textContent).Pages;
+const account = document.getElementById('account');
+const region = document.getElementById('region');
+const type = document.getElementById('type');
+
+for (const [select, field] of [[account, 'Account'], [region, 'Region']]) {{
+  for (const value of [...new Set(pages.map(page => page[field]))].sort()) {{
+    select.add(new Option(value || '-', value));
+  }}
+}}
+
+function cell(row, text, className) {{
+  const td = row.insertCell();
+  td.textContent = text;
+  if (className) td.className = className;
+  return td;
+}}
+
+function render() {{
+  const search = type.value.toLowerCase();
+  const shown = pages.filter(page =>
+    (!account.value || page.Account === account.value) &&
+    (!region.value || page.Region === region.value) &&
+    page.Type.toLowerCase().includes(search)
+  );
+
+  const body = document.getElementById('pages');
+  body.replaceChildren();
+  for (const page of shown) {{
+    const row = body.insertRow();
+    cell(row, page.Account || '-');
+    cell(row, page.Region);
+    cell(row, page.Type);
+    cell(row, page.Count, 'count');
+    const link = document.createElement('a');
+    link.href = page.Url;
+    link.textContent = page.Pages > 1 ? `page ${{page.Part}} of ${{page.Pages}}` : 'resources';
+    cell(row, '').appendChild(link);
+  }}
+
+  const resources = shown.reduce((total, page) => total + page.Count, 0);
+  document.getElementById('shown').textContent = `${{shown.length}} pages, ${{resources}} resources`;
+}}
+
+for (const input of [account, region, type]) input.addEventListener('input', render);
+render();
+</script>
+</body>
+</html>
+"""
+
+
+def page_name(account_id: str, region: str, resource_type: str, part: int) -> str:
+
+    name = f"{account_id}-{region}-{resource_type}" if account_id else f"{region}-{resource_type}"
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-{part}.html"
+
+
+def render_page(account_id: str, region: str, resource_type: str, part: int, records: List[Dict[str, Any]]) -> str:
+
+    title = f"{resource_type} in {region}" + (f" ({account_id})" if account_id else '') + (f" - page {part}" if part > 1 else '')
+
+    rows = []
+    for record in records:
+        properties = ', '.join(f"{key}: {value}" for key, value in record.get('properties', {}).items())
+        rows.append(f"<tr><td>{html.escape(record['id'])}</td><td>{html.escape(properties)}</td></tr>")
+
+    return PAGE_TEMPLATE.format(title=html.escape(title), count=len(records), rows='\n'.join(rows))
+
+
+def put_html(bucket: str, key: str, body: str):
+
+    s3.put_object(Bucket=bucket, Key=key, Body=body.encode('utf-8'), ContentType='text/html; charset=utf-8')
+
+
+def report_index(name: str, pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+
+    return {
+        'Name': name,
+        'GeneratedAt': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'Total': sum(page['Count'] for page in pages),
+        'Pages': sorted(pages, key=lambda page: (page['Account'], page['Region'], page['Type'], page['Part'])),
+    }
+
+
+def write_index_page(bucket: str, prefix: str, report: Dict[str, Any]) -> str:
+    """
+    Store the compact report index and the index page. The index page contains the index with a presigned URL
+    per page, so the browser filters the pages without loading them.
+    """
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{prefix}/report.json",
+        Body=json.dumps(report, separators=(',', ':')),
+        ContentType='application/json'
+    )
+
+    pages = [
+        dict(page, Url=s3.generate_presigned_url(
+            'get_object', Params={'Bucket': bucket, 'Key': page['Key']}, ExpiresIn=LINK_EXPIRES_SECONDS
+        ))
+        for page in report['Pages']
+    ]
+
+    # </script> in a resource type would end the script element
+    embedded = json.dumps({'Pages': pages}, separators=(',', ':')).replace('</', '<\\/')
+    put_html(bucket, f"{prefix}/index.html", INDEX_TEMPLATE.format(
+        total=report['Total'], generated=report['GeneratedAt'], report=embedded
+    ))
+
+    return f"s3://{bucket}/{prefix}/index.html"
+
+
+def write_report(bucket: str, index: Dict[str, Any], name: str) -> str:
+    """
+    Render the resources that would be removed in the plans of a summary index as a static HTML report
+    under nuke-reports/<name>/ and return the S3 URI of the index page.
+    The plans are streamed, only the resources of the pages that are not full yet are in memory.
+    """
+    prefix = f"{REPORT_PREFIX}/{name}"
+    pages = []
+    buffers = {}
+    parts = {}
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor:
+        uploads = []
+
+        def flush(key: Tuple[str, str, str]):
+            records = buffers.pop(key)
+            parts[key] = parts.get(key, 0) + 1
+            account_id, region, resource_type = key
+            page_key = f"{prefix}/pages/{page_name(account_id, region, resource_type, parts[key])}"
+            pages.append({
+                'Account': account_id, 'Region': region, 'Type': resource_type, 'Part': parts[key],
+                'Count': len(records), 'Key': page_key
+            })
+            uploads.append(executor.submit(
+                put_html, bucket, page_key, render_page(account_id, region, resource_type, parts[key], records)
+            ))
+
+        for record in read_plan_records(index):
+            if record['state'] != 'would-remove':
+                continue
+            key = (record.get('account', ''), record['region'], record['type'])
+            buffers.setdefault(key, []).append(record)
+            if len(buffers[key]) >= PAGE_SIZE:
+                flush(key)
+
+        for key in list(buffers):
+            flush(key)
+
+        for upload in uploads:
+            upload.result()
+
+    for page in pages:
+        page['Pages'] = parts[(page['Account'], page['Region'], page['Type'])]
+
+    return write_index_page(bucket, prefix, report_index(name, pages))
+
+
+def merge_reports(bucket: str, report_s3_uris: List[str], name: str) -> str:
+    """
+    Combine the reports of several partitions in one index page. The pages of the partitions are not copied.
+    """
+    pages = []
+    for report_s3_uri in report_s3_uris:
+        pages.extend(read_json(report_s3_uri.rsplit('/', 1)[0] + '/report.json')['Pages'])
+
+    return write_index_page(bucket, f"{REPORT_PREFIX}/{name}", report_index(name, pages))
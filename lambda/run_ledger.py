@@ -0,0 +1,117 @@
+import json
+import time
+from typing import Dict, Any, List, Optional
+
+from runtime import LazyClient
+
+s3 = LazyClient('s3')
+
+# Every workflow execution appends one small record, compaction merges the records into the index.
+# Readers only GET the index.
+LEDGER_PREFIX = 'nuke-ledger'
+RECORDS_PREFIX = f"{LEDGER_PREFIX}/records/"
+INDEX_KEY = f"{LEDGER_PREFIX}/index.json"
+
+# The index keeps the newest runs
+MAX_LEDGER_RUNS = 1000
+
+# Compaction uses a conditional write, when another execution changed the index in the meantime it starts over
+COMPACTION_ATTEMPTS = 5
+
+
+def append_run(bucket: str, record: Dict[str, Any]) -> str:
+    """
+    Write the summary record of one run. The key starts with the finish time, so records sort by time.
+    """
+    name = (record.get('ExecutionArn') or 'unknown').split(':')[-1]
+    key = f"{RECORDS_PREFIX}{record['FinishedAt']}-{name}.json"
+
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(dict(record, RecordKey=key), separators=(',', ':'), default=str),
+        ContentType='application/json'
+    )
+    return key
+
+
+def load_ledger(bucket: str) -> (Dict[str, Any], Optional[str]):
+    """
+    Return the ledger index and its ETag (None when there is no index yet).
+    """
+    try:
+        response = s3.get_object(Bucket=bucket, Key=INDEX_KEY)
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return {'Runs': []}, None
+        raise
+
+    return json.loads(response['Body'].read()), response['ETag']
+
+
+def recent_runs(bucket: str, count: int = 10) -> List[Dict[str, Any]]:
+
+    index, _ = load_ledger(bucket)
+    return index['Runs'][:count]
+
+
+def list_record_keys(bucket: str) -> List[str]:
+
+    keys = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=RECORDS_PREFIX):
+        keys.extend(item['Key'] for item in page.get('Contents', []))
+
+    return keys
+
+
+def compact_ledger(bucket: str) -> int:
+    """
+    Merge the records into the index with a conditional write, then delete the merged records.
+    Returns the number of runs that were added to the index.
+    """
+    for attempt in range(1, COMPACTION_ATTEMPTS + 1):
+        keys = list_record_keys(bucket)
+        if not keys:
+            return 0
+
+        index, etag = load_ledger(bucket)
+        # A record that was merged before but not deleted is not added again
+        known = {run.get('RecordKey') for run in index['Runs']}
+        new_runs = [
+            json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+            for key in keys if key not in known
+        ]
+
+        runs = sorted(index['Runs'] + new_runs, key=lambda run: run.get('FinishedAt', ''), reverse=True)
+        index = {
+            'Runs': runs[:MAX_LEDGER_RUNS],
+            'UpdatedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        }
+
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            s3.put_object(
+                Bucket=bucket,
+                Key=INDEX_KEY,
+                Body=json.dumps(index, separators=(',', ':'), default=str),
+                ContentType='application/json',
+                **condition
+            )
+        except s3.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                print(f"Ledger index changed during compaction, attempt {attempt}")
+                time.sleep(attempt)
+                continue
+            raise
+
+        for start in range(0, len(keys), 1000):
+            s3.delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+            )
+
+        print(f"Compacted {len(new_runs)} runs into {INDEX_KEY}, {len(index['Runs'])} runs in the ledger")
+        return len(new_runs)
+
+    print(f"Ledger compaction gave up after {COMPACTION_ATTEMPTS} attempts, the records are merged by the next run")
+    return 0
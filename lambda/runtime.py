@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Clients are created on first use and reused by all modules and by warm invocations.
+# boto3 is only imported when the first client is created, so importing a module costs nothing
+# when the function doesn't use its clients.
+clients = {}
+lock = threading.Lock()
+
+# Sessions with the credentials of other accounts (f.e. an assumed member role), by access key id.
+# Every assume_role gives new credentials, so only the sessions of the last credentials are kept.
+sessions = OrderedDict()
+MAX_CREDENTIAL_SESSIONS = 32
+
+
+def credential_session(credentials: Dict[str, str]) -> Any:
+    """
+    Return the session of the credentials. Only called with the lock.
+    """
+    import boto3
+
+    access_key_id = credentials['AccessKeyId']
+    if access_key_id in sessions:
+        sessions.move_to_end(access_key_id)
+        return sessions[access_key_id]
+
+    sessions[access_key_id] = boto3.session.Session(
+        aws_access_key_id=access_key_id,
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken']
+    )
+
+    while len(sessions) > MAX_CREDENTIAL_SESSIONS:
+        expired_key_id, _ = sessions.popitem(last=False)
+        for key in [key for key in clients if key[2] == expired_key_id]:
+            del clients[key]
+
+    return sessions[access_key_id]
+
+
+def client(service_name: str, region_name: Optional[str] = None, credentials: Optional[Dict[str, str]] = None) -> Any:
+    """
+    Return the client of the service in the region (default region when None).
+    Clients with credentials, f.e. of a member account, are created from one session per credentials
+    and reused as long as the same credentials are used.
+    """
+    import boto3
+
+    key = (service_name, region_name, credentials['AccessKeyId'] if credentials is not None else None)
+    if key not in clients:
+        # Creating a client is not thread-safe, the executor and preflight use clients in threads
+        with lock:
+            if key not in clients:
+                if credentials is None:
+                    clients[key] = boto3.client(service_name, region_name=region_name)
+                else:
+                    clients[key] = credential_session(credentials).client(service_name, region_name=region_name)
+
+    return clients[key]
+
+
+class LazyClient:
+    """
+    Module level client that is created on first use: s3 = LazyClient('s3') instead of s3 = boto3.client('s3').
+    """
+
+    def __init__(self, service_name: str, region_name: Optional[str] = None):
+
+        self.service_name = service_name
+        self.region_name = region_name
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(client(self.service_name, self.region_name), name)
@@ -0,0 +1,153 @@
+import json
+import threading
+from typing import Dict, Any, Iterator
+
+from runtime import LazyClient
+
+s3 = LazyClient('s3')
+
+# S3 requires every part except the last one to be at least 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+class S3MultipartWriter:
+    """
+    File-like writer that streams data to S3 while it is being produced.
+    Data is buffered up to part_size and then uploaded as one part of a multipart upload,
+    so memory stays bounded regardless of the total size of the object.
+    Small objects (less than one part) are stored with a single put_object call.
+    """
+
+    def __init__(self, bucket: str, key: str, content_type: str = 'text/plain', part_size: int = DEFAULT_PART_SIZE):
+
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.upload_id = None
+        self.parts = []
+        self.buffer = bytearray()
+        self.bytes_written = 0
+        self.closed = False
+
+    @property
+    def uri(self) -> str:
+        return f"s3://{self.bucket}/{self.key}"
+
+    def write(self, data) -> int:
+
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        self.buffer.extend(data)
+        self.bytes_written += len(data)
+
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+        return len(data)
+
+    def _upload_part(self):
+
+        if self.upload_id is None:
+            response = s3.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type
+            )
+            self.upload_id = response['UploadId']
+            print(f"Started multipart upload for {self.uri}")
+
+        part_number = len(self.parts) + 1
+        response = s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer)
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self.buffer.clear()
+
+    def close(self) -> str:
+        """
+        Upload the remaining data and finish the upload. Returns the S3 URI of the object.
+        """
+        if self.closed:
+            return self.uri
+
+        self.closed = True
+
+        if self.upload_id is None:
+            s3.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self.buffer),
+                ContentType=self.content_type
+            )
+        else:
+            if self.buffer:
+                self._upload_part()
+            s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+            print(f"Completed multipart upload for {self.uri} ({len(self.parts)} parts)")
+
+        self.buffer = bytearray()
+        return self.uri
+
+    def abort(self):
+
+        self.closed = True
+        self.buffer = bytearray()
+
+        if self.upload_id is not None:
+            try:
+                s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                print(f"Failed to abort multipart upload for {self.uri}: {e}")
+
+
+class SharedWriter:
+    """
+    Writer for several threads at the same time, f.e. the shards that write to the plan of a run.
+    Every write is done as a whole, so the lines of different threads are not mixed.
+    """
+
+    def __init__(self, writer: S3MultipartWriter):
+
+        self.writer = writer
+        self.lock = threading.Lock()
+
+    def write(self, data) -> int:
+
+        with self.lock:
+            return self.writer.write(data)
+
+
+def read_json(s3_uri: str) -> Dict[str, Any]:
+
+    bucket = s3_uri.split('/')[2]
+    key = '/'.join(s3_uri.split('/')[3:])
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+
+
+def read_plan_records(index: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the resource records of all plans that are referred to by a summary index.
+    """
+    for plan_s3_uri in index.get('PlanS3Uris', []):
+        if not plan_s3_uri.startswith('s3://') or plan_s3_uri.endswith('(upload failed)'):
+            print(f"Skipping plan {plan_s3_uri}")
+            continue
+
+        bucket = plan_s3_uri.split('/')[2]
+        key = '/'.join(plan_s3_uri.split('/')[3:])
+        response = s3.get_object(Bucket=bucket, Key=key)
+        for line in response['Body'].iter_lines():
+            if line:
+                yield json.loads(line)
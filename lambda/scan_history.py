@@ -0,0 +1,93 @@
+import fnmatch
+from datetime import datetime
+from typing import Dict, Any, List
+
+from nuke_state import load_state, save_state
+
+
+def scan_history_name(account_id: str) -> str:
+    return f"scan-history-{account_id}.json"
+
+
+def select_resource_types(all_resource_types: List[str], resource_types_config: Dict[str, Any]) -> List[str]:
+    """
+    Return the resource types that aws-nuke scans with the resource-types part of a config.
+    Excludes can contain wildcards, f.e. OpsWorks*.
+    """
+    includes = resource_types_config.get('includes') or all_resource_types
+    excludes = resource_types_config.get('excludes') or []
+
+    return [
+        resource_type for resource_type in includes
+        if not any(fnmatch.fnmatchcase(resource_type, exclude) for exclude in excludes)
+    ]
+
+
+def update_scan_history(bucket: str, summaries: List[Dict[str, Any]]):
+    """
+    Record per account, region and resource type when resources were found for the last time and how many
+    runs in a row the resource type was empty. Only resource types that were scanned completely
+    (Scanned in the summary index) are updated.
+    """
+    account_summaries = {}
+    for summary in summaries:
+        if summary.get('AccountId'):
+            account_summaries.setdefault(summary['AccountId'], []).append(summary)
+
+    for account_id, summaries in account_summaries.items():
+        update_account_scan_history(bucket, account_id, summaries)
+
+
+def update_account_scan_history(bucket: str, account_id: str, summaries: List[Dict[str, Any]]):
+
+    history = load_state(bucket, scan_history_name(account_id), {'Runs': 0, 'Regions': {}})
+    history['Runs'] += 1
+    run = history['Runs']
+    now = datetime.utcnow().isoformat()
+
+    for summary in summaries:
+        for scanned in summary.get('Scanned', []):
+            for region in scanned['Regions']:
+                region_history = history['Regions'].setdefault(region, {})
+                found_types = summary.get('Regions', {}).get(region, {})
+                scan_seconds = summary.get('ScanSeconds', {}).get(region, {})
+
+                for resource_type in scanned['ResourceTypes']:
+                    type_history = region_history.setdefault(resource_type, {'EmptyRuns': 0})
+
+                    if resource_type in found_types:
+                        type_history['EmptyRuns'] = 0
+                        type_history['LastFoundRun'] = run
+                        type_history['LastFoundAt'] = now
+                        type_history['ListingSeconds'] = scan_seconds.get(resource_type, 0)
+                    else:
+                        type_history['EmptyRuns'] += 1
+
+    save_state(bucket, scan_history_name(account_id), history)
+
+
+def load_prunable_resource_types(bucket: str, account_id: str, regions: List[str], prune_after_empty_runs: int, full_sweep_every: int) -> Dict[str, List[str]]:
+    """
+    Return per region of the account the resource types that were empty for at least prune_after_empty_runs runs in a row.
+    Every full_sweep_every runs nothing is pruned, so resource types that are used again are found.
+    """
+    if prune_after_empty_runs <= 0:
+        return {}
+
+    history = load_state(bucket, scan_history_name(account_id), {'Runs': 0, 'Regions': {}})
+    next_run = history['Runs'] + 1
+
+    if full_sweep_every > 0 and next_run % full_sweep_every == 0:
+        print(f"Run {next_run} of {account_id} is a full sweep, no resource types are pruned")
+        return {}
+
+    prunable = {}
+    for region in regions:
+        region_history = history['Regions'].get(region, {})
+        prunable[region] = sorted(
+            resource_type for resource_type, type_history in region_history.items()
+            if type_history['EmptyRuns'] >= prune_after_empty_runs
+        )
+
+    print(f"Pruned resource types per region: { {region: len(types) for region, types in prunable.items()} }")
+    return prunable
@@ -1,16 +1,116 @@
 import json
-import boto3
 import os
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, List
 from urllib.parse import urlparse
 
-def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+from metrics import Metrics
+from notification_digest import (
+    MAX_MESSAGE_BYTES, build_digest, digest_sections, format_sections, fit_message, fit_subject, merge_digests,
+    queue_result, pending_results, delete_results
+)
+from run_ledger import recent_runs
+from runtime import LazyClient
+from s3_stream import read_json
+
+sns = LazyClient('sns')
+s3 = LazyClient('s3')
+
+# Number of previous runs in the notification
+RECENT_RUNS_IN_NOTIFICATION = 5
+
+# With a window, execution results are collected and sent as one digest by the scheduled flush
+DIGEST_WINDOW_MINUTES = int(os.environ.get('DIGEST_WINDOW_MINUTES', '0'))
+
+SEVEN_DAYS_IN_SECONDS = 7 * 24 * 60 * 60
+
+
+def presign(s3_uri: str) -> str:
+
+    if not s3_uri or not s3_uri.startswith('s3://'):
+        return 'N/A'
+
+    try:
+        parsed = urlparse(s3_uri)
+        return s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': parsed.netloc, 'Key': parsed.path.lstrip('/')},
+            ExpiresIn=SEVEN_DAYS_IN_SECONDS
+        )
+    except Exception as e:
+        return f'Error generating URL: {str(e)}'
+
+
+def format_reconciliation(reconciliation: Dict[str, Any]) -> str:
+
+    if not reconciliation:
+        return ''
+
+    if 'Error' in reconciliation:
+        return f"Reconciliation with the approved dry-run failed: {reconciliation['Error']}\n"
+
+    return f"""Reconciliation with the approved dry-run:
+- Removed as planned: {reconciliation.get('removed-as-planned', 0)}
+- Removed but not planned: {reconciliation.get('removed-not-planned', 0)}
+- Planned but not removed: {reconciliation.get('planned-not-removed', 0)}
+- Failed: {reconciliation.get('failed', 0)}
+- Details: {reconciliation.get('ReconciliationS3Uri', 'N/A')}
+"""
+
+
+def format_accounts(accounts: List[Dict[str, Any]]) -> str:
+
+    # Only runs in more than one account (organization mode) get a summary per account
+    if not accounts or len(accounts) < 2:
+        return ''
+
+    lines = [f"Accounts ({len(accounts)}):"]
+    for account in accounts:
+        status = 'OK' if account.get('Success') else 'FAILED'
+        line = f"- {account.get('AccountId')}: {account.get('ResourcesToDelete', 0)} resources, {status}"
+        if account.get('Errors'):
+            line += f" ({'; '.join(account['Errors'])})"
+        lines.append(line)
+
+    return '\n'.join(lines) + '\n'
+
+
+def format_recent_runs(runs: List[Dict[str, Any]]) -> str:
+
+    if not runs:
+        return ''
+
+    lines = ["Recent runs:"]
+    for run in runs:
+        status = 'OK' if run.get('Success') else 'FAILED'
+        lines.append(
+            f"- {run.get('FinishedAt')}: {run.get('Mode')}, {run.get('ResourcesToDelete', 0)} resources, "
+            f"{run.get('DurationSeconds', 0)} seconds, {status}"
+        )
+
+    return '\n'.join(lines) + '\n'
+
+
+def format_preflight(preflight: Dict[str, Any]) -> str:
+
+    lines = [
+        f"{preflight.get('OverlapCount', 0)} of the {preflight.get('Checked', 0)} resources in the plan have the protected tag "
+        f"{preflight.get('TagKey')}={preflight.get('TagValue')}:"
+    ]
+    for overlap in preflight.get('Overlaps', []):
+        account = f"{overlap['account']} - " if overlap.get('account') else ''
+        lines.append(f"- {account}{overlap.get('region')} - {overlap.get('type')} - {overlap.get('id')}")
+
+    if preflight.get('OverlapCount', 0) > len(preflight.get('Overlaps', [])):
+        lines.append(f"- ... all of them are in {preflight.get('PreflightS3Uri')}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def send_notification(event: Dict[str, Any], metrics: Metrics) -> Dict[str, Any]:
     """
-    Send notifications for both dry-run approval and final execution results.
+    Send the notification for a dry-run approval or for the final execution results.
     """
-    sns = boto3.client('sns')
-    s3 = boto3.client('s3')
-
     topic_arn = os.environ.get('NOTIFICATION_TOPIC_ARN', os.environ.get('APPROVAL_TOPIC_ARN', ''))
     execution_id = event.get('ExecutionId', 'Unknown')
     execution_arn = event.get('ExecutionArn', '')
@@ -32,7 +132,6 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 account = arn_parts[4]
                 execution_arn = f"arn:aws:states:{region}:{account}:execution:aws-nuke-nuke-workflow:{execution_id}"
     
-    print(f"Environment variables: {dict(os.environ)}")
     print(f"Topic ARN: {topic_arn}")
     print(f"Execution ID: {execution_id}")
     print(f"Execution ARN: {execution_arn}")
@@ -56,23 +155,87 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     success = event.get('Success', execution_result.get('Success', False))
     output_s3_uri = event.get('OutputS3Uri', execution_result.get('OutputS3Uri', 'N/A'))
     error_message = execution_result.get('Error', '')
+    index_s3_uri = event.get('IndexS3Uri') or ''
+    bucket = event.get('awsNukeBucket')
+    reconciliation = event.get('Reconciliation') or {}
+    accounts = event.get('Accounts') or []
+
+    # The digest only needs the summary index, the reviewer doesn't have to download the output first
+    digest = None
+    if index_s3_uri.startswith('s3://'):
+        with metrics.phase('ReadIndex'):
+            try:
+                digest = build_digest(read_json(index_s3_uri), 'would-remove' if dry_run_mode else 'removed')
+            except Exception as e:
+                print(f"Could not read the index {index_s3_uri}: {e}")
+    sections = digest_sections(digest) if digest else []
+    digest_text = format_sections(sections, MAX_MESSAGE_BYTES)
+
+    # Successful executions wait for the digest, dry-runs (approval), blocked and failed runs are sent right away
+    if DIGEST_WINDOW_MINUTES > 0 and bucket and success and not dry_run_mode and event.get('ExecutionType') != 'PREFLIGHT_BLOCKED':
+        with metrics.phase('QueueDigest'):
+            key = queue_result(bucket, {
+                'ExecutionId': execution_id,
+                'ExecutionArn': execution_arn,
+                'FinishedAt': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'ResourcesToDelete': resources_deleted,
+                'OutputS3Uri': output_s3_uri,
+                'IndexS3Uri': index_s3_uri,
+                'Reconciliation': reconciliation,
+                'Accounts': [account.get('AccountId') for account in accounts],
+                'Digest': digest,
+            })
+        print(f"Queued for the next digest: s3://{bucket}/{key}")
+        return {'Success': True, 'Queued': True, 'DigestS3Uri': f"s3://{bucket}/{key}"}
+
+    # The run ledger has the history in one object
+    history = ''
+    if bucket:
+        with metrics.phase('ReadLedger'):
+            try:
+                history = format_recent_runs(recent_runs(bucket, RECENT_RUNS_IN_NOTIFICATION))
+            except Exception as e:
+                print(f"Could not read the run ledger: {e}")
+
+    # The approval only nukes the regions and resource types that are in this dry-run
+    approve_command = f"./scripts/approve-execution.sh {index_s3_uri}".strip()
     
     # Generate presigned URL for results
-    if output_s3_uri and output_s3_uri.startswith('s3://'):
-        try:
-            seven_days_in_seconds = 7 * 24 * 60 * 60
-            parsed = urlparse(output_s3_uri)
-            bucket = parsed.netloc
-            key = parsed.path.lstrip('/')
-            presigned_url = s3.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': bucket, 'Key': key},
-                ExpiresIn=seven_days_in_seconds
-            )
-        except Exception as e:
-            presigned_url = f'Error generating URL: {str(e)}'
+    with metrics.phase('PresignOutput'):
+        presigned_url = presign(output_s3_uri)
+        report_url = presign(event.get('ReportS3Uri') or '')
+
+    if event.get('ExecutionType') == 'PREFLIGHT_BLOCKED' and (event.get('Preflight') or {}).get('Reason'):
+        preflight = event['Preflight']
+        subject = '⛔ AWS Nuke BLOCKED - no plan to check'
+        message = f"""⛔ AWS Nuke BLOCKED by the preflight check
+
+Execution ID: {execution_id}
+Execution ARN: {execution_arn}
+Type: {'DRY-RUN' if dry_run_mode else 'EXECUTION (nothing was deleted)'}
+
+{preflight['Reason']}, so the resources with the protected tag {preflight.get('TagKey')}={preflight.get('TagValue')} can't be checked.
+Approve a dry-run with ./scripts/approve-execution.sh, or set PREFLIGHT="false" in ./setenv.sh to run executions without a dry-run (f.e. scheduled executions).
+"""
+
+    elif event.get('ExecutionType') == 'PREFLIGHT_BLOCKED':
+        preflight = event.get('Preflight') or {}
+        subject = f'⛔ AWS Nuke BLOCKED - {preflight.get("OverlapCount", 0)} protected resources in the plan'
+        message = f"""⛔ AWS Nuke BLOCKED by the preflight check
+
+Execution ID: {execution_id}
+Execution ARN: {execution_arn}
+Type: {'DRY-RUN' if dry_run_mode else 'EXECUTION (nothing was deleted)'}
+
+{format_preflight(preflight)}
+Plan: {preflight.get('IndexS3Uri', 'N/A')}
+
+These resources would be deleted although they have the protected tag, so the workflow was stopped.
+Check the filters in lambda/nuke_policy.yaml before you run AWS Nuke again. Do NOT approve this dry-run.
+"""
 
-    if dry_run_mode:
+    elif dry_run_mode:
+        report_section = f"\nReview Report (one page per region and resource type, with filters):\n{report_url}\n" if report_url != 'N/A' else ''
         subject = f'🔍 AWS Nuke DRY-RUN Results - {resources_deleted} resources found - APPROVAL REQUIRED'        
         message = f"""🔍 AWS Nuke DRY-RUN Results - APPROVAL REQUIRED
 
@@ -82,9 +245,9 @@ Type: DRY-RUN (No resources were actually deleted)
 
 Summary:
 - Resources that WOULD BE DELETED: {resources_deleted}
-
-⚠️  CRITICAL: Please review the dry-run results carefully before approving!
-
+{format_accounts(accounts)}
+{digest_text}⚠️  CRITICAL: Please review the dry-run results carefully before approving!
+{report_section}
 Dry-Run Results:
 {presigned_url if presigned_url != 'N/A' else 'No output file available'}
 
@@ -103,25 +266,31 @@ S3 Location: {output_s3_uri}
 TO APPROVE (proceed with actual deletion):
 # Review the dry-run results above thoroughly, then run:
 
-./scripts/approve-execution.sh
+{approve_command}
 
 - The approval script will start a NEW execution that performs actual deletion
+{'- Only the regions and resource types in which this dry-run found resources will be scanned again' if index_s3_uri else ''}
 - You'll receive another email when the actual execution completes
 
 TO REJECT (do nothing):
 # Simply don't run the approval script - no resources will be deleted
-"""
+
+{history}"""
         
+        subject = fit_subject(subject)
+        message = fit_message(message, sections, digest_text)
         try:
             print(f"Sending notification to topic: {topic_arn}")
             print(f"Subject: {subject}")
             print(f"Message length: {len(message)}")
             
-            response = sns.publish(
-                TopicArn=topic_arn,
-                Subject=subject,
-                Message=message
-            )
+            with metrics.phase('Publish'):
+                response = sns.publish(
+                    TopicArn=topic_arn,
+                    Subject=subject,
+                    Message=message
+                )
+            metrics.add('MessageBytes', len(message.encode('utf-8')), 'Bytes')
             
             print(f"SNS publish successful. MessageId: {response['MessageId']}")
             return {
@@ -146,7 +315,8 @@ Execution ARN: {execution_arn}
 
 Summary:
 - Resources Processed: {resources_deleted}
-
+{format_accounts(accounts)}{format_reconciliation(reconciliation)}
+{digest_text}
 Final Execution Results (Full Output):
 {presigned_url if presigned_url != 'N/A' else 'No output file available'}
 
@@ -159,18 +329,22 @@ The AWS Nuke execution has completed. Please review the results above.
 🔗 Monitor future executions:
 To run AWS Nuke again, use: ./scripts/start-manual-workflow.sh
 
-"""
+{history}"""
     
+    subject = fit_subject(subject)
+    message = fit_message(message, sections, digest_text)
     try:
         print(f"Sending notification to topic: {topic_arn}")
         print(f"Subject: {subject}")
         print(f"Message length: {len(message)}")
         
-        response = sns.publish(
-            TopicArn=topic_arn,
-            Subject=subject,
-            Message=message
-        )
+        with metrics.phase('Publish'):
+            response = sns.publish(
+                TopicArn=topic_arn,
+                Subject=subject,
+                Message=message
+            )
+        metrics.add('MessageBytes', len(message.encode('utf-8')), 'Bytes')
         
         print(f"SNS publish successful. MessageId: {response['MessageId']}")
         
@@ -186,3 +360,91 @@ To run AWS Nuke again, use: ./scripts/start-manual-workflow.sh
             'Error': f'Failed to send notification: {str(e)}',
             'PresignedUrl': presigned_url
         }
+
+
+def flush_digest(bucket: str, metrics: Metrics) -> Dict[str, Any]:
+    """
+    Send the execution results that were collected since the last digest as one message, and remove them.
+    Results that arrive during the flush stay for the next digest.
+    """
+    topic_arn = os.environ.get('NOTIFICATION_TOPIC_ARN', '')
+
+    with metrics.phase('ReadPending'):
+        pending = pending_results(bucket)
+
+    if not pending:
+        print("No execution results for the digest")
+        return {'Success': True, 'Executions': 0}
+
+    entries = [entry for _, entry in pending]
+    digest = merge_digests([entry['Digest'] for entry in entries if entry.get('Digest')])
+    total = sum(entry.get('ResourcesToDelete') or 0 for entry in entries)
+
+    executions = []
+    outputs = []
+    for entry in entries:
+        line = f"- {entry['FinishedAt']}: {entry['ExecutionId']}, {entry.get('ResourcesToDelete') or 0} resources processed"
+        if len(entry.get('Accounts') or []) > 1:
+            line += f" in {len(entry['Accounts'])} accounts"
+        reconciliation = entry.get('Reconciliation') or {}
+        if reconciliation.get('Error'):
+            line += ', reconciliation failed'
+        elif reconciliation:
+            line += f", {reconciliation.get('planned-not-removed', 0)} planned but not removed, {reconciliation.get('failed', 0)} failed"
+        executions.append(line)
+        outputs.append(f"- {entry['ExecutionId']}: {presign(entry.get('OutputS3Uri'))}")
+
+    # The links are the longest lines, they are left out first when the message is too large
+    sections = [{'Title': f"Executions ({len(entries)}):", 'Lines': executions, 'Priority': 4}]
+    if digest['Total']:
+        sections.extend(digest_sections(digest))
+    sections.append({'Title': 'Final Execution Results (links valid for 7 days):', 'Lines': outputs, 'Priority': 0})
+
+    header = f"""📬 AWS Nuke Digest
+
+{len(entries)} executions completed between {entries[0]['FinishedAt']} and {entries[-1]['FinishedAt']}.
+
+Summary:
+- Resources Processed: {total}
+
+"""
+    footer = f"""S3 Locations: s3://{bucket}/nuke-outputs/
+
+To run AWS Nuke again, use: ./scripts/start-manual-workflow.sh
+"""
+    digest_text = format_sections(sections, MAX_MESSAGE_BYTES - len((header + footer).encode('utf-8')))
+    message = fit_message(header + digest_text + footer)
+    subject = fit_subject(f'📬 AWS Nuke Digest - {len(entries)} executions, {total} resources processed')
+
+    try:
+        with metrics.phase('Publish'):
+            response = sns.publish(TopicArn=topic_arn, Subject=subject, Message=message)
+        metrics.add('MessageBytes', len(message.encode('utf-8')), 'Bytes')
+        metrics.add('DigestExecutions', len(entries))
+    except Exception as e:
+        print(f"ERROR sending the digest, the results stay for the next one: {str(e)}")
+        return {'Success': False, 'Error': f'Failed to send digest: {str(e)}', 'Executions': len(entries)}
+
+    with metrics.phase('DeletePending'):
+        delete_results(bucket, [key for key, _ in pending])
+
+    print(f"Digest of {len(entries)} executions sent. MessageId: {response['MessageId']}")
+    return {'MessageId': response['MessageId'], 'Success': True, 'Executions': len(entries)}
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Send notifications for both dry-run approval and final execution results.
+    The scheduled digest rule invokes it with FlushDigest to send the collected execution results.
+    """
+    metrics = Metrics('send-notification')
+
+    if event.get('FlushDigest'):
+        response = flush_digest(event['awsNukeBucket'], metrics)
+    else:
+        response = send_notification(event, metrics)
+
+    metrics.emit()
+    response['Metrics'] = metrics.to_dict()
+
+    return response
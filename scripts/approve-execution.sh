@@ -3,8 +3,14 @@
 
 # Simple approval script for AWS Nuke
 # This starts a new execution that performs actual resource deletion
+# Usage: ./approve-execution.sh [dry-run index S3 URI]
+#
+# With the S3 URI of the index of the approved dry-run (it is in the dry-run email), only the
+# regions and resource types in which the dry-run found resources are nuked
 set -e
 
+DRY_RUN_INDEX_S3_URI="${1:-}"
+
 . ./setenv.sh
 
 # Get Step Function ARN
@@ -20,6 +26,9 @@ if [ -z "${STATE_MACHINE_ARN}" ] || [ "${STATE_MACHINE_ARN}" = "None" ]; then
 fi
 
 echo "State Machine: ${STATE_MACHINE_ARN}"
+if [ -n "${DRY_RUN_INDEX_S3_URI}" ]; then
+    echo "Targeted execution based on dry-run: ${DRY_RUN_INDEX_S3_URI}"
+fi
 echo ""
 
 # Start execution with actual deletion (no dry-run)
@@ -30,6 +39,7 @@ EXECUTION_ARN=$(aws stepfunctions start-execution \
         \"cdkBucketPrefix\": \"${CDK_BUCKET_PREFIX}\",
         \"AccountId\": \"${ACCOUNT_ID}\",
         \"Regions\": [$(echo ${REGIONS} | sed 's/,/","/g' | sed 's/^/"/' | sed 's/$/"/')],
+        \"DryRunIndexS3Uri\": \"${DRY_RUN_INDEX_S3_URI}\",
         \"DryRun\": false,
         \"SendNotification\": true
     }" \
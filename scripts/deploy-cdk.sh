@@ -113,6 +113,20 @@ AWS_PROFILE="${PROFILE}" cdk deploy \
  -c logGroupRetentionDays="${LOG_GROUP_RETENTION_DAYS}" \
  -c nukeVersion="${NUKE_VERSION}" \
  -c enforceVersion="${ENFORCE_VERSION}" \
+ -c shardByRegion="${SHARD_BY_REGION}" \
+ -c shardConcurrency="${SHARD_CONCURRENCY}" \
+ -c partitioning="${PARTITIONING}" \
+ -c partitionConcurrency="${PARTITION_CONCURRENCY}" \
+ -c pruneAfterEmptyRuns="${PRUNE_AFTER_EMPTY_RUNS}" \
+ -c fullSweepEvery="${FULL_SWEEP_EVERY}" \
+ -c continuation="${CONTINUATION}" \
+ -c deletionWaves="${DELETION_WAVES}" \
+ -c retryAttempts="${RETRY_ATTEMPTS}" \
+ -c retryBudgetSeconds="${RETRY_BUDGET_SECONDS}" \
+ -c preflight="${PREFLIGHT}" \
+ -c digestWindowMinutes="${DIGEST_WINDOW_MINUTES}" \
+ -c organizationalUnitId="${ORGANIZATIONAL_UNIT_ID}" \
+ -c memberRoleName="${MEMBER_ROLE_NAME}" \
   --tags "${TAG_KEY}"="${TAG_VALUE}" \
   --require-approval never
 
@@ -0,0 +1,21 @@
+#!/bin/bash
+
+# Show the last runs of AWS Nuke from the run ledger in the S3 bucket
+# Usage: ./list-runs.sh [number of runs, default 10]
+
+set -e
+
+COUNT="${1:-10}"
+
+. ./setenv.sh
+
+aws s3 cp "s3://${AWS_NUKE_BUCKET}/nuke-ledger/index.json" - --profile "${PROFILE}" | python3 -c "
+import json, sys
+runs = json.load(sys.stdin)['Runs'][:int(sys.argv[1])]
+print(f\"{'Finished':<22}{'Mode':<11}{'Resources':>10}{'Seconds':>9}  Status  Version\")
+for run in runs:
+    status = 'OK' if run.get('Success') else 'FAILED'
+    print(f\"{run.get('FinishedAt') or '':<22}{run.get('Mode') or '':<11}{run.get('ResourcesToDelete', 0):>10}{run.get('DurationSeconds', 0):>9}  {status:<6}  {run.get('NukeVersion') or ''}\")
+    if run.get('Error'):
+        print(f\"  {run['Error']}\")
+" "${COUNT}"
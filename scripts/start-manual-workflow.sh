@@ -43,6 +43,7 @@ EXECUTION_ARN=$(aws stepfunctions start-execution \
         \"cdkBucketPrefix\": \"${CDK_BUCKET_PREFIX}\",
         \"AccountId\": \"${ACCOUNT_ID}\",
         \"Regions\": [$(echo ${REGIONS} | sed 's/,/","/g' | sed 's/^/"/' | sed 's/$/"/')],
+        \"DryRunIndexS3Uri\": \"\",
         \"DryRun\": true,
         \"SendNotification\": true
     }" \
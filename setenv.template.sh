@@ -15,6 +15,24 @@ NUKE_VERSION="v3.62.2"
 ENFORCE_VERSION="false" # true means: always use the ${NUKE_VERSION},
                         # false means: always try to use the latest version - fallback to ${NUKE_VERSION} if the new version cannot be determined
 
+SHARD_BY_REGION="false" # true means: run one aws-nuke process per region, in parallel
+SHARD_CONCURRENCY="4"   # maximum number of aws-nuke processes that run at the same time when SHARD_BY_REGION is true
+
+PARTITIONING="none"       # none, region or region-and-type: split the work in partitions that are nuked by parallel Lambda functions
+PARTITION_CONCURRENCY="4" # maximum number of partitions that run at the same time
+
+PRUNE_AFTER_EMPTY_RUNS="0" # skip resource types that were empty in this many runs in a row, 0 means: never skip
+FULL_SWEEP_EVERY="10"      # scan all resource types every this many runs, also when they would be skipped
+CONTINUATION="false"       # true: continue a run that doesn't finish in one executor invocation in the next invocation
+DELETION_WAVES="false"     # true: remove resource types in waves, children (f.e. subnets) before parents (f.e. VPCs)
+RETRY_ATTEMPTS="3"         # retry only the resources that failed or were still waiting this many times, with exponential backoff, 0 means: never retry
+RETRY_BUDGET_SECONDS="300" # stop retrying when the retries would take longer than this
+PREFLIGHT="true"           # true: stop the workflow when the plan contains resources with the TAG_KEY=TAG_VALUE tag
+DIGEST_WINDOW_MINUTES="0"  # send the results of the executions in this many minutes as one email, 0 means: one email per execution
+
+ORGANIZATIONAL_UNIT_ID=""                          # organization mode: nuke all accounts in this OU (f.e. ou-ab12-34cdefgh), empty: only ACCOUNT_ID
+MEMBER_ROLE_NAME="OrganizationAccountAccessRole"   # role in the member accounts that the executor assumes in organization mode
+
 PROJECT_NAME="aws-nuke"
 
 ACCOUNT_ID=$(aws sts get-caller-identity --query Account --output text --profile "${PROFILE}")
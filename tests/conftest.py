@@ -0,0 +1,96 @@
+"""
+The tests import the Lambda modules from the lambda directory, like the functions do, and use an in-memory
+AWS (moto). The aws-nuke emulator of the benchmarks stands in for the aws-nuke binary.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+LAMBDA_DIR = os.path.join(ROOT_DIR, 'lambda')
+FAKE_NUKE = os.path.join(ROOT_DIR, 'benchmarks', 'fake_aws_nuke.py')
+
+sys.path.insert(0, LAMBDA_DIR)
+
+# Never use real credentials, also not when a test forgets the aws fixture
+os.environ.update({
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_SESSION_TOKEN': 'testing',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+})
+
+BUCKET = 'aws-nuke-test-bucket'
+ACCOUNT_ID = '123456789012'
+
+
+@pytest.fixture
+def aws():
+    """
+    In-memory AWS. The cached clients and sessions of runtime.py are dropped, so every test gets clients of its own mock.
+    """
+    from moto import mock_aws
+    import runtime
+
+    runtime.clients.clear()
+    runtime.sessions.clear()
+    with mock_aws():
+        yield
+    runtime.clients.clear()
+    runtime.sessions.clear()
+
+
+@pytest.fixture
+def bucket(aws):
+
+    import boto3
+
+    boto3.client('s3').create_bucket(Bucket=BUCKET)
+    return BUCKET
+
+
+@pytest.fixture
+def s3(bucket):
+
+    import boto3
+
+    return boto3.client('s3')
+
+
+def read_object(s3, s3_uri: str) -> bytes:
+
+    bucket, _, key = s3_uri[len('s3://'):].partition('/')
+    return s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+
+# The config of the aws-nuke emulator: every region has RESOURCES resources, a fifth of them is filtered
+REGIONS = ['us-east-1', 'eu-west-1', 'eu-central-1']
+RESOURCES = 50
+NUKEABLE = 40
+
+
+@pytest.fixture
+def nuke_emulator(s3, tmp_path, monkeypatch):
+    """
+    The aws-nuke emulator as installed binary, a work dir of the test and a config of REGIONS in the bucket.
+    Returns the S3 URI of the config.
+    """
+    import nuke_binary
+    import nuke_executor
+
+    monkeypatch.setattr(nuke_binary, 'INSTALLED_BINARY', FAKE_NUKE)
+    monkeypatch.setattr(nuke_binary, 'WORK_DIR', str(tmp_path))
+    monkeypatch.setattr(nuke_executor, 'WORK_DIR', str(tmp_path))
+    monkeypatch.setattr(nuke_executor, 'RETRY_BASE_DELAY_SECONDS', 0)
+    monkeypatch.setenv('FAKE_NUKE_RESOURCES', str(RESOURCES))
+
+    s3.put_object(Bucket=BUCKET, Key='nuke-configs/test.yaml', Body=json.dumps({'regions': REGIONS, 'accounts': {ACCOUNT_ID: {}}}))
+    return f"s3://{BUCKET}/nuke-configs/test.yaml"
+
+
+def executor_event(config_s3_uri: str, **options) -> dict:
+
+    return dict({'ConfigS3Uri': config_s3_uri, 'AccountId': ACCOUNT_ID, 'DryRun': True, 'RetryAttempts': 0}, **options)
@@ -0,0 +1,97 @@
+import json
+
+import metrics
+from metrics import Metrics
+
+
+def metric_definitions(document: dict) -> list:
+
+    directives = document['_aws']['CloudWatchMetrics']
+    assert len(directives) == 1
+    return directives[0]
+
+
+def test_phases_and_counters_document():
+
+    collected = Metrics('nuke-executor')
+    with collected.phase('RunNuke'):
+        pass
+    with collected.phase('RunNuke'):
+        pass
+    collected.add('OutputLines', 10)
+    collected.add('OutputLines', 5)
+    collected.add('OutputBytes', 2048, 'Bytes')
+
+    [document] = collected.emf_documents()
+
+    assert isinstance(document['_aws']['Timestamp'], int)
+    definition = metric_definitions(document)
+    assert definition['Namespace'] == 'AwsNuke'
+    assert definition['Dimensions'] == [['Function']]
+    assert definition['Metrics'] == [
+        {'Name': 'RunNukeSeconds', 'Unit': 'Seconds'},
+        {'Name': 'OutputLines', 'Unit': 'Count'},
+        {'Name': 'OutputBytes', 'Unit': 'Bytes'},
+    ]
+    # The dimension and every metric are values of the document
+    assert document['Function'] == 'nuke-executor'
+    assert document['OutputLines'] == 15
+    assert document['OutputBytes'] == 2048
+    assert document['RunNukeSeconds'] >= 0
+
+
+def test_documents_have_at_most_100_metrics():
+
+    collected = Metrics('merge-results')
+    for number in range(250):
+        collected.add(f"Counter{number}", number)
+
+    documents = collected.emf_documents()
+
+    assert [len(metric_definitions(document)['Metrics']) for document in documents] == [100, 100, 50]
+    for document in documents:
+        assert all(definition['Name'] in document for definition in metric_definitions(document)['Metrics'])
+
+
+def test_scan_seconds_of_the_slowest_resource_types_only():
+
+    collected = Metrics('nuke-executor')
+    collected.add('OutputLines', 1)
+    collected.add_scan_seconds({
+        'us-east-1': {f"Type{number:02d}": number for number in range(30)},
+        # The slowest region counts
+        'eu-west-1': {'Type00': 100},
+    })
+
+    documents = collected.emf_documents()
+
+    type_documents = [document for document in documents if 'ResourceType' in document]
+    assert len(type_documents) == metrics.MAX_RESOURCE_TYPE_METRICS
+    assert [document['ResourceType'] for document in type_documents][:3] == ['Type00', 'Type29', 'Type28']
+    for document in type_documents:
+        definition = metric_definitions(document)
+        assert definition['Dimensions'] == [['Function', 'ResourceType']]
+        assert definition['Metrics'] == [{'Name': 'ScanSeconds', 'Unit': 'Seconds'}]
+        assert document['Function'] == 'nuke-executor'
+
+    # All resource types are in the log, as a property without a metric
+    all_types = documents[0]['ScanSecondsByResourceType']
+    assert len(all_types) == 30
+    assert all_types['Type00'] == 100
+    assert 'ScanSecondsByResourceType' not in [definition['Name'] for definition in metric_definitions(documents[0])['Metrics']]
+
+    assert list(collected.to_dict()['SlowestResourceTypes'])[:2] == ['Type00', 'Type29']
+
+
+def test_emit_prints_one_document_per_line(capsys):
+
+    collected = Metrics('preflight')
+    collected.add('Overlaps', 0)
+    collected.add_scan_seconds({'us-east-1': {'S3Bucket': 1.5}})
+
+    collected.emit()
+
+    documents = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [document.get('ResourceType') for document in documents] == [None, 'S3Bucket']
+    assert documents[0]['Overlaps'] == 0
+    assert documents[1]['ScanSeconds'] == 1.5
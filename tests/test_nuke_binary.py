@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import nuke_binary
+from nuke_binary import VERSION_MANIFEST, determine_version, parse_version
+from nuke_state import load_state, save_state
+
+
+class GitHubStandIn(BaseHTTPRequestHandler):
+    """
+    The latest release endpoint of the GitHub API, with ETag and If-None-Match like GitHub.
+    """
+    server_version = 'GitHubStandIn'
+
+    def do_GET(self):
+
+        server = self.server
+        server.requests.append({'Path': self.path, 'IfNoneMatch': self.headers.get('If-None-Match')})
+
+        if server.status != 200:
+            self.send_response(server.status)
+            self.end_headers()
+            return
+
+        etag = f'"{server.latest}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        body = json.dumps({'tag_name': server.latest}).encode()
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def github(monkeypatch):
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GitHubStandIn)
+    server.requests = []
+    server.status = 200
+    server.latest = 'v3.60.0'
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(nuke_binary, 'GITHUB_API_URL', f"http://127.0.0.1:{server.server_port}")
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def expire_manifest(bucket: str):
+
+    manifest = load_state(bucket, VERSION_MANIFEST, {})
+    save_state(bucket, VERSION_MANIFEST, dict(manifest, CheckedAt=time.time() - nuke_binary.VERSION_CACHE_TTL_SECONDS - 1))
+
+
+def test_latest_version_is_fetched_and_cached(bucket, github):
+
+    assert determine_version('v3.50.0', False, bucket) == 'v3.60.0'
+    assert determine_version('v3.50.0', False, bucket) == 'v3.60.0'
+
+    assert len(github.requests) == 1
+    assert github.requests[0]['Path'] == '/releases/latest'
+    manifest = load_state(bucket, VERSION_MANIFEST, {})
+    assert manifest['LatestVersion'] == 'v3.60.0'
+    assert manifest['ETag'] == '"v3.60.0"'
+
+
+def test_newer_fallback_version_is_kept(bucket, github):
+
+    assert determine_version('v3.61.0', False, bucket) == 'v3.61.0'
+
+
+def test_not_modified_after_ttl(bucket, github):
+
+    determine_version('v3.50.0', False, bucket)
+    expire_manifest(bucket)
+
+    assert determine_version('v3.50.0', False, bucket) == 'v3.60.0'
+
+    assert [request['IfNoneMatch'] for request in github.requests] == [None, '"v3.60.0"']
+    assert time.time() - load_state(bucket, VERSION_MANIFEST, {})['CheckedAt'] < 60
+
+
+def test_new_release_after_ttl(bucket, github):
+
+    determine_version('v3.50.0', False, bucket)
+    github.latest = 'v3.62.1'
+
+    # Within the TTL the cached release is used
+    assert determine_version('v3.50.0', False, bucket) == 'v3.60.0'
+
+    expire_manifest(bucket)
+    assert determine_version('v3.50.0', False, bucket) == 'v3.62.1'
+    assert len(github.requests) == 2
+
+
+def test_failed_check_is_cached(bucket, github):
+
+    github.status = 403
+
+    assert determine_version('v3.50.0', False, bucket) == 'v3.50.0'
+    assert determine_version('v3.50.0', False, bucket) == 'v3.50.0'
+
+    # The rate limited check is not repeated by every invocation
+    assert len(github.requests) == 1
+
+
+def test_failed_check_keeps_last_known_release(bucket, github):
+
+    determine_version('v3.50.0', False, bucket)
+    expire_manifest(bucket)
+    github.status = 500
+
+    assert determine_version('v3.50.0', False, bucket) == 'v3.60.0'
+    assert determine_version('v3.50.0', False, bucket) == 'v3.60.0'
+    assert len(github.requests) == 2
+
+
+def test_enforced_version_skips_github(bucket, github):
+
+    assert determine_version('v3.40.0', True, bucket) == 'v3.40.0'
+    assert github.requests == []
+
+
+def test_missing_version_uses_latest(bucket, github):
+
+    assert determine_version(None, False, bucket) == 'v3.60.0'
+
+
+def test_missing_version_without_latest_release_raises(bucket, github):
+
+    github.status = 503
+
+    with pytest.raises(Exception, match='NukeVersion is not set'):
+        determine_version(None, False, bucket)
+
+    with pytest.raises(Exception, match='NukeVersion is required'):
+        determine_version(None, True, bucket)
+
+
+def test_parse_version_orders_prereleases():
+
+    tags = ['v3.63.0', 'v3.63.0-rc.1', 'v3.62.10', 'v3.63.0-beta.2', 'v3.63.0-beta.10', 'v3.62.2', 'v3.63.0-alpha', 'v3.63.1']
+
+    assert sorted(tags, key=parse_version) == [
+        'v3.62.2', 'v3.62.10', 'v3.63.0-alpha', 'v3.63.0-beta.2', 'v3.63.0-beta.10', 'v3.63.0-rc.1', 'v3.63.0', 'v3.63.1'
+    ]
+    assert parse_version('3.63.0') == parse_version('v3.63.0')
+    assert parse_version('v3.63.0+build.5') == parse_version('v3.63.0')
@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+import pytest
+import yaml
+
+import nuke_executor
+from conftest import ACCOUNT_ID, NUKEABLE, REGIONS, RESOURCES, executor_event, read_object
+from s3_stream import read_json
+
+
+def plan_records(s3, index: dict) -> list:
+
+    return [json.loads(line) for plan_s3_uri in index['PlanS3Uris'] for line in read_object(s3, plan_s3_uri).splitlines()]
+
+
+def test_shard_outputs_are_merged(s3, nuke_emulator):
+
+    response = nuke_executor.run_partition(executor_event(nuke_emulator, ShardByRegion=True, ShardConcurrency=3), 600)
+
+    assert response['Success'] is True
+    assert response['ResourcesToDelete'] == len(REGIONS) * NUKEABLE
+    assert sorted(shard['Shard'] for shard in response['Shards']) == sorted(REGIONS)
+
+    index = read_json(response['IndexS3Uri'])
+    assert sorted(index['Regions']) == sorted(REGIONS)
+    assert index['States'] == {'would-remove': len(REGIONS) * NUKEABLE, 'filtered': len(REGIONS) * (RESOURCES - NUKEABLE)}
+
+    # Every resource of every shard is in the plan once, the lines of the shards are not mixed
+    records = plan_records(s3, index)
+    assert len({(record['region'], record['id']) for record in records}) == len(records) == len(REGIONS) * RESOURCES
+    assert {record['account'] for record in records} == {ACCOUNT_ID}
+
+    filtered_lines = read_object(s3, response['OutputS3Uri']).decode().splitlines()
+    assert len(filtered_lines) == len(REGIONS) * NUKEABLE
+    assert all(line.endswith(' - would remove') for line in filtered_lines)
+
+
+def test_sharded_run_has_the_counts_of_a_single_process(nuke_emulator):
+
+    sharded = nuke_executor.run_partition(executor_event(nuke_emulator, ShardByRegion=True, ShardConcurrency=2), 600)
+    single = nuke_executor.run_partition(executor_event(nuke_emulator), 600)
+
+    assert read_json(sharded['IndexS3Uri'])['ResourceTypes'] == read_json(single['IndexS3Uri'])['ResourceTypes']
+    assert 'Shards' not in single
+
+
+def test_timed_out_run_keeps_the_partial_output(nuke_emulator, monkeypatch):
+
+    monkeypatch.setattr(nuke_executor, 'MIN_SHARD_SECONDS', 1)
+    monkeypatch.setattr(nuke_executor, 'STOP_GRACE_SECONDS', 1)
+    monkeypatch.setenv('FAKE_NUKE_REGION_SECONDS', '60')
+
+    start_time = time.monotonic()
+    response = nuke_executor.run_partition(executor_event(nuke_emulator), 3)
+
+    assert time.monotonic() - start_time < 30
+    assert response['Success'] is False
+    assert response['Error'] == 'AWS Nuke execution timed out'
+    # The first region was printed before aws-nuke was stopped
+    assert response['ResourcesToDelete'] == NUKEABLE
+
+
+def test_shard_without_time_left_is_skipped(nuke_emulator, monkeypatch):
+
+    monkeypatch.setattr(nuke_executor, 'MIN_SHARD_SECONDS', 600)
+
+    response = nuke_executor.run_partition(executor_event(nuke_emulator, ShardByRegion=True), 60)
+
+    assert response['Success'] is False
+    assert all(shard['Skipped'] for shard in response['Shards'])
+    assert response['ResourcesToDelete'] == 0
+
+
+def test_failed_resources_are_retried(nuke_emulator, monkeypatch, tmp_path):
+
+    monkeypatch.setenv('FAKE_NUKE_FAILED_RATIO', '0.1')
+    event = executor_event(nuke_emulator, DryRun=False, ShardByRegion=True, ShardConcurrency=3, RetryAttempts=1)
+
+    response = nuke_executor.run_partition(event, 600)
+
+    shards = {shard['Shard']: shard for shard in response['Shards']}
+    assert sorted(shards) == sorted(REGIONS + [f"retry1-{region}" for region in REGIONS])
+    assert all(shards[region]['Retried'] for region in REGIONS)
+    assert all(shards[f"retry1-{region}"]['Retry'] == 1 for region in REGIONS)
+    assert response['Metrics']['Counters']['RetryShards'] == len(REGIONS)
+
+    # The retry only scans the region and the resource types of the resources that failed
+    with open(os.path.join(tmp_path, 'nuke-config-retry1-eu-west-1.yaml')) as f:
+        retry_config = yaml.safe_load(f)
+    assert retry_config['regions'] == ['eu-west-1']
+    assert 0 < len(retry_config['resource-types']['includes']) <= NUKEABLE // 10
+
+    # The emulator fails the same part of the removals again, so the retries fail as well
+    assert response['Success'] is False
+    assert 'retry1-' in response['Error']
+
+
+@pytest.mark.parametrize('retry_attempts', [0, 2])
+def test_execution_without_failures_is_not_retried(nuke_emulator, retry_attempts):
+
+    event = executor_event(nuke_emulator, DryRun=False, ShardByRegion=True, RetryAttempts=retry_attempts)
+
+    response = nuke_executor.run_partition(event, 600)
+
+    assert response['Success'] is True
+    assert response['ResourcesToDelete'] == len(REGIONS) * NUKEABLE
+    assert not any('Retry' in shard for shard in response['Shards'])
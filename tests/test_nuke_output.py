@@ -0,0 +1,42 @@
+from nuke_output import parse_line
+
+
+def test_parse_line_with_properties():
+
+    record = parse_line('eu-west-1 - EC2Instance - i-0123 - [Name: "web", tag:Cleanup: "no"] - would remove\n')
+
+    assert record == {
+        'region': 'eu-west-1', 'type': 'EC2Instance', 'id': 'i-0123', 'state': 'would-remove',
+        'properties': {'Name': 'web', 'tag:Cleanup': 'no'},
+    }
+
+
+def test_parse_line_id_with_separator():
+
+    record = parse_line('eu-west-1 - S3Object - s3://b/logs - failed jobs - 2024.txt - [Key: "logs - failed jobs"] - would remove')
+
+    assert record['id'] == 's3://b/logs - failed jobs - 2024.txt'
+    assert record['state'] == 'would-remove'
+    assert record['properties'] == {'Key': 'logs - failed jobs'}
+
+    record = parse_line('eu-west-1 - S3Object - s3://b/a - removed - x - waiting')
+
+    assert record['id'] == 's3://b/a - removed - x'
+    assert record['state'] == 'waiting'
+
+
+def test_parse_line_details():
+
+    assert parse_line('eu-west-1 - IAMRole - my role - filtered: Protected by tag')['details'] == 'Protected by tag'
+
+    record = parse_line('eu-west-1 - S3Bucket - s3://b - [Name: "b"] - failed: api error - bucket not empty')
+
+    assert record['id'] == 's3://b'
+    assert record['state'] == 'failed'
+    assert record['details'] == 'api error - bucket not empty'
+
+
+def test_parse_line_ignores_other_lines():
+
+    assert parse_line('Scan complete: 12 total, 3 nukeable, 9 filtered.') is None
+    assert parse_line('eu-west-1 - EC2Instance - i-0123 - removing soon') is None
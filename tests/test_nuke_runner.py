@@ -0,0 +1,58 @@
+import json
+
+import nuke_executor
+import nuke_runner
+from conftest import FAKE_NUKE, NUKEABLE, REGIONS, executor_event
+from s3_stream import read_json
+
+
+def test_runner_continues_until_there_is_no_token(monkeypatch):
+
+    events = []
+
+    def run_partition(event, budget):
+        events.append(dict(event))
+        token = {1: 'run-1', 2: 'run-1'}.get(len(events))
+        return {'Success': True, 'ContinuationToken': token, 'DurationSeconds': 1.0}
+
+    monkeypatch.setattr(nuke_executor, 'run_partition', run_partition)
+
+    response = nuke_runner.run({'ConfigS3Uri': 's3://bucket/config.yaml'}, 60)
+
+    assert response['ContinuationToken'] is None
+    assert [event.get('ContinuationToken') for event in events] == [None, 'run-1', 'run-1']
+
+
+def test_partition_is_finished_over_several_invocations(nuke_emulator, monkeypatch):
+
+    # Every region takes a second, so an invocation of 3.5 seconds can't scan all regions. A shard that starts
+    # has at least 2 seconds, so it is never stopped halfway and the regions that don't fit are skipped.
+    monkeypatch.setattr(nuke_executor, 'MIN_SHARD_SECONDS', 2)
+    monkeypatch.setenv('FAKE_NUKE_REGION_SECONDS', '1')
+    event = executor_event(nuke_emulator, Continuation=True, ShardConcurrency=1)
+
+    response = nuke_runner.run(event, 3.5)
+
+    assert response['Success'] is True
+    assert response['ContinuationToken'] is None
+    assert response['Invocations'] >= 2
+    assert response['ResourcesToDelete'] == len(REGIONS) * NUKEABLE
+    assert read_json(response['IndexS3Uri'])['States']['would-remove'] == len(REGIONS) * NUKEABLE
+
+
+def test_main_runs_the_event_with_parallel_workers(nuke_emulator, tmp_path):
+
+    event_path = tmp_path / 'event.json'
+    event_path.write_text(json.dumps(executor_event(nuke_emulator)))
+    output_path = tmp_path / 'response.json'
+
+    returncode = nuke_runner.main([
+        str(event_path), '--workers', '3', '--work-dir', str(tmp_path / 'work'), '--nuke-binary', FAKE_NUKE,
+        '--output', str(output_path)
+    ])
+
+    response = json.loads(output_path.read_text())
+    assert returncode == 0
+    assert response['ResourcesToDelete'] == len(REGIONS) * NUKEABLE
+    assert sorted(shard['Shard'] for shard in response['Shards']) == sorted(REGIONS)
+    assert nuke_executor.WORK_DIR == str(tmp_path / 'work')
@@ -0,0 +1,133 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+import generate_config
+import nuke_executor
+import runtime
+from conftest import ACCOUNT_ID, BUCKET
+from organization import AccountAccessError, assume_role_environment, list_ou_accounts
+
+
+@pytest.fixture
+def organization(bucket):
+    """
+    An organization with an OU, a nested OU and an account outside the OU. The account of the nuke stack
+    is moved into the OU as well. Returns the OU id and the ids of the member accounts in it.
+    """
+    organizations = boto3.client('organizations')
+    organizations.create_organization(FeatureSet='ALL')
+    root_id = organizations.list_roots()['Roots'][0]['Id']
+    unit_id = organizations.create_organizational_unit(ParentId=root_id, Name='sandbox')['OrganizationalUnit']['Id']
+    nested_id = organizations.create_organizational_unit(ParentId=unit_id, Name='team')['OrganizationalUnit']['Id']
+
+    def create_account(name: str, parent_id: str) -> str:
+        account_id = organizations.create_account(AccountName=name, Email=f"{name}@example.com")['CreateAccountStatus']['AccountId']
+        organizations.move_account(AccountId=account_id, SourceParentId=root_id, DestinationParentId=parent_id)
+        return account_id
+
+    members = sorted([create_account('sandbox-1', unit_id), create_account('sandbox-2', unit_id), create_account('team-1', nested_id)])
+    create_account('production', root_id)
+    organizations.move_account(AccountId=ACCOUNT_ID, SourceParentId=root_id, DestinationParentId=unit_id)
+
+    return unit_id, members
+
+
+def organization_event(unit_id: str, **fields) -> dict:
+
+    return dict({
+        'AccountId': ACCOUNT_ID,
+        'awsNukeBucket': BUCKET,
+        'Regions': ['us-east-1', 'eu-west-1'],
+        'ProjectName': 'aws-nuke',
+        'cdkBucketPrefix': 'cdk-hnb659fds',
+        'TagKey': 'Cleanup',
+        'TagValue': 'no',
+        'OrganizationalUnitId': unit_id,
+    }, **fields)
+
+
+def test_list_ou_accounts_includes_nested_units(organization):
+
+    unit_id, members = organization
+
+    assert list_ou_accounts(unit_id) == sorted(members + [ACCOUNT_ID])
+
+
+def test_organization_mode_skips_own_and_blocklisted_accounts(organization):
+
+    unit_id, members = organization
+
+    response = generate_config.lambda_handler(organization_event(unit_id, BlocklistAccounts=[members[0]]), None)
+
+    assert [account['AccountId'] for account in response['Accounts']] == members[1:]
+    assert ACCOUNT_ID not in {partition['AccountId'] for partition in response['Partitions']}
+    # Every account has its own config, there is no single config
+    assert response['ConfigS3Uri'] is None
+    assert len({account['ConfigS3Uri'] for account in response['Accounts']}) == len(members) - 1
+
+
+def test_organization_partitions_carry_role_arn(organization):
+
+    unit_id, members = organization
+
+    response = generate_config.lambda_handler(
+        organization_event(unit_id, Partitioning='region', MemberRoleName='NukeRole'), None
+    )
+
+    assert len(response['Partitions']) == len(members) * 2
+    for partition in response['Partitions']:
+        assert partition['RoleArn'] == f"arn:aws:iam::{partition['AccountId']}:role/NukeRole"
+        assert partition['PartitionId'].startswith(f"{partition['AccountId']}-")
+
+
+def test_single_account_partitions_have_no_role_arn(bucket):
+
+    event = organization_event(None, Partitioning='region')
+    del event['OrganizationalUnitId']
+
+    response = generate_config.lambda_handler(event, None)
+
+    assert [partition['RoleArn'] for partition in response['Partitions']] == [None, None]
+    assert [account['AccountId'] for account in response['Accounts']] == [ACCOUNT_ID]
+
+
+def test_assume_role_environment(aws):
+
+    env = assume_role_environment('arn:aws:iam::210987654321:role/OrganizationAccountAccessRole', 'aws-nuke-test')
+
+    assert set(env) == {'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'}
+
+
+@pytest.fixture
+def denied_sts(aws):
+    """
+    STS that denies every assume_role, like a member account without the role.
+    """
+    sts = boto3.client('sts')
+    stubber = Stubber(sts)
+    for _ in range(2):
+        stubber.add_client_error('assume_role', service_error_code='AccessDenied', http_status_code=403)
+    stubber.activate()
+    runtime.clients[('sts', None, None)] = sts
+    yield stubber
+    stubber.deactivate()
+
+
+def test_assume_role_failure_raises_account_access_error(denied_sts):
+
+    with pytest.raises(AccountAccessError, match='AccessDenied'):
+        assume_role_environment('arn:aws:iam::210987654321:role/OrganizationAccountAccessRole', 'aws-nuke-test')
+
+
+def test_executor_raises_account_access_error(denied_sts, bucket):
+
+    # The state machine retries the executor on AccountAccessError, so it must not be turned into a failed result
+    with pytest.raises(AccountAccessError):
+        nuke_executor.lambda_handler({
+            'ConfigS3Uri': f"s3://{bucket}/nuke-configs/config.yaml",
+            'AccountId': '210987654321',
+            'PartitionId': '210987654321',
+            'RoleArn': 'arn:aws:iam::210987654321:role/OrganizationAccountAccessRole',
+            'DryRun': True,
+        }, None)
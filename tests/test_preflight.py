@@ -0,0 +1,64 @@
+import json
+
+from conftest import ACCOUNT_ID, BUCKET
+from metrics import Metrics
+from preflight import preflight
+
+
+def preflight_event(bucket: str, index_s3_uri: str) -> dict:
+    return {
+        'IndexS3Uri': index_s3_uri,
+        'awsNukeBucket': bucket,
+        'AccountId': ACCOUNT_ID,
+        'Regions': ['us-east-1'],
+        'TagKey': 'Protected',
+        'TagValue': 'true',
+    }
+
+
+def write_plan(s3, bucket: str, records: list) -> str:
+
+    s3.put_object(Bucket=bucket, Key='nuke-outputs/plan.jsonl', Body=''.join(json.dumps(record) + '\n' for record in records))
+    s3.put_object(Bucket=bucket, Key='nuke-outputs/index.json', Body=json.dumps({
+        'AccountId': ACCOUNT_ID, 'PlanS3Uris': [f"s3://{bucket}/nuke-outputs/plan.jsonl"]
+    }))
+    return f"s3://{bucket}/nuke-outputs/index.json"
+
+
+def test_execution_without_plan_is_blocked(bucket):
+
+    response = preflight(preflight_event(bucket, ''), Metrics('preflight'))
+
+    assert response['Blocked'] is True
+    assert 'no plan' in response['Reason']
+    assert response['Checked'] == 0
+
+
+def test_plan_with_protected_resource_is_blocked(s3):
+
+    s3.create_bucket(Bucket='protected-data')
+    s3.put_bucket_tagging(Bucket='protected-data', Tagging={'TagSet': [{'Key': 'Protected', 'Value': 'true'}]})
+    index_s3_uri = write_plan(s3, BUCKET, [
+        {'region': 'global', 'type': 'S3Bucket', 'id': 'protected-data', 'state': 'would-remove', 'properties': {}},
+        {'region': 'global', 'type': 'S3Bucket', 'id': 'scratch-data', 'state': 'would-remove', 'properties': {}},
+        {'region': 'us-east-1', 'type': 'EC2Instance', 'id': 'i-0123', 'state': 'filtered', 'properties': {}},
+    ])
+
+    response = preflight(preflight_event(BUCKET, index_s3_uri), Metrics('preflight'))
+
+    assert response['Blocked'] is True
+    assert response['Checked'] == 2
+    assert [overlap['id'] for overlap in response['Overlaps']] == ['protected-data']
+
+
+def test_plan_without_protected_resources_passes(s3):
+
+    index_s3_uri = write_plan(s3, BUCKET, [
+        {'region': 'us-east-1', 'type': 'EC2Instance', 'id': 'i-0123', 'state': 'would-remove', 'properties': {'tag:Protected': 'false'}},
+    ])
+
+    response = preflight(preflight_event(BUCKET, index_s3_uri), Metrics('preflight'))
+
+    assert response['Blocked'] is False
+    assert response['Checked'] == 1
+    assert s3.list_objects_v2(Bucket=BUCKET, Prefix='nuke-outputs/nuke-preflight')['KeyCount'] == 0
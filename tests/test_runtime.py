@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import runtime
+
+
+def credentials(number: int) -> dict:
+    return {'AccessKeyId': f"ASIA{number:016d}", 'SecretAccessKey': 'secret', 'SessionToken': 'token'}
+
+
+def test_clients_with_credentials_are_reused_across_threads(aws):
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        created = list(executor.map(lambda _: runtime.client('sts', 'eu-west-1', credentials(1)), range(32)))
+
+    assert all(created_client is created[0] for created_client in created)
+    assert len(runtime.sessions) == 1
+    assert created[0]._request_signer._credentials.access_key == credentials(1)['AccessKeyId']
+
+    assert runtime.client('sts', 'eu-west-1', credentials(2)) is not created[0]
+    assert runtime.client('sts', 'eu-west-1') is not created[0]
+
+
+def test_clients_of_old_credentials_are_dropped(aws, monkeypatch):
+
+    monkeypatch.setattr(runtime, 'MAX_CREDENTIAL_SESSIONS', 3)
+    first = runtime.client('sts', 'eu-west-1', credentials(0))
+    for number in range(1, runtime.MAX_CREDENTIAL_SESSIONS + 1):
+        runtime.client('sts', 'eu-west-1', credentials(number))
+
+    assert len(runtime.sessions) == runtime.MAX_CREDENTIAL_SESSIONS
+    assert ('sts', 'eu-west-1', credentials(0)['AccessKeyId']) not in runtime.clients
+    assert runtime.client('sts', 'eu-west-1', credentials(0)) is not first